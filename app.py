@@ -1,103 +1,315 @@
-from pandas import read_csv
+import logging
+import os
 
-from dash import dcc, Input, Output, html, Dash
-import plotly.graph_objects as go
+from flask import Flask, Response, g, request
+
+from time import perf_counter, process_time, time
+from typing import List, Optional
+
+from dash import dcc, ClientsideFunction, Input, Output, State, html, Dash
+from dash.exceptions import PreventUpdate
 from dash_bootstrap_components.themes import BOOTSTRAP
 from dash_bootstrap_components import Row, Col
-from ttracker.plotting_tools import plot_map
+from ttracker.agency import AgencyConfig, bundle_sources, load_agency_configs, optional_path
+from ttracker.feed_client import FeedClient
+from ttracker.metrics import REGISTRY, stage_timer
+from ttracker.plotting_tools import FrozenFigure, build_geographic_map, describe_figure, freeze_figure, thaw_figure
+from ttracker.poller import Poller
+from ttracker.recording import FeedRecorder, RecordingFeedClient, ReplayFeedClient
+from ttracker.runtime_bundle import RuntimeBundle
+from ttracker.scheduler import RefreshScheduler
+from ttracker.shared_snapshot import ProducerElection, SharedSnapshot, SharedTrains, default_snapshot_path
+from ttracker.streaming import SnapshotStream
 from ttracker.system import System
-# Initialize the Dash app
-app = Dash(__name__, external_stylesheets=[BOOTSTRAP], update_title=None)
-server = app.server
-app.title = "T Tracker"
-# prepare data
-mbta_system = System("./static/data/clean/stations.csv",
-                     "./static/data/clean/links.csv",
-                     "./static/data/clean/stop_codes_to_station_id_crosswalk.csv",
-                     "https://cdn.mbta.com/realtime/VehiclePositions.pb")
-
-
-# Create figure object
-base_figure = go.Figure(layout={'dragmode': False})
-plot_map("mbta", base_figure, mbta_system.links_data, mbta_system.station_data, read_csv("./static/data/clean/charles_river.csv"))
-
-# Layout of the app
-app.css.config.serve_locally = True
-app.layout = html.Div(children=[
-    html.Center([html.H1("ttracker.io", style={
-        "position": "fixed",
-        "top": 0,
-        "left": 0,
-        "right": 0,
-        'justify-content': 'center',
-        'align-items': 'center',
-
-        "background-color": "white",
-        'display': 'inline-block'
-    })]
-                     ),
-    html.Div(children=[Row([
-        Col([dcc.Graph(id='train-map',
-                           figure=base_figure,
-                           style={
-                               'border': '2px solid black',
-                               'padding': '10px',
-                               'max-width': '100vw',  # Ensure the graph doesn't overflow the viewport
-                               'max-height': '100vh',  # Ensure the graph doesn't overflow the viewport
-                               'width': '100%',  # Graph takes 100% of the available width
-                               'height': '100%'  # Graph takes 100% of the available height
-                           },
-                           config={'modeBarButtonsToRemove': ['zoom2d', 'pan2d', 'select2d', 'lasso2d', 'zoomIn2d',
-                                                              'zoomOut2d', 'autoScale2d', 'resetScale2d'],
-                                   'displayModeBar': False,  # Disable mode bar
-                                   'scrollZoom': False,  # Disable zooming with mouse scroll
-                                   'showTips': False,  # Disable tips
-                                   'displaylogo': False  # Disable plotly logo
-
-                                   }),
-                 ]),
-        dcc.Interval(id='interval-component', interval=1500, n_intervals=0)  # Update every second
-    ])], style={
-        'display': 'flex',  # Enable flexbox
-        'justify-content': 'center',  # Center horizontally
-        'align-items': 'center',  # Center vertically
-        'height': 'calc(100vh - 50px)',  # Subtract the height of the title (estimate 120px)
-    })
-
-])
-
-
-# Callback to update train positions
-@app.callback(
-    Output('train-map', 'figure'),
-    Input('interval-component', 'n_intervals')
-)
-def update_train_positions(n_intervals):
-    new_x, new_y, color, hover_text = mbta_system.update_trains()
-
-    # Create a new figure based on the base map
-    updated_figure = base_figure
-    updated_figure['data'] = updated_figure['data'][:-1]
-
-
-    # Add train positions to the map
-    updated_figure.add_trace(
-        go.Scatter(
-            x=new_x,
-            y=new_y,
-            mode='markers',
-            marker=dict(color=color, size=5, line=dict(
-                        color='black',  # Outline color
-                        width=1  # Outline width
-                    )),
-            name='Trains',
-            text=hover_text,
-            hoverinfo='text',
-            showlegend=False
+from ttracker.wire import TrainEncoder
+logger = logging.getLogger(__name__)
+
+
+class StaticLayoutDash(Dash):
+    # the layout never changes, so serialize it on the first page load and serve those bytes from then on
+    _layout_json = None
+
+    def serve_layout(self):
+        if self._layout_json is None:
+            self._layout_json = super().serve_layout().get_data()
+        return Response(self._layout_json, mimetype="application/json")
+
+
+# every agency configured in agencies/ is served by this one process, unless TTRACKER_AGENCIES lists the ones to serve;
+# the first is served at /, the others at /<name>/
+AGENCIES = load_agency_configs(names=os.environ["TTRACKER_AGENCIES"].split(",")
+                               if os.environ.get("TTRACKER_AGENCIES") else None)
+# which vehicles are tracked, by the name of a route set of each agency: e.g. TTRACKER_ROUTE_SET=all adds the MBTA's
+# buses, commuter rail and ferries on a geographic map. Each agency follows its default route set otherwise
+ROUTE_SET = os.environ.get("TTRACKER_ROUTE_SET")
+# the refreshes of every agency share these threads, each agency at its own interval
+REFRESH_THREADS = int(os.environ.get("TTRACKER_REFRESH_THREADS", 4))
+# pages subscribe to the train stream; only while it is down do they ask the server for new train data, every 10
+# seconds. In between updates, the browser moves the trains itself
+TRAIN_DATA_INTERVAL = 10000
+ANIMATION_INTERVAL = 500
+
+server = Flask(__name__)
+scheduler = RefreshScheduler(REFRESH_THREADS)
+
+
+def feed_client_for(agency: AgencyConfig):
+    # recordings of several agencies are kept in a directory per agency
+    def directory(path: str) -> str:
+        return path if len(AGENCIES) == 1 else os.path.join(path, agency.name)
+
+    if os.environ.get("TTRACKER_REPLAY"):
+        # replay a recording instead of fetching from the agency
+        return ReplayFeedClient(directory(os.environ["TTRACKER_REPLAY"]),
+                                speed=float(os.environ.get("TTRACKER_REPLAY_SPEED", 1)) or None)
+    if os.environ.get("TTRACKER_RECORD"):
+        return RecordingFeedClient(FeedClient(), FeedRecorder(directory(os.environ["TTRACKER_RECORD"])))
+    return FeedClient()
+
+
+class AgencyApp:
+    """The page of one agency: its System, the pollers and streams that serve it, and its Dash app.
+
+    Every agency gets its own Dash app under ``url_base_pathname``, all of them on the one Flask server, so the
+    component ids, the callbacks and the browser code are the same for every agency.
+    """
+    config: AgencyConfig
+    system: System
+    bundle: Optional[RuntimeBundle]
+    base_map: FrozenFigure
+    vehicle_map: Optional[FrozenFigure]
+    train_encoder: TrainEncoder
+    train_poller: Poller
+    train_stream: SnapshotStream
+    dash: StaticLayoutDash
+
+    def __init__(self, config: AgencyConfig, url_base_pathname: str):
+        self.config = config
+        self._load(feed_client_for(config))
+        # the train trace is drawn last, on top of the static map; only this trace is ever updated
+        train_trace_index = len(self.base_map.payload['data']) - 1
+        logger.info("%(agency)s base map: %(traces)d traces, %(shapes)d shapes, %(bytes)d bytes.",
+                    dict(describe_figure(self.base_map), agency=config.name))
+        # only the train trace's data is sent, as codes into the legend; the static map and the legend stay in the
+        # browser from the initial page load. The stations are drawn just below the trains; their hover text lists
+        # the next arrivals
+        self.train_encoder = TrainEncoder(self.system.marker_legend(), train_trace_index, train_trace_index - 1)
+        self.train_poller = scheduler.add(self._build_poller())
+        # every snapshot is pushed to the open pages as it is published, as the JSON it was rendered to
+        self.train_stream = SnapshotStream(self.train_poller, lambda snapshot: snapshot.rendered.json_with_age(time()),
+                                           event="trains")
+        self.dash = StaticLayoutDash(__name__, server=server, url_base_pathname=url_base_pathname,
+                                     external_stylesheets=[BOOTSTRAP], update_title=None)
+        self.dash.title = config.title
+        server.add_url_rule(f"{url_base_pathname}trains/stream", f"{config.name}_stream_trains", self.stream_trains)
+        self._register_metrics()
+        self._build_layout()
+        self._register_callbacks()
+
+    def _load(self, feed_client):
+        # the lookup tables and the base map are loaded from the agency's runtime bundle, built by
+        # `python -m ttracker.scripts.build_runtime_bundle`, unless it is missing, out of date, or TTRACKER_BUNDLE=0
+        config = self.config
+        bundle_path = optional_path(config.runtime_bundle)
+        use_bundle = os.environ.get("TTRACKER_BUNDLE") != "0" and bundle_path is not None
+        self.bundle = RuntimeBundle(bundle_path) if use_bundle else None
+        if self.bundle is not None and self.bundle.is_current(bundle_sources(config)):
+            self.system = System.from_bundle(self.bundle, config, client=feed_client, route_set=ROUTE_SET)
+            self.base_map = thaw_figure(bytes(self.bundle['base_map_json']).decode())
+        else:
+            logger.warning("No current runtime bundle for %s, building the map from the CSV files.", config.name)
+            # only needed to build what the bundle would hold
+            from ttracker.scripts.build_runtime_bundle import build_agency_base_map
+
+            self.system = System(config, client=feed_client, route_set=ROUTE_SET)
+            self.base_map = freeze_figure(build_agency_base_map(config, self.system))
+        # the vehicles off the schematic, if any are tracked, are drawn by longitude and latitude on a map of their own
+        self.vehicle_map = (freeze_figure(build_geographic_map(self.system.station_positions_map))
+                            if self.system.has_geographic_layer else None)
+
+    def _build_poller(self) -> Poller:
+        # fetch the feeds once per interval in the background, no matter how many clients are connected, and encode
+        # each snapshot once as it is published; requests only read the latest snapshot, which is never changed after
+        system = self.system
+        if os.environ.get("TTRACKER_SHARED_SNAPSHOT") == "1":
+            if system.has_geographic_layer:
+                raise ValueError("TTRACKER_SHARED_SNAPSHOT=1 only shares the schematic; "
+                                 "choose a route set without a geographic layer with it.")
+            # one gunicorn worker per host polls the feeds and shares the train positions and arrivals with the others
+            shared_trains = SharedTrains(system,
+                                         SharedSnapshot(default_snapshot_path(f"ttracker-{self.config.name}-trains"),
+                                                        n_stations=system.n_stations),
+                                         ProducerElection(default_snapshot_path(
+                                             f"ttracker-{self.config.name}-trains.lock")))
+            return Poller(shared_trains,
+                          interval=self.config.refresh_interval,
+                          is_stale=lambda: shared_trains.stale,
+                          update_interval=lambda: system.feed_update_interval,
+                          render=self.train_encoder.encode)
+        return Poller(system.update_trains,
+                      interval=self.config.refresh_interval,
+                      is_stale=lambda: system.stale,
+                      update_interval=lambda: system.feed_update_interval,
+                      render=self.train_encoder.encode)
+
+    def stream_trains(self):
+        return Response(self.train_stream.subscribe(), mimetype="text/event-stream",
+                        # proxies must pass events on as they come instead of buffering the response
+                        headers={'Cache-Control': "no-cache", 'X-Accel-Buffering': "no"})
+
+    def _snapshot_metric(self, function):
+        def read():
+            snapshot = self.train_poller.latest(timeout=0)
+            return None if snapshot is None else function(snapshot)
+        return read
+
+    def _register_metrics(self):
+        # per-stage timings and counters are recorded by the ttracker modules; these are read when /metrics is scraped
+        agency = self.config.name
+        REGISTRY.gauge("ttracker_trains", "Trains in the latest snapshot.",
+                       self._snapshot_metric(lambda snapshot: len(snapshot.data.x)), agency=agency)
+        REGISTRY.gauge("ttracker_snapshot_age_seconds", "Seconds since the latest snapshot was published.",
+                       self._snapshot_metric(lambda snapshot: time() - snapshot.created_at), agency=agency)
+        REGISTRY.gauge("ttracker_stale", "1 while the feed cannot be fetched and the last good positions are served.",
+                       self._snapshot_metric(lambda snapshot: int(snapshot.stale)), agency=agency)
+        REGISTRY.gauge("ttracker_feed_update_interval_seconds", "Observed seconds between vehicle positions updates.",
+                       lambda: self.system.feed_update_interval, agency=agency)
+        REGISTRY.gauge("ttracker_stream_subscribers", "Open train position streams.",
+                       lambda: self.train_stream.subscribers, agency=agency)
+
+    def _build_layout(self):
+        dash = self.dash
+        dash.css.config.serve_locally = True
+        dash.layout = html.Div(children=[
+            html.Center([html.H1("ttracker.io", style={
+                "position": "fixed",
+                "top": 0,
+                "left": 0,
+                "right": 0,
+                'justify-content': 'center',
+                'align-items': 'center',
+
+                "background-color": "white",
+                'display': 'inline-block'
+            })]
+                             ),
+            html.Div(children=[Row([
+                Col([dcc.Graph(id='train-map',
+                                   figure=self.base_map.payload,
+                                   style={
+                                       'border': '2px solid black',
+                                       'padding': '10px',
+                                       'max-width': '100vw',  # Ensure the graph doesn't overflow the viewport
+                                       'max-height': '100vh',  # Ensure the graph doesn't overflow the viewport
+                                       'width': '100%',  # Graph takes 100% of the available width
+                                       'height': '100%'  # Graph takes 100% of the available height
+                                   },
+                                   config={'modeBarButtonsToRemove': ['zoom2d', 'pan2d', 'select2d', 'lasso2d',
+                                                                      'zoomIn2d', 'zoomOut2d', 'autoScale2d',
+                                                                      'resetScale2d'],
+                                           'displayModeBar': False,  # Disable mode bar
+                                           'scrollZoom': False,  # Disable zooming with mouse scroll
+                                           'showTips': False,  # Disable tips
+                                           'displaylogo': False  # Disable plotly logo
+
+                                           }),
+                         ]),
+            ] + ([Col([dcc.Graph(id='vehicle-map',
+                                 figure=self.vehicle_map.payload,
+                                 style={'border': '2px solid black', 'padding': '10px', 'width': '100%',
+                                        'height': '100%'},
+                                 config={'displayModeBar': False, 'scrollZoom': True, 'displaylogo': False})])]
+                 if self.vehicle_map is not None else []) + [
+                dcc.Interval(id='interval-component', interval=TRAIN_DATA_INTERVAL, n_intervals=0, disabled=True),
+                dcc.Interval(id='animation-interval', interval=ANIMATION_INTERVAL, n_intervals=0),
+                dcc.Store(id='train-data'),
+                dcc.Store(id='train-legend', data=self.train_encoder.legend),
+                dcc.Store(id='train-stream', data=dash.get_relative_path('/trains/stream'))
+            ])], style={
+                'display': 'flex',  # Enable flexbox
+                'justify-content': 'center',  # Center horizontally
+                'align-items': 'center',  # Center vertically
+                'height': 'calc(100vh - 50px)',  # Subtract the height of the title (estimate 120px)
+            })
+
+        ])
+
+    def update_train_positions(self, n_intervals):
+        snapshot = self.train_poller.latest(timeout=10)
+        if snapshot is None:
+            raise PreventUpdate
+        # a fresh dict around the shared, read-only payload: Dash may add to what a callback returns
+        return snapshot.rendered.with_age(time())
+
+    def _register_callbacks(self):
+        dash = self.dash
+        # Callback to update train positions
+        dash.callback(
+            Output('train-data', 'data'),
+            Input('interval-component', 'n_intervals')
+        )(self.update_train_positions)
+
+        # Subscribe to the train stream, falling back to polling while it is down
+        dash.clientside_callback(
+            ClientsideFunction(namespace='ttracker', function_name='subscribeTrains'),
+            Output('interval-component', 'disabled'),
+            Input('train-stream', 'data')
+        )
+
+        # Move the trains between server updates
+        dash.clientside_callback(
+            ClientsideFunction(namespace='ttracker', function_name='animateTrains'),
+            Output('train-map', 'figure'),
+            Input('animation-interval', 'n_intervals'),
+            Input('train-data', 'data'),
+            State('train-legend', 'data'),
+            State('train-map', 'figure')
         )
-    )
 
-    return updated_figure
+        # Place the vehicles off the schematic as each update arrives
+        if self.vehicle_map is not None:
+            dash.clientside_callback(
+                ClientsideFunction(namespace='ttracker', function_name='drawVehicles'),
+                Output('vehicle-map', 'figure'),
+                Input('train-data', 'data'),
+                State('train-legend', 'data'),
+                State('vehicle-map', 'figure')
+            )
+
+
+agencies: List[AgencyApp] = [AgencyApp(config, "/" if i == 0 else f"/{config.name}/")
+                             for i, config in enumerate(AGENCIES)]
+# the agency served at /
+default_agency = agencies[0]
+app = default_agency.dash
+scheduler.start()
+
+REGISTRY.function_counter("ttracker_process_cpu_seconds", "CPU time used by this worker process.", process_time)
+# the callbacks of each agency's app, by the path they are requested on
+CALLBACK_SECONDS = {f"{agency.dash.config.routes_pathname_prefix}_dash-update-component":
+                    stage_timer("callback", agency.config.name)
+                    for agency in agencies}
+RESPONSE_BYTES = REGISTRY.histogram("ttracker_callback_response_bytes", "Size of the train data responses.",
+                                    (1024, 4096, 16384, 65536, 262144, 1048576))
+
+
+@server.before_request
+def start_callback_timer():
+    g.started_at = perf_counter()
+
+
+@server.after_request
+def observe_callback(response):
+    # the whole callback request, so that Dash's own dispatch and serialization are included
+    if request.path in CALLBACK_SECONDS and 'started_at' in g:
+        CALLBACK_SECONDS[request.path].observe(perf_counter() - g.started_at)
+        RESPONSE_BYTES.observe(response.calculate_content_length() or 0)
+    return response
+
+
+@server.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 # Run the app
@@ -0,0 +1,153 @@
+// Moves the train markers between server updates, by extrapolating each train along its link at its last known
+// velocity. A train never moves past the station it is heading to.
+const TYPED_ARRAYS = {i1: Int8Array, u1: Uint8Array, i2: Int16Array, u2: Uint16Array, i4: Int32Array,
+                      u4: Uint32Array, f4: Float32Array, f8: Float64Array};
+
+// a typed array sent by the server as {dtype, bdata}: the base64 of its little-endian values
+function decodeArray(spec) {
+    const bytes = Uint8Array.from(atob(spec.bdata), character => character.charCodeAt(0));
+    return new TYPED_ARRAYS[spec.dtype](bytes.buffer);
+}
+
+// hover text of every station: its name, then the next arrivals and how many minutes away they are
+function describeArrivals(trains, legend) {
+    const routes = decodeArray(trains.arrival_route), arrivingIn = decodeArray(trains.arrival_in);
+    const perStation = legend.arrivals_per_station;
+    return legend.station_names.map((name, station) => {
+        let text = name;
+        for (let i = station * perStation; i < (station + 1) * perStation && routes[i] !== legend.no_arrival; i++) {
+            const minutes = Math.round(Math.max(0, arrivingIn[i] - trains.age) / 60);
+            text += '<br>' + legend.route_names[routes[i]] + ': ' + (minutes < 1 ? 'arriving' : minutes + ' min');
+        }
+        return text;
+    });
+}
+
+// positions, velocities, colors and hover text of an update, looked up in the legend that came with the page
+function decodeTrains(trains, legend) {
+    const x = decodeArray(trains.x), y = decodeArray(trains.y);
+    const vx = decodeArray(trains.vx), vy = decodeArray(trains.vy);
+    const route = decodeArray(trains.route), station = decodeArray(trains.station);
+    const status = decodeArray(trains.status), target = decodeArray(trains.target);
+    const n = x.length;
+    const decoded = {n: n, x: new Float64Array(n), y: new Float64Array(n), vx: new Float64Array(n),
+                     vy: new Float64Array(n), targetX: new Float64Array(n), targetY: new Float64Array(n),
+                     color: new Array(n), text: new Array(n), stationText: describeArrivals(trains, legend)};
+    for (let i = 0; i < n; i++) {
+        decoded.x[i] = x[i] / legend.position_scale;
+        decoded.y[i] = y[i] / legend.position_scale;
+        decoded.vx[i] = vx[i] / legend.velocity_scale;
+        decoded.vy[i] = vy[i] / legend.velocity_scale;
+        decoded.targetX[i] = legend.station_x[target[i]];
+        decoded.targetY[i] = legend.station_y[target[i]];
+        decoded.color[i] = legend.route_colors[route[i]];
+        decoded.text[i] = 'Train: ' + trains.ids[i] + '<br>' + legend.status_labels[status[i]] +
+            legend.station_names[station[i]];
+    }
+    return decoded;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    ttracker: {
+        receivedAt: 0,
+        // the last update, decoded once rather than on every animation frame
+        decodedFrom: null,
+        decoded: null,
+
+        // Listens to the server's train stream, which pushes every new set of positions as it is computed. Polling
+        // is only turned on while the stream is down, and when the browser cannot subscribe at all.
+        subscribeTrains: function (url) {
+            if (!window.EventSource) {
+                return false;
+            }
+            const setProps = window.dash_clientside.set_props;
+            const source = new EventSource(url);
+            // the first update after connecting was encoded this many seconds before it was sent
+            let delay = 0;
+            source.addEventListener('trains-delay', event => { delay = parseFloat(event.data); });
+            source.addEventListener('trains', event => {
+                const trains = JSON.parse(event.data);
+                trains.age += delay;
+                delay = 0;
+                setProps('train-data', {data: trains});
+            });
+            source.onopen = () => setProps('interval-component', {disabled: true});
+            // the browser reconnects by itself
+            source.onerror = () => setProps('interval-component', {disabled: false});
+            return true;
+        },
+
+        animateTrains: function (nFrames, trains, legend, figure) {
+            if (!trains || !legend || !figure) {
+                return window.dash_clientside.no_update;
+            }
+            const triggered = window.dash_clientside.callback_context.triggered.map(trigger => trigger.prop_id);
+            if (triggered.includes('train-data.data') || !this.receivedAt) {
+                this.receivedAt = Date.now();
+            }
+            if (trains !== this.decodedFrom) {
+                this.decoded = decodeTrains(trains, legend);
+                this.decodedFrom = trains;
+            }
+            const decoded = this.decoded;
+            const elapsed = trains.age + (Date.now() - this.receivedAt) / 1000;
+
+            const n = decoded.n;
+            const x = new Array(n);
+            const y = new Array(n);
+            for (let i = 0; i < n; i++) {
+                const vx = decoded.vx[i];
+                const vy = decoded.vy[i];
+                const speedSquared = vx * vx + vy * vy;
+                let t = 0;
+                if (speedSquared > 0) {
+                    // time at which the train reaches its target
+                    const arrival = ((decoded.targetX[i] - decoded.x[i]) * vx +
+                                     (decoded.targetY[i] - decoded.y[i]) * vy) / speedSquared;
+                    t = Math.max(0, Math.min(elapsed, arrival));
+                }
+                x[i] = decoded.x[i] + vx * t;
+                y[i] = decoded.y[i] + vy * t;
+            }
+
+            const data = figure.data.slice();
+            const trace = data[trains.trace];
+            data[trains.trace] = Object.assign({}, trace, {
+                x: x,
+                y: y,
+                text: decoded.text,
+                marker: Object.assign({}, trace.marker, {color: decoded.color})
+            });
+            data[legend.station_trace] = Object.assign({}, data[legend.station_trace], {text: decoded.stationText});
+            return Object.assign({}, figure, {data: data});
+        },
+
+        // Places the buses, commuter rail and ferries of an update on the geographic map, at their reported longitude
+        // and latitude. They are not animated: off the schematic there is no link to extrapolate them along.
+        drawVehicles: function (trains, legend, figure) {
+            if (!trains || !trains.geo || !legend || !figure) {
+                return window.dash_clientside.no_update;
+            }
+            const geo = trains.geo;
+            const x = decodeArray(geo.x), y = decodeArray(geo.y);
+            const route = decodeArray(geo.route), mode = decodeArray(geo.mode);
+            const n = x.length;
+            const lon = new Array(n), lat = new Array(n), color = new Array(n), text = new Array(n);
+            for (let i = 0; i < n; i++) {
+                lon[i] = legend.geographic_origin[0] + x[i] / legend.geographic_scale;
+                lat[i] = legend.geographic_origin[1] + y[i] / legend.geographic_scale;
+                color[i] = legend.mode_colors[mode[i]];
+                text[i] = legend.modes[mode[i]] + ' ' + geo.routes[route[i]] + '<br>Vehicle: ' + geo.ids[i];
+            }
+            const data = figure.data.slice();
+            const last = data.length - 1;
+            data[last] = Object.assign({}, data[last], {
+                x: lon,
+                y: lat,
+                text: text,
+                marker: Object.assign({}, data[last].marker, {color: color})
+            });
+            return Object.assign({}, figure, {data: data});
+        }
+    }
+});
@@ -0,0 +1,34 @@
+"""Report the size of the static base map, so that regressions in trace count or payload size are visible.
+
+    python -m benchmarks.base_map
+"""
+from timeit import repeat
+
+from pandas import read_csv
+
+from benchmarks.feeds import AGENCY
+from ttracker.plotting_tools import build_base_map, describe_figure, freeze_figure
+from ttracker.system import System
+
+
+def main():
+    mbta_system = System(AGENCY)
+    background = read_csv(AGENCY.map_background)
+
+    def build():
+        # the figure the app serves, train trace included, as the runtime bundle builds it
+        return build_base_map(mbta_system.links_data, mbta_system.station_data, AGENCY.map_style, background)
+
+    base_map = freeze_figure(build())
+    build_ms = min(repeat(build, number=1, repeat=5)) * 1000
+    serialize_ms = min(repeat(lambda: freeze_figure(build()), number=1, repeat=5)) * 1000
+    report = describe_figure(base_map)
+    print(f"traces: {report['traces']}")
+    print(f"shapes: {report['shapes']}")
+    print(f"payload bytes: {report['bytes']}")
+    print(f"build ms: {build_ms:.1f}")
+    print(f"build + serialize ms: {serialize_ms:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Time the direct protobuf decoders of the feeds.
+
+    python -m benchmarks.decode [VehiclePositions.pb TripUpdates.pb]
+
+Without arguments a synthetic MBTA-sized feed is used. What the decoders produce is checked by
+tests/test_gtfs_realtime.py.
+"""
+import sys
+from timeit import repeat
+
+from google.transit import gtfs_realtime_pb2
+
+from benchmarks.feeds import AGENCY, synthesize_feeds
+from ttracker.gtfs_realtime import GTFSRealtime, TripBranchCache
+
+
+def _classify_branched_trips(gtfs, feed, trip_ids):
+    gtfs.trip_branches = TripBranchCache()
+    gtfs._classify_branched_trips(feed, trip_ids)
+    return gtfs.trip_branches
+
+
+def _decode_trip_arrivals(gtfs, feed):
+    # every trip is new, the worst case for the signatures of the trips that did not change
+    gtfs._trip_update_signatures = {}
+    return gtfs._decode_trip_arrivals(feed)
+
+
+def main(argv):
+    if len(argv) == 2:
+        with open(argv[0], 'rb') as vehicle_positions_file, open(argv[1], 'rb') as trip_updates_file:
+            vehicle_positions_bytes, trip_updates_bytes = vehicle_positions_file.read(), trip_updates_file.read()
+    else:
+        vehicle_positions_bytes, trip_updates_bytes = synthesize_feeds()
+    vehicle_positions = gtfs_realtime_pb2.FeedMessage.FromString(vehicle_positions_bytes)
+    trip_updates = gtfs_realtime_pb2.FeedMessage.FromString(trip_updates_bytes)
+    gtfs = GTFSRealtime(AGENCY)
+    trip_ids = {entity.trip_update.trip.trip_id for entity in trip_updates.entity}
+
+    cases = [("VehiclePositions", vehicle_positions, lambda: gtfs._decode_vehicle_positions(vehicle_positions)),
+             # every trip of a branched route is new, the worst case for the branch cache
+             ("TripUpdates", trip_updates, lambda: _classify_branched_trips(gtfs, trip_updates, trip_ids)),
+             ("Arrivals", trip_updates, lambda: _decode_trip_arrivals(gtfs, trip_updates))]
+    print(f"{'decoder':<18}{'entities':>10}{'ms':>10}{'us/entity':>12}")
+    for name, feed, decode in cases:
+        decode_ms = min(repeat(decode, number=5, repeat=5)) / 5 * 1000
+        print(f"{name:<18}{len(feed.entity):>10}{decode_ms:>10.2f}{decode_ms * 1000 / len(feed.entity):>12.2f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
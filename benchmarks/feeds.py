@@ -0,0 +1,139 @@
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from google.transit import gtfs_realtime_pb2
+
+from ttracker.agency import AGENCY_DIRECTORY, load_agency_config
+from ttracker.recording import FeedRecorder
+
+# the synthetic feeds are the MBTA's, on its static data
+AGENCY = load_agency_config(f"{AGENCY_DIRECTORY}/mbta.json")
+LINKS_DATA = AGENCY.links_data
+STATION_DATA = AGENCY.station_data
+CROSSWALK_DATA = AGENCY.crosswalk
+
+# static route ids of the schematic mapped to the GTFS-realtime route ids the MBTA publishes for them
+REALTIME_ROUTE_IDS = {'red-a': "Red", 'red-b': "Red", 'blue': "Blue", 'orange': "Orange", 'green-b': "Green-B",
+                      'green-c': "Green-C", 'green-d': "Green-D", 'green-e': "Green-E"}
+# terminal stop ids that are published as names rather than stop codes
+TERMINAL_STOP_IDS = {'place-ogmnl': "Oak Grove-01", 'place-brntn': "Braintree-02", 'place-alfcl': "Alewife-01",
+                     'place-forhl': "Forest Hills-02", 'place-unsqu': "Union Square-01"}
+BUS_ROUTE_IDS = [str(route) for route in [1, 7, 9, 15, 22, 23, 28, 32, 39, 57, 66, 71, 73, 77, 111, 116, 117]]
+# the vehicles off the schematic: mostly buses, with some commuter rail trains and ferries
+OTHER_ROUTE_IDS = BUS_ROUTE_IDS * 4 + ["CR-Fitchburg", "CR-Worcester", "CR-Providence", "CR-Newburyport",
+                                       "Boat-F1", "Boat-F4"]
+
+
+def synthesize_feeds(scale: float = 1.0,
+                     n_rapid_transit: int = 150,
+                     n_other: int = 450,
+                     timestamp: int = 1_700_000_000,
+                     seed: int = 0,
+                     step: int = 0) -> Tuple[bytes, bytes]:
+    """Build a (VehiclePositions, TripUpdates) pair of serialized feeds that looks like the MBTA's.
+
+    Rapid transit vehicles are placed along real links, with stop ids taken from the crosswalk, so that they
+    survive every cleaning step of the pipeline. ``scale`` multiplies the number of vehicles of both kinds. Feeds with
+    the same seed hold the same vehicles; each ``step`` moves them a little further along their links.
+    """
+    rng = np.random.default_rng(seed)
+    links = pd.read_csv(LINKS_DATA)
+    links = links.loc[links['source_station_id'] != links['target_station_id']].reset_index(drop=True)
+    # both ends of each link, from the stations
+    station_positions = pd.read_csv(STATION_DATA, index_col='station_id')[['stop_lon', 'stop_lat']]
+    sources = station_positions.loc[links['source_station_id']].to_numpy()
+    targets = station_positions.loc[links['target_station_id']].to_numpy()
+    stop_codes = (pd.read_csv(CROSSWALK_DATA, dtype={'stop_code': str})
+                  .groupby('station_id')['stop_code'].apply(list).to_dict())
+    stations_on_route = {route_id: pd.unique(route_links[['source_station_id', 'target_station_id']].values.ravel())
+                         for route_id, route_links in links.groupby('route_id')}
+
+    def stop_id_of(station_id):
+        if station_id in TERMINAL_STOP_IDS and rng.random() < 0.5:
+            return TERMINAL_STOP_IDS[station_id]
+        return rng.choice(stop_codes[station_id])
+
+    vehicle_positions = gtfs_realtime_pb2.FeedMessage()
+    vehicle_positions.header.gtfs_realtime_version = "2.0"
+    vehicle_positions.header.timestamp = timestamp
+    trip_updates = gtfs_realtime_pb2.FeedMessage()
+    trip_updates.header.gtfs_realtime_version = "2.0"
+    trip_updates.header.timestamp = timestamp
+
+    for i in range(int(n_rapid_transit * scale)):
+        link_row = rng.integers(len(links))
+        link = links.iloc[link_row]
+        trip_id = f"trip-{i}"
+        route_id = REALTIME_ROUTE_IDS[link['route_id']]
+        progress = min(rng.random() + 0.05 * step, 1)
+
+        entity = vehicle_positions.entity.add()
+        entity.id = f"y{i:04d}"
+        vehicle = entity.vehicle
+        vehicle.trip.trip_id = trip_id
+        vehicle.trip.route_id = route_id
+        vehicle.trip.direction_id = int(link['direction'])
+        vehicle.stop_id = stop_id_of(link['target_station_id'])
+        vehicle.current_status = int(rng.choice([0, 1, 2]))
+        vehicle.position.longitude, vehicle.position.latitude = (sources[link_row]
+                                                                 + progress * (targets[link_row] - sources[link_row]))
+        vehicle.timestamp = timestamp
+
+        entity = trip_updates.entity.add()
+        entity.id = trip_id
+        trip_update = entity.trip_update
+        trip_update.trip.trip_id = trip_id
+        trip_update.trip.route_id = route_id
+        trip_update.trip.direction_id = int(link['direction'])
+        for stop_sequence, station_id in enumerate(stations_on_route[link['route_id']]):
+            stop_time_update = trip_update.stop_time_update.add()
+            stop_time_update.stop_sequence = stop_sequence
+            stop_time_update.stop_id = rng.choice(stop_codes[station_id])
+            stop_time_update.arrival.time = timestamp + 90 * (stop_sequence + 1)
+            stop_time_update.departure.time = timestamp + 90 * (stop_sequence + 1) + 30
+
+    for i in range(int(n_other * scale)):
+        trip_id = f"bus-trip-{i}"
+        route_id = rng.choice(OTHER_ROUTE_IDS)
+        entity = vehicle_positions.entity.add()
+        entity.id = f"b{i:04d}"
+        vehicle = entity.vehicle
+        vehicle.trip.trip_id = trip_id
+        vehicle.trip.route_id = route_id
+        vehicle.trip.direction_id = int(rng.integers(2))
+        vehicle.stop_id = str(rng.integers(1, 30000))
+        vehicle.current_status = int(rng.choice([0, 1, 2]))
+        vehicle.position.longitude = -71.06 + rng.normal(scale=0.05)
+        vehicle.position.latitude = 42.36 + rng.normal(scale=0.05)
+        vehicle.timestamp = timestamp
+
+        entity = trip_updates.entity.add()
+        entity.id = trip_id
+        trip_update = entity.trip_update
+        trip_update.trip.trip_id = trip_id
+        trip_update.trip.route_id = route_id
+        for stop_sequence in range(20):
+            stop_time_update = trip_update.stop_time_update.add()
+            stop_time_update.stop_sequence = stop_sequence
+            stop_time_update.stop_id = str(rng.integers(1, 30000))
+            stop_time_update.arrival.time = timestamp + 60 * (stop_sequence + 1)
+
+    return vehicle_positions.SerializeToString(), trip_updates.SerializeToString()
+
+
+def synthesize_recording(directory: str,
+                         n_snapshots: int = 10,
+                         scale: float = 1.0,
+                         interval: int = 10,
+                         seed: int = 0,
+                         n_other: int = 450):
+    """Record ``n_snapshots`` synthetic feed pairs, ``interval`` seconds apart, for replay by ReplayFeedClient."""
+    recorder = FeedRecorder(directory)
+    for step in range(n_snapshots):
+        timestamp = 1_700_000_000 + step * interval
+        vehicle_positions, trip_updates = synthesize_feeds(scale=scale, n_other=n_other, timestamp=timestamp,
+                                                         seed=seed, step=step)
+        recorder.append("VehiclePositions.pb", vehicle_positions, recorded_at=timestamp)
+        recorder.append("TripUpdates.pb", trip_updates, recorded_at=timestamp)
+    recorder.close()
@@ -0,0 +1,63 @@
+"""Per-refresh latency of tracking the full fleet against rapid transit only.
+
+    python -m benchmarks.full_fleet [--recording DIRECTORY] [--other 1100] [--repeat 50]
+
+Times one refresh as the poller runs it, ``update_trains`` followed by encoding the payload, for each route set on
+the same feeds: recorded ones, or a synthetic full-size feed with ``--other`` buses, commuter rail trains and ferries
+besides the rapid transit trains. Prints the latency percentiles, how many vehicles went on the schematic and on the
+geographic map, the payload size, and the share of the refresh interval the p99 takes.
+"""
+import argparse
+from tempfile import TemporaryDirectory
+
+from benchmarks.feeds import AGENCY, synthesize_recording
+from benchmarks.run import CyclingFeedClient, measure
+from ttracker.recording import read_payloads
+from ttracker.system import System
+from ttracker.wire import TrainEncoder
+
+# seconds between refreshes in the app
+REFRESH_INTERVAL = 3
+ROUTE_SETS_COMPARED = ["rapid_transit", "all"]
+
+
+def measure_route_set(payloads: dict, route_set: str, repeat: int) -> dict:
+    system = System(AGENCY, trip_updates_interval=0, client=CyclingFeedClient(payloads), route_set=route_set)
+    # which traces the payload names does not change how long it takes to encode
+    encoder = TrainEncoder(system.marker_legend(), trace=1, station_trace=0)
+    results = measure(lambda: encoder.encode(system.update_trains()), repeat)
+
+    trains = system.update_trains()
+    encoded = encoder.encode(trains)
+    results['schematic'] = len(trains.ids)
+    results['geographic'] = 0 if trains.other_vehicles is None else len(trains.other_vehicles.ids)
+    results['payload_bytes'] = len(encoded.json.encode())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recording", help="directory of recorded feeds; a synthetic full-size feed otherwise")
+    parser.add_argument("--other", type=int, default=1100, help="vehicles off the schematic in the synthetic feed")
+    parser.add_argument("--snapshots", type=int, default=5, help="synthetic snapshots")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as fixture:
+        if args.recording:
+            payloads = read_payloads(args.recording)
+        else:
+            synthesize_recording(fixture, n_snapshots=args.snapshots, n_other=args.other)
+            payloads = read_payloads(fixture)
+    results = {route_set: measure_route_set(payloads, route_set, args.repeat) for route_set in ROUTE_SETS_COMPARED}
+
+    print(f"{'route set':<16}{'p50 ms':>10}{'p99 ms':>10}{'schematic':>11}{'geographic':>12}{'payload B':>11}"
+          f"{'p99 of refresh':>16}")
+    for route_set, timings in results.items():
+        print(f"{route_set:<16}{timings['p50_ms']:>10.2f}{timings['p99_ms']:>10.2f}{timings['schematic']:>11}"
+              f"{timings['geographic']:>12}{timings['payload_bytes']:>11}"
+              f"{timings['p99_ms'] / 1000 / REFRESH_INTERVAL:>16.1%}")
+
+
+if __name__ == '__main__':
+    main()
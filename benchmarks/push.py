@@ -0,0 +1,152 @@
+"""Load test of the train stream against polling the Dash callback, with many clients on one server worker.
+
+    python -m benchmarks.push [--clients 1000] [--duration 60] [--poll-interval 10]
+
+Starts the app under gunicorn's gevent worker on a synthetic replay, then holds ``--clients`` connections open for
+``--duration`` seconds, once polling the callback every ``--poll-interval`` seconds per client and once subscribed to
+the stream. For each mode it prints the HTTP requests the server handled per second, the train updates delivered per
+second, and the CPU the worker used per second of wall time, read from its /metrics before and after. Needs gunicorn
+and gevent, as in production.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+from tempfile import TemporaryDirectory
+from time import monotonic, sleep
+
+from benchmarks.feeds import synthesize_recording
+
+CALLBACK_REQUEST = json.dumps({"output": "train-data.data",
+                               "outputs": {"id": "train-data", "property": "data"},
+                               "inputs": [{"id": "interval-component", "property": "n_intervals", "value": 1}],
+                               "changedPropIds": ["interval-component.n_intervals"]}).encode()
+EVENT_MARKER = b"event: trains\n"
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(port: int, recording: str, clients: int) -> subprocess.Popen:
+    environment = dict(os.environ, TTRACKER_REPLAY=recording, TTRACKER_REPLAY_SPEED="0")
+    server = subprocess.Popen([shutil.which("gunicorn"), "app:server", "--bind", f"127.0.0.1:{port}",
+                               "--workers", "1", "--worker-class", "gevent",
+                               "--worker-connections", str(clients + 100), "--log-level", "warning"],
+                              env=environment)
+    for _ in range(600):
+        try:
+            scrape(port)
+            return server
+        except OSError:
+            sleep(0.1)
+    server.kill()
+    raise RuntimeError("The server did not start.")
+
+
+def scrape(port: int) -> dict:
+    # the unlabelled samples of /metrics
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as connection:
+        connection.sendall(b"GET /metrics HTTP/1.0\r\nHost: localhost\r\n\r\n")
+        response = b""
+        while chunk := connection.recv(65536):
+            response += chunk
+    body = response.split(b"\r\n\r\n", 1)[1].decode()
+    return {name: float(value) for name, value in re.findall(r"^([a-z_]+) ([0-9.e+-]+)$", body, re.MULTILINE)}
+
+
+async def read_response(reader: asyncio.StreamReader) -> bytes:
+    headers = await reader.readuntil(b"\r\n\r\n")
+    length = int(re.search(rb"content-length: *(\d+)", headers, re.IGNORECASE).group(1))
+    return await reader.readexactly(length)
+
+
+async def poll(port: int, interval: float, stop_at: float, counts: dict):
+    # gunicorn closes idle keep-alive connections after a few seconds, so a browser polling every few seconds opens a
+    # new connection for most requests; so does this client, for every one
+    await asyncio.sleep(random.uniform(0, interval))
+    request = (b"POST /_dash-update-component HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+               b"Connection: close\r\nContent-Length: %d\r\n\r\n" % len(CALLBACK_REQUEST)) + CALLBACK_REQUEST
+    while monotonic() < stop_at:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        body = await read_response(reader)
+        writer.close()
+        counts['requests'] += 1
+        counts['updates'] += 1
+        counts['bytes'] += len(body)
+        await asyncio.sleep(interval)
+
+
+async def subscribe(port: int, stop_at: float, counts: dict):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /trains/stream HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n")
+    counts['requests'] += 1
+    # an event may be split across reads; keeping the end of the previous read short of a whole marker counts each once
+    tail = b""
+    try:
+        while True:
+            chunk = await asyncio.wait_for(reader.read(65536), stop_at - monotonic())
+            if not chunk:
+                break
+            counts['bytes'] += len(chunk)
+            data = tail + chunk
+            counts['updates'] += data.count(EVENT_MARKER)
+            tail = data[-(len(EVENT_MARKER) - 1):]
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+
+
+async def run_clients(mode: str, port: int, clients: int, duration: float, poll_interval: float) -> dict:
+    counts = {'requests': 0, 'updates': 0, 'bytes': 0}
+    stop_at = monotonic() + duration
+    if mode == "poll":
+        tasks = [poll(port, poll_interval, stop_at, counts) for _ in range(clients)]
+    else:
+        tasks = [subscribe(port, stop_at, counts) for _ in range(clients)]
+    await asyncio.gather(*tasks)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--poll-interval", type=float, default=10, help="seconds between polls of each client")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'clients':>8}{'requests/s':>12}{'updates/s':>11}{'MiB/s':>8}{'server CPU %':>14}"
+          f"{'encodes':>9}")
+    with TemporaryDirectory() as recording:
+        synthesize_recording(recording, n_snapshots=50)
+        for mode in ["poll", "push"]:
+            port = free_port()
+            server = start_server(port, recording, args.clients)
+            try:
+                before = scrape(port)
+                started = monotonic()
+                counts = asyncio.run(run_clients(mode, port, args.clients, args.duration, args.poll_interval))
+                elapsed = monotonic() - started
+                after = scrape(port)
+            finally:
+                server.terminate()
+                server.wait()
+            cpu = after['ttracker_process_cpu_seconds_total'] - before['ttracker_process_cpu_seconds_total']
+            encodes = (after.get('ttracker_stream_frames_encoded_total', 0)
+                       - before.get('ttracker_stream_frames_encoded_total', 0))
+            print(f"{mode:<8}{args.clients:>8}{counts['requests'] / elapsed:>12.1f}"
+                  f"{counts['updates'] / elapsed:>11.1f}"
+                  f"{counts['bytes'] / elapsed / 2 ** 20:>8.2f}{100 * cpu / elapsed:>14.1f}"
+                  f"{int(encodes) if mode == 'push' else int(counts['requests']):>9}")
+
+
+if __name__ == '__main__':
+    main()
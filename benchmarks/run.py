@@ -0,0 +1,186 @@
+"""Benchmark suite for the ingest -> geometry -> figure pipeline.
+
+    python -m benchmarks.run [--recording DIRECTORY] [--scale 1 10 100] [--repeat 50] [--compare RESULTS.json]
+
+Each stage is timed separately on recorded feeds (a directory written by FeedRecorder), or on synthetic MBTA-like
+feeds when no recording is given. ``--scale`` synthesizes feeds with that many times the vehicles, to show where the
+pipeline stops scaling. Latency percentiles and peak traced memory are printed and written to
+``benchmarks/results/<commit>.json``; ``--compare`` prints the change against an earlier results file.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tracemalloc
+from tempfile import TemporaryDirectory
+from time import perf_counter, time
+from typing import Callable, Dict, List
+
+import numpy as np
+import plotly.graph_objects as go
+from pandas import read_csv
+from plotly.io.json import to_json_plotly
+
+from benchmarks.feeds import AGENCY, synthesize_recording
+from ttracker.feed_client import FeedResponse
+from ttracker.gtfs_realtime import GTFSRealtime
+from ttracker import plotting_tools
+from ttracker.plotting_tools import freeze_figure
+from ttracker.poller import Poller
+from ttracker.recording import feed_name, read_payloads
+from ttracker.system import System, _get_portion_of_distance_traveled, _midpoint
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+
+
+class CyclingFeedClient:
+    """Serves recorded payloads round-robin, so that every fetch sees a new message."""
+
+    def __init__(self, payloads: Dict[str, List[bytes]]):
+        self._payloads = payloads
+        self._positions = {name: 0 for name in payloads}
+
+    def fetch(self, url: str) -> FeedResponse:
+        name = feed_name(url)
+        position = self._positions[name]
+        self._positions[name] = (position + 1) % len(self._payloads[name])
+        return FeedResponse(self._payloads[name][position], False)
+
+
+def measure(function: Callable, repeat: int) -> Dict[str, float]:
+    function()  # warm up caches and lazy imports
+    latencies = []
+    for _ in range(repeat):
+        started_at = perf_counter()
+        function()
+        latencies.append((perf_counter() - started_at) * 1000)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': max(latencies),
+            'mean_ms': float(np.mean(latencies)), 'peak_kib': peak / 1024, 'n': repeat}
+
+
+def build_system(payloads: Dict[str, List[bytes]]) -> System:
+    return System(AGENCY, trip_updates_interval=0, client=CyclingFeedClient(payloads))
+
+
+def build_base_map(system: System) -> go.Figure:
+    return plotting_tools.build_base_map(system.links_data, system.station_data, AGENCY.map_style,
+                                         read_csv(AGENCY.map_background))
+
+
+def run_stages(payloads: Dict[str, List[bytes]], repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+
+    gtfs = GTFSRealtime(AGENCY, trip_updates_interval=0, client=CyclingFeedClient(payloads))
+    results['get_train_positions'] = measure(gtfs.get_train_positions, repeat)
+
+    system = build_system(payloads)
+    results['update_trains'] = measure(system.update_trains, repeat)
+    trains = system.update_trains()
+
+    # the geometry only depends on the number of trains, so random positions of the same size will do
+    rng = np.random.default_rng(0)
+    n_trains = len(trains.x)
+    previous_stations, next_stations, current_positions = (rng.random((n_trains, 2)) for _ in range(3))
+    current_status = rng.integers(0, 3, n_trains)
+    results['geometry'] = measure(lambda: _midpoint(previous_stations, next_stations,
+                                                    _get_portion_of_distance_traveled(previous_stations,
+                                                                                      next_stations,
+                                                                                      current_positions,
+                                                                                      current_status)),
+                                  repeat)
+
+    results['plot_map'] = measure(lambda: build_base_map(system), repeat)
+    base_map = build_base_map(system)
+    results['serialize_base_map'] = measure(lambda: freeze_figure(base_map), repeat)
+
+    import app  # noqa: E402, imported late so that it replays the fixture instead of polling the MBTA
+    app.scheduler.stop()
+    agency = app.default_agency
+    agency.train_poller = Poller(system.update_trains, render=agency.train_encoder.encode)
+    agency.train_poller.refresh()
+    results['serialize_tick'] = measure(lambda: to_json_plotly(agency.update_train_positions(0)), repeat)
+    client = app.server.test_client()
+    request = {"output": "train-data.data",
+               "outputs": {"id": "train-data", "property": "data"},
+               "inputs": [{"id": "interval-component", "property": "n_intervals", "value": 1}],
+               "changedPropIds": ["interval-component.n_intervals"]}
+    results['callback'] = measure(lambda: client.post('/_dash-update-component', json=request), repeat)
+    results['callback']['response_bytes'] = len(client.post('/_dash-update-component', json=request).data)
+    results['vehicles'] = {'snapshots': len(payloads["VehiclePositions.pb"]), 'trains': n_trains}
+    return results
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results: dict, baseline: dict = None):
+    for scale, stages in results['scales'].items():
+        print(f"\nscale {scale}: {stages['vehicles']['trains']} trains")
+        print(f"{'stage':<22}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}{'peak KiB':>11}"
+              + (f"{'p50 vs base':>13}" if baseline else ""))
+        for stage, timings in stages.items():
+            if stage == 'vehicles':
+                continue
+            line = (f"{stage:<22}{timings['p50_ms']:>10.3f}{timings['p90_ms']:>10.3f}{timings['p99_ms']:>10.3f}"
+                    f"{timings['max_ms']:>10.3f}{timings['peak_kib']:>11.1f}")
+            base_timings = (baseline or {}).get('scales', {}).get(scale, {}).get(stage)
+            if base_timings:
+                line += f"{timings['p50_ms'] / base_timings['p50_ms']:>12.2f}x"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recording", help="directory of recorded feeds; synthetic feeds are used otherwise")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1], help="vehicle multipliers for synthetic feeds")
+    parser.add_argument("--snapshots", type=int, default=5, help="synthetic snapshots per scale")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--output", help="results file, by default benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as fixtures:
+        fixture_directories = {}
+        if args.recording:
+            fixture_directories['recording'] = args.recording
+        else:
+            for scale in args.scale:
+                fixture_directories[f"{scale:g}x"] = os.path.join(fixtures, f"{scale:g}x")
+                synthesize_recording(fixture_directories[f"{scale:g}x"], n_snapshots=args.snapshots, scale=scale)
+        os.environ["TTRACKER_REPLAY"] = next(iter(fixture_directories.values()))
+        os.environ["TTRACKER_REPLAY_SPEED"] = "0"
+
+        results = {'commit': current_commit(), 'created_at': time(), 'python': platform.python_version(),
+                   'scales': {}}
+        for scale, directory in fixture_directories.items():
+            payloads = read_payloads(directory)
+            results['scales'][scale] = run_stages(payloads, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"\nresults written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Compare snapping onto the track with projecting onto the line between the previous and next station.
+
+    python -m benchmarks.snapping [--vehicles 150 1500] [--noise 15] [--wrong-stop 0.1]
+
+Vehicles are placed at known points along random links, moved by GPS-like noise (in meters), and a share of them
+report the stop they just left as their next stop, as the feed does around departures. Both methods are scored on how
+far from the true position they draw each vehicle, in screen units, and on how often they pick the right link.
+"""
+import argparse
+from timeit import repeat
+
+import numpy as np
+
+from benchmarks.feeds import AGENCY
+from ttracker.system import System, _get_portion_of_distance_traveled, _midpoint
+
+
+def synthesize_vehicles(system, n_vehicles, noise, wrong_stop, seed=0):
+    rng = np.random.default_rng(seed)
+    links = system.links_data
+    moving_links = np.flatnonzero((links['source_station_id'] != links['target_station_id']).to_numpy())
+    link_rows = rng.choice(moving_links, n_vehicles)
+    progress = rng.random(n_vehicles)
+
+    source_codes = system._station_ids.get_indexer(links['source_station_id'].iloc[link_rows])
+    target_codes = system._station_ids.get_indexer(links['target_station_id'].iloc[link_rows])
+    sources = system._station_positions_map[source_codes]
+    targets = system._station_positions_map[target_codes]
+    positions = sources + (targets - sources) * progress[:, np.newaxis]
+    positions += rng.normal(scale=noise, size=positions.shape) / system._snapper.projection.scale
+
+    reported_stations = np.where(rng.random(n_vehicles) < wrong_stop, source_codes, target_codes)
+    truth_screen = _midpoint(system._previous_station_positions_screen[link_rows],
+                             system._station_positions_screen[target_codes], progress)
+    return {'route_ids': links['route_id'].iloc[link_rows].to_numpy(),
+            'station_ids': system._station_ids[reported_stations],
+            'directions': links['direction'].to_numpy()[link_rows],
+            'positions': positions,
+            'status': np.full(n_vehicles, 2),
+            'link_rows': link_rows,
+            'truth_screen': truth_screen}
+
+
+def find_links(system, route_ids, next_station_ids, direction_ids):
+    # the link of each vehicle's reported next stop, as the app looked it up before snapping
+    route_codes = system._route_ids.get_indexer(route_ids)
+    station_codes = system._station_ids.get_indexer(next_station_ids)
+    return system._find_link_rows(route_codes, station_codes, direction_ids), route_codes, station_codes
+
+
+def project_onto_station_line(system, vehicles):
+    link_rows, _, station_codes = find_links(system, vehicles['route_ids'], vehicles['station_ids'],
+                                             vehicles['directions'])
+    found = link_rows >= 0
+    portions = _get_portion_of_distance_traveled(system._previous_station_positions_map[link_rows[found]],
+                                                 system._station_positions_map[station_codes[found]],
+                                                 vehicles['positions'][found],
+                                                 vehicles['status'][found])
+    screen = np.full((len(link_rows), 2), np.nan)
+    screen[found] = _midpoint(system._previous_station_positions_screen[link_rows[found]],
+                              system._station_positions_screen[station_codes[found]], portions)
+    return link_rows, screen
+
+
+def snap_onto_track(system, vehicles):
+    route_codes = system._route_ids.get_indexer(vehicles['route_ids'])
+    snapped = system._snapper.snap(vehicles['positions'], route_codes, vehicles['directions'])
+    found = snapped.link_rows >= 0
+    link_rows = snapped.link_rows[found]
+    screen = np.full((len(snapped.link_rows), 2), np.nan)
+    screen[found] = _midpoint(system._previous_station_positions_screen[link_rows],
+                              system._station_positions_screen[system._link_target_station_codes[link_rows]],
+                              snapped.fractions[found])
+    return snapped.link_rows, screen
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vehicles", type=int, nargs="+", default=[150, 1500])
+    parser.add_argument("--noise", type=float, default=15, help="standard deviation of the GPS noise, in meters")
+    parser.add_argument("--wrong-stop", type=float, default=0.1, help="share of vehicles reporting the wrong stop")
+    args = parser.parse_args()
+
+    system = System(AGENCY)
+    print(f"{'method':<10}{'vehicles':>9}{'ms/call':>10}{'right link':>12}{'median err':>12}{'p95 err':>10}"
+          f"{'dropped':>9}")
+    for n_vehicles in args.vehicles:
+        vehicles = synthesize_vehicles(system, n_vehicles, args.noise, args.wrong_stop)
+        for name, method in [("line", project_onto_station_line), ("snap", snap_onto_track)]:
+            seconds = min(repeat(lambda: method(system, vehicles), number=20, repeat=5)) / 20
+            link_rows, screen = method(system, vehicles)
+            # links serving several routes are duplicated per route, so compare the stations rather than the rows
+            links = system.links_data[['source_station_id', 'target_station_id']].to_numpy()
+            placed = link_rows >= 0
+            right_link = np.zeros(n_vehicles, dtype=bool)
+            right_link[placed] = (links[link_rows[placed]] == links[vehicles['link_rows'][placed]]).all(axis=1)
+            errors = np.hypot(*(screen[placed] - vehicles['truth_screen'][placed]).T)
+            print(f"{name:<10}{n_vehicles:>9}{seconds * 1000:>10.3f}{right_link.mean():>12.1%}"
+                  f"{np.median(errors):>12.3f}{np.percentile(errors, 95):>10.3f}{(~placed).sum():>9}")
+
+
+if __name__ == '__main__':
+    main()
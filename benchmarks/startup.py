@@ -0,0 +1,71 @@
+"""Measure how long a fresh server process takes to import the app and answer its first callback.
+
+    python -m benchmarks.startup [--runs 5]
+
+Each run starts a new interpreter on a synthetic replay, once with the runtime bundle and once with TTRACKER_BUNDLE=0,
+so that the app builds everything from the clean CSV files. Build the bundle first with
+``python -m ttracker.scripts.build_runtime_bundle``. The child also reports whether any build-time dependency was
+imported, which the runtime must never do.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from statistics import median
+from tempfile import TemporaryDirectory
+
+from benchmarks.feeds import synthesize_recording
+
+# only needed to build the clean data and the bundle
+BUILD_TIME_MODULES = ["gtfs_kit", "geopandas", "shapely"]
+
+CHILD = """
+import json, sys
+from time import perf_counter
+started = perf_counter()
+import app
+imported = perf_counter()
+app.default_agency.train_poller.refresh()
+request = {"output": "train-data.data",
+           "outputs": {"id": "train-data", "property": "data"},
+           "inputs": [{"id": "interval-component", "property": "n_intervals", "value": 1}],
+           "changedPropIds": ["interval-component.n_intervals"]}
+response = app.server.test_client().post('/_dash-update-component', json=request)
+assert response.status_code == 200, response.status_code
+answered = perf_counter()
+print(json.dumps({'import': imported - started, 'first_callback': answered - started,
+                  'bundle': (app.default_agency.bundle is not None
+                             and app.default_agency.system.links_data is None),
+                  'build_time_modules': [name for name in %r if name in sys.modules]}))
+""" % BUILD_TIME_MODULES
+
+
+def run_child(environment: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", CHILD], env=environment, check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as recording:
+        synthesize_recording(recording, n_snapshots=2)
+        print(f"{'mode':<8}{'import s':>10}{'first callback s':>18}  build-time modules")
+        for mode, use_bundle in [("bundle", "1"), ("csv", "0")]:
+            environment = dict(os.environ, TTRACKER_REPLAY=recording, TTRACKER_REPLAY_SPEED="0",
+                               TTRACKER_BUNDLE=use_bundle)
+            runs = [run_child(environment) for _ in range(args.runs)]
+            if use_bundle == "1" and not all(run['bundle'] for run in runs):
+                print("bundle: no current runtime bundle, build it first")
+                continue
+            imported = sorted({name for run in runs for name in run['build_time_modules']})
+            print(f"{mode:<8}{median(run['import'] for run in runs):>10.3f}"
+                  f"{median(run['first_callback'] for run in runs):>18.3f}  {', '.join(imported) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
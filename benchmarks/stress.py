@@ -0,0 +1,123 @@
+"""Concurrency stress test of the train callback against a poller publishing as fast as it can.
+
+    python -m benchmarks.stress [--threads 32] [--duration 10] [--snapshots 200]
+
+Imports the app on a synthetic replay, then has ``--threads`` threads post to the train callback back to back while
+the poller publishes a new snapshot after every replayed message. Every response must be exactly the payload of one
+published snapshot, apart from its age, with as many values in each array as it has trains, and the base map and the
+layout must come out of the run unchanged. Prints the requests per second, the snapshots published, the latency
+percentiles and the number of failures, and exits with status 1 if there were any.
+"""
+import argparse
+import json
+import os
+import sys
+from base64 import b64decode
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+
+import numpy as np
+
+from benchmarks.feeds import synthesize_recording
+
+CALLBACK_REQUEST = {"output": "train-data.data",
+                    "outputs": {"id": "train-data", "property": "data"},
+                    "inputs": [{"id": "interval-component", "property": "n_intervals", "value": 1}],
+                    "changedPropIds": ["interval-component.n_intervals"]}
+ARRAY_FIELDS = ["x", "y", "vx", "vy", "route", "station", "status", "target"]
+
+
+def check_payload(payload: dict, published: set) -> str:
+    # what is wrong with one response, or an empty string
+    trains = dict(payload)
+    if not isinstance(trains.pop('age', None), (int, float)):
+        return "no age"
+    if json.dumps(trains, separators=(',', ':')) not in published:
+        return "not a published snapshot"
+    for field in ARRAY_FIELDS:
+        values = np.frombuffer(b64decode(trains[field]['bdata']), dtype=np.dtype(trains[field]['dtype']))
+        if len(values) != len(trains['ids']):
+            return f"{len(values)} values of {field} for {len(trains['ids'])} trains"
+    return ""
+
+
+def hammer(app, stop_at: float, published: set, latencies: list, failures: dict, lock: Lock):
+    client = app.server.test_client()
+    thread_latencies = []
+    thread_failures = {}
+    while monotonic() < stop_at:
+        started_at = perf_counter()
+        response = client.post('/_dash-update-component', json=CALLBACK_REQUEST)
+        thread_latencies.append(perf_counter() - started_at)
+        if response.status_code != 200:
+            problem = f"status {response.status_code}"
+        else:
+            problem = check_payload(response.get_json()['response']['train-data']['data'], published)
+        if problem:
+            thread_failures[problem] = thread_failures.get(problem, 0) + 1
+    with lock:
+        latencies.extend(thread_latencies)
+        for problem, count in thread_failures.items():
+            failures[problem] = failures.get(problem, 0) + count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--snapshots", type=int, default=200, help="snapshots in the synthetic replay")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as recording:
+        synthesize_recording(recording, n_snapshots=args.snapshots)
+        os.environ.update(TTRACKER_REPLAY=recording, TTRACKER_REPLAY_SPEED="0")
+        import app  # noqa: E402, imported late so that it replays the recording
+        from ttracker.poller import Poller
+
+        agency = app.default_agency
+        # the JSON of every snapshot the poller published, which is all that a response may contain
+        published = set()
+
+        def render(trains):
+            encoded = agency.train_encoder.encode(trains)
+            published.add(encoded.json + '}')
+            return encoded
+
+        app.scheduler.stop()
+        agency.train_poller = Poller(agency.system.update_trains, interval=0, render=render).start()
+        agency.train_poller.latest(timeout=10)
+        base_map = agency.base_map.json
+        client = app.server.test_client()
+        layout = client.get('/_dash-layout').data
+        first_version = agency.train_poller.latest().version
+
+        latencies, failures, lock = [], {}, Lock()
+        stop_at = monotonic() + args.duration
+        threads = [Thread(target=hammer, args=(app, stop_at, published, latencies, failures, lock))
+                   for _ in range(args.threads)]
+        started_at = monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = monotonic() - started_at
+        agency.train_poller.stop()
+
+        if agency.base_map.json != base_map:
+            failures["base map changed"] = 1
+        if client.get('/_dash-layout').data != layout:
+            failures["layout changed"] = 1
+
+    latencies = np.array(latencies) * 1000
+    print(f"{args.threads} threads, {len(latencies) / elapsed:.1f} requests/s, "
+          f"{agency.train_poller.latest().version - first_version} snapshots published")
+    print(f"latency ms: p50 {np.percentile(latencies, 50):.2f}, p99 {np.percentile(latencies, 99):.2f}, "
+          f"max {latencies.max():.2f}")
+    print(f"failures: {sum(failures.values())}" + "".join(f"\n  {count} {problem}"
+                                                         for problem, count in failures.items()))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
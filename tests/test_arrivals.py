@@ -0,0 +1,81 @@
+import numpy as np
+
+from ttracker.arrivals import ArrivalIndex
+
+
+def _brute_force(trips, station_code, after, n):
+    # (time, trip id) of the next n arrivals at a station, from every trip's rows
+    rows = sorted((time, trip_id) for trip_id, (route_code, station_codes, times) in trips.items()
+                  for station, time in zip(station_codes, times)
+                  if station == station_code and time >= after and station >= 0 and route_code >= 0)
+    return rows[:n]
+
+
+def test_next_arrivals_at_a_station_are_soonest_first():
+    index = ArrivalIndex(n_stations=4)
+    index.update({'a': (0, [0, 1, 2], [100, 200, 300]),
+                  'b': (1, [1, 2, 3], [150, 250, 350]),
+                  'c': (0, [1], [120])})
+
+    arrivals = index.at_station(1, after=0, n=3)
+    assert arrivals.trip_ids.tolist() == ['c', 'b', 'a']
+    assert arrivals.times.tolist() == [120, 150, 200]
+    assert arrivals.route_codes.tolist() == [0, 1, 0]
+    assert index.at_station(1, after=130, n=3).trip_ids.tolist() == ['b', 'a']
+    assert index.at_station(1, after=0, n=1).trip_ids.tolist() == ['c']
+    assert len(index.at_station(0, after=101, n=3).trip_ids) == 0
+
+
+def test_next_arrivals_on_a_route():
+    index = ArrivalIndex(n_stations=4)
+    index.update({'a': (0, [0, 1], [100, 200]), 'b': (1, [2, 3], [150, 250])})
+
+    arrivals = index.on_route(0, after=0)
+    assert arrivals.station_codes.tolist() == [0, 1]
+    assert index.on_route(1, after=200).times.tolist() == [250]
+
+
+def test_updating_a_trip_replaces_its_arrivals_and_ended_trips_are_dropped():
+    index = ArrivalIndex(n_stations=3)
+    index.update({'a': (0, [0, 1], [100, 200]), 'b': (0, [1, 2], [150, 250])})
+    index.update({'a': (0, [1, 2], [210, 310])}, ended=['b'])
+
+    assert len(index) == 2
+    assert index.at_station(0, after=0).trip_ids.tolist() == []
+    assert index.at_station(1, after=0).times.tolist() == [210]
+    assert index.on_route(0, after=0).trip_ids.tolist() == ['a', 'a']
+
+
+def test_unknown_stations_and_routes_are_left_out():
+    index = ArrivalIndex(n_stations=2)
+    index.update({'a': (0, [-1, 1], [100, 200]), 'b': (-1, [0], [150])})
+
+    assert len(index) == 1
+    assert index.at_station(1, after=0).trip_ids.tolist() == ['a']
+
+
+def test_upcoming_matches_each_station_and_pads_the_rest():
+    rng = np.random.default_rng(0)
+    n_stations, n = 6, 3
+    index = ArrivalIndex(n_stations)
+    trips = {}
+    for update in range(5):
+        changed = {f"trip-{rng.integers(12)}": (int(rng.integers(3)), rng.integers(-1, n_stations, 4).tolist(),
+                                                sorted(rng.integers(0, 1000, 4).tolist()))
+                   for _ in range(4)}
+        ended = [trip_id for trip_id in list(trips) if rng.random() < 0.2 and trip_id not in changed]
+        index.update(changed, ended)
+        trips.update(changed)
+        for trip_id in ended:
+            del trips[trip_id]
+
+        after = int(rng.integers(0, 500))
+        route_codes, times = index.upcoming(after, n)
+        assert route_codes.shape == times.shape == (n_stations, n)
+        for station_code in range(n_stations):
+            expected = _brute_force(trips, station_code, after, n)
+            found = route_codes[station_code] >= 0
+            assert times[station_code][found].tolist() == [time for time, _ in expected]
+            assert not found[len(expected):].any() and (times[station_code][~found] == 0).all()
+            arrivals = index.at_station(station_code, after, n)
+            assert list(zip(arrivals.times.tolist(), arrivals.trip_ids.tolist())) == expected
@@ -0,0 +1,94 @@
+from typing import NamedTuple, Optional
+
+import pytest
+from requests import HTTPError
+
+from benchmarks.feeds import AGENCY, synthesize_feeds
+from ttracker.feed_client import FeedClient
+from ttracker.gtfs_realtime import GTFSRealtime
+
+
+class FakeResponse(NamedTuple):
+    status_code: int
+    content: Optional[bytes] = None
+    etag: Optional[str] = None
+
+    @property
+    def headers(self):
+        return {} if self.etag is None else {'ETag': self.etag}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(f"{self.status_code}")
+
+
+class FakeSession:
+    # serves the responses queued for each URL in turn, the last one over and over, and records every request
+    def __init__(self, responses):
+        self.responses = {url: list(queued) for url, queued in responses.items()}
+        self.requests = []
+
+    def get(self, url, headers, timeout):
+        self.requests.append((url, dict(headers)))
+        queued = self.responses[url]
+        return queued.pop(0) if len(queued) > 1 else queued[0]
+
+    def close(self):
+        pass
+
+
+def _client(responses) -> FeedClient:
+    client = FeedClient()
+    client._session = FakeSession(responses)
+    return client
+
+
+@pytest.fixture(scope="module")
+def feeds():
+    return synthesize_feeds(n_rapid_transit=20, n_other=0), synthesize_feeds(n_rapid_transit=20, n_other=0, step=1,
+                                                                              timestamp=1_700_000_010)
+
+
+def test_a_not_modified_feed_keeps_the_last_positions(feeds):
+    (vehicle_positions, trip_updates), _ = feeds
+    client = _client({AGENCY.vehicle_positions_url: [FakeResponse(200, vehicle_positions, '"1"'), FakeResponse(304)],
+                      AGENCY.trip_updates_url: [FakeResponse(200, trip_updates, '"1"'), FakeResponse(304)]})
+    gtfs = GTFSRealtime(AGENCY, client=client)
+
+    positions = gtfs.get_train_positions()
+    assert len(positions) > 0
+    assert gtfs.get_train_positions() is positions and not gtfs.stale
+    assert client._session.requests[-1] == (AGENCY.vehicle_positions_url, {'If-None-Match': '"1"'})
+
+
+def test_an_unchanged_header_timestamp_skips_decoding(feeds):
+    (vehicle_positions, trip_updates), (newer_vehicle_positions, _) = feeds
+    client = _client({AGENCY.vehicle_positions_url: [FakeResponse(200, vehicle_positions, '"1"'),
+                                                     FakeResponse(200, vehicle_positions, '"2"'),
+                                                     FakeResponse(200, newer_vehicle_positions, '"3"')],
+                      AGENCY.trip_updates_url: [FakeResponse(200, trip_updates)]})
+    gtfs = GTFSRealtime(AGENCY, client=client)
+
+    positions = gtfs.get_train_positions()
+    assert gtfs.get_train_positions() is positions
+    assert gtfs.header_cache_hits == 1
+    assert gtfs.get_train_positions() is not positions
+
+
+def test_forgetting_a_feed_fetches_it_in_full(feeds):
+    (vehicle_positions, trip_updates), _ = feeds
+    url = AGENCY.vehicle_positions_url
+    client = _client({url: [FakeResponse(200, vehicle_positions, '"1"')]})
+    client.fetch(url)
+    client.fetch(url)
+    client.forget(url)
+    client.fetch(url)
+    assert [headers for _, headers in client._session.requests] == [{}, {'If-None-Match': '"1"'}, {}]
+
+    # a 304 before any positions were made from the feed forgets its validators and fetches it again
+    client = _client({url: [FakeResponse(304), FakeResponse(200, vehicle_positions, '"1"')],
+                      AGENCY.trip_updates_url: [FakeResponse(200, trip_updates)]})
+    client._validators[url] = {'ETag': '"0"'}
+    assert len(GTFSRealtime(AGENCY, client=client).get_train_positions()) > 0
+    requests = [headers for fetched, headers in client._session.requests if fetched == url]
+    assert requests == [{'If-None-Match': '"0"'}, {}]
@@ -0,0 +1,66 @@
+from google.transit import gtfs_realtime_pb2
+
+from benchmarks.feeds import AGENCY
+from ttracker.gtfs_realtime import GTFSRealtime
+
+
+def _add_vehicle(feed, entity_id, route_id, stop_id=None, current_status=None, position=None, trip_id=None,
+                 direction_id=0, timestamp=None):
+    vehicle = feed.entity.add(id=entity_id).vehicle
+    vehicle.trip.route_id = route_id
+    vehicle.trip.trip_id = trip_id or f"trip-{entity_id}"
+    vehicle.trip.direction_id = direction_id
+    if stop_id is not None:
+        vehicle.stop_id = stop_id
+    if current_status is not None:
+        vehicle.current_status = current_status
+    if position is not None:
+        vehicle.position.longitude, vehicle.position.latitude = position
+    if timestamp is not None:
+        vehicle.timestamp = timestamp
+
+
+def test_vehicle_positions_are_decoded_into_columns():
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.gtfs_realtime_version = "2.0"
+    feed.header.timestamp = 1_700_000_000
+    _add_vehicle(feed, "r1", "Red", "70061", 1, (-71.14, 42.39), direction_id=1, timestamp=1_699_999_990)
+    _add_vehicle(feed, "o1", "Orange", "Oak Grove-01", 2, (-71.07, 42.43))
+    # missing its stop, at an ignored stop, on a bus route and without a position: none of them are kept
+    _add_vehicle(feed, "b1", "Blue", current_status=0, position=(-71.0, 42.4))
+    _add_vehicle(feed, "g1", "Green-B", "71199", 0, (-71.1, 42.35))
+    _add_vehicle(feed, "bus", "1", "64", 0, (-71.08, 42.34))
+    _add_vehicle(feed, "g2", "Green-C", "70211", 0)
+
+    vehicles, other_vehicles = GTFSRealtime(AGENCY)._decode_vehicle_positions(feed)
+
+    assert other_vehicles is None
+    assert vehicles['id'].tolist() == ["r1", "o1"]
+    assert vehicles['trip_id'].tolist() == ["trip-r1", "trip-o1"]
+    assert vehicles['route_id'].tolist() == ["red", "orange"]
+    assert vehicles['next_stop_id'].tolist() == ["70061", "Oak Grove-01"]
+    assert vehicles['current_status'].tolist() == [1, 2]
+    assert vehicles['direction_id'].tolist() == [1, 0]
+    # positions are single precision in the message
+    assert vehicles['longitude'].round(4).tolist() == [-71.14, -71.07]
+    assert vehicles['latitude'].round(4).tolist() == [42.39, 42.43]
+    # the time of the feed stands in for a missing report time
+    assert vehicles['timestamp'].tolist() == [1_699_999_990, 1_700_000_000]
+
+
+def test_vehicles_of_the_geographic_layer_only_need_a_position():
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.header.timestamp = 1_700_000_000
+    _add_vehicle(feed, "r1", "Red", "70061", 1, (-71.14, 42.39))
+    _add_vehicle(feed, "cr1", "CR-Fitchburg", current_status=2, position=(-71.3, 42.4))
+    _add_vehicle(feed, "bus", "1", "64", 0, (-71.08, 42.34))
+    _add_vehicle(feed, "cr2", "CR-Worcester", "Framingham")
+
+    vehicles, other_vehicles = GTFSRealtime(AGENCY, route_set="commuter_rail")._decode_vehicle_positions(feed)
+
+    assert vehicles['id'].tolist() == ["r1"]
+    assert other_vehicles.ids.tolist() == ["cr1"]
+    assert other_vehicles.route_ids.tolist() == ["CR-Fitchburg"]
+    assert other_vehicles.current_status.tolist() == [2]
+    assert other_vehicles.longitude.round(4).tolist() == [-71.3]
+    assert other_vehicles.latitude.round(4).tolist() == [42.4]
@@ -0,0 +1,36 @@
+import pytest
+
+from ttracker.metrics import Registry
+
+
+def test_the_exposition_format_of_each_kind_of_metric():
+    registry = Registry()
+    registry.counter("fetches", "Fetches, by outcome.", feed="a", outcome="ok").inc(2)
+    registry.counter("fetches", "Fetches, by outcome.", feed="a", outcome="ok").inc()
+    registry.gauge("trains", "Trains.", lambda: 12, agency='say "hi"\\\n')
+    histogram = registry.histogram("latency_seconds", "Latency.", (0.1, 1), stage="parse")
+    for value in [0.05, 0.5, 0.5, 3]:
+        histogram.observe(value)
+
+    assert registry.render().splitlines() == [
+        '# HELP fetches_total Fetches, by outcome.',
+        '# TYPE fetches_total counter',
+        'fetches_total{feed="a",outcome="ok"} 3',
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{stage="parse",le="0.1"} 1',
+        'latency_seconds_bucket{stage="parse",le="1"} 3',
+        'latency_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'latency_seconds_sum{stage="parse"} 4.05',
+        'latency_seconds_count{stage="parse"} 4',
+        '# HELP trains Trains.',
+        '# TYPE trains gauge',
+        'trains{agency="say \\"hi\\"\\\\\\n"} 12',
+    ]
+
+
+def test_a_name_is_registered_as_one_kind_only():
+    registry = Registry()
+    registry.counter("trains", "Trains.")
+    with pytest.raises(ValueError):
+        registry.histogram("trains", "Trains.")
@@ -0,0 +1,166 @@
+from base64 import b64decode
+from threading import Event, Lock, Thread
+from time import sleep
+
+import numpy as np
+import pytest
+
+from benchmarks.feeds import AGENCY, synthesize_recording
+from ttracker.poller import Poller
+from ttracker.recording import ReplayFeedClient
+from ttracker.system import System
+from ttracker.wire import TrainEncoder
+
+TRAIN_FIELDS = ["x", "y", "vx", "vy", "route", "station", "status", "target"]
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("recording")
+    synthesize_recording(str(directory), n_snapshots=20, n_other=0)
+    return str(directory)
+
+
+def _problem(snapshot, encoder: TrainEncoder) -> str:
+    # what is inconsistent about one snapshot, or an empty string
+    trains, encoded = snapshot.data, snapshot.rendered
+    if encoded.timestamp != trains.timestamp:
+        return "rendered from another update"
+    if encoded.json != encoder.encode(trains).json:
+        return "rendered payload does not match the trains"
+    payload = encoded.with_age(trains.timestamp + 1)
+    if payload['age'] != 1:
+        return "wrong age"
+    for field in TRAIN_FIELDS:
+        values = np.frombuffer(b64decode(payload[field]['bdata']), dtype=np.dtype(payload[field]['dtype']))
+        if len(values) != len(payload['ids']):
+            return f"{len(values)} values of {field} for {len(payload['ids'])} trains"
+    if len(payload['ids']) != len(trains.ids) or trains.x.flags.writeable:
+        return "trains changed after they were published"
+    return ""
+
+
+def test_readers_always_get_a_complete_snapshot(recording):
+    system = System(AGENCY, trip_updates_interval=0, client=ReplayFeedClient(recording, speed=None))
+    encoder = TrainEncoder(system.marker_legend(), trace=1, station_trace=0)
+    poller = Poller(system.update_trains, render=encoder.encode)
+    poller.refresh()
+
+    done = Event()
+    lock = Lock()
+    problems, versions_seen, reads, published = [], set(), [], [poller.latest()]
+
+    def read():
+        last_version, n_reads = 0, 0
+        while not done.is_set():
+            snapshot = poller.latest()
+            problem = _problem(snapshot, encoder)
+            if snapshot.version < last_version:
+                problem = f"version {snapshot.version} after {last_version}"
+            last_version = snapshot.version
+            n_reads += 1
+            with lock:
+                versions_seen.add(snapshot.version)
+                if problem:
+                    problems.append(problem)
+        with lock:
+            reads.append(n_reads)
+
+    readers = [Thread(target=read) for _ in range(8)]
+    for reader in readers:
+        reader.start()
+    for _ in range(19):
+        published.append(poller.refresh())
+        sleep(0.01)
+    done.set()
+    for reader in readers:
+        reader.join()
+
+    assert problems == []
+    # every snapshot was published with a version of its own, and readers only ever saw published versions
+    distinct = {id(snapshot): snapshot for snapshot in published}.values()
+    assert len({snapshot.version for snapshot in distinct}) == len(distinct) > 1
+    assert versions_seen <= {snapshot.version for snapshot in published}
+    assert len(versions_seen) > 1 and min(reads) > 0
+
+
+def test_waiting_readers_get_every_newer_snapshot(recording):
+    system = System(AGENCY, trip_updates_interval=0, client=ReplayFeedClient(recording, speed=None))
+    poller = Poller(system.update_trains)
+    seen = []
+
+    def follow():
+        version = 0
+        while version < 5:
+            snapshot = poller.wait_for_newer(version, timeout=5)
+            assert snapshot is not None and snapshot.version > version
+            version = snapshot.version
+            seen.append(version)
+
+    follower = Thread(target=follow)
+    follower.start()
+    for _ in range(5):
+        poller.refresh()
+    follower.join(timeout=10)
+    assert not follower.is_alive()
+    assert seen == sorted(seen) and seen[-1] == 5
+
+
+def test_concurrent_refreshes_run_one_at_a_time():
+    running, overlaps, calls = [0], [], []
+    lock = Lock()
+
+    def refresh():
+        with lock:
+            running[0] += 1
+            overlaps.append(running[0] > 1)
+        sleep(0.005)
+        with lock:
+            running[0] -= 1
+            calls.append(1)
+        return (np.arange(3),)
+
+    poller = Poller(refresh)
+    threads = [Thread(target=poller.refresh) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not any(overlaps)
+    assert len(calls) == 8 and poller.latest().version == 8
+
+
+def test_a_failed_refresh_keeps_the_last_snapshot():
+    results = iter([(np.arange(3),), RuntimeError("feed down"), None])
+
+    def refresh():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    poller = Poller(refresh, interval=2)
+    assert poller.tick() == 2
+    published = poller.latest()
+    poller.tick()
+    poller.tick()
+    assert poller.latest() is published
+    assert published.version == 1 and not published.data[0].flags.writeable
+
+
+def test_an_unchanged_refresh_keeps_the_published_snapshot():
+    trains, stale = (np.arange(3),), [False]
+    renders = []
+
+    def render(data):
+        renders.append(data)
+        return len(renders)
+
+    poller = Poller(lambda: trains, is_stale=lambda: stale[0], render=render)
+    published = poller.refresh()
+    assert poller.refresh() is published and len(renders) == 1
+
+    stale[0] = True
+    assert poller.refresh().version == 2 and poller.latest().stale
+    trains = (np.arange(4),)
+    assert poller.refresh().version == 3 and len(renders) == 3
@@ -0,0 +1,87 @@
+import os
+
+from ttracker.recording import FeedRecorder, ReplayFeedClient, read_payloads
+
+VEHICLE_POSITIONS_URL = "https://example.com/realtime/VehiclePositions.pb"
+TRIP_UPDATES_URL = "https://example.com/realtime/TripUpdates.pb"
+
+
+def _record(directory, chunk_size=64 * 1024 * 1024):
+    # three vehicle positions messages 10 seconds apart, and trip updates at 0 and 15 seconds
+    recorder = FeedRecorder(str(directory), chunk_size=chunk_size)
+    for step in range(3):
+        recorder.append("VehiclePositions.pb", f"positions {step}".encode(), recorded_at=1000 + 10 * step)
+    recorder.append("TripUpdates.pb", b"trips 0", recorded_at=1000)
+    recorder.append("TripUpdates.pb", b"trips 1", recorded_at=1015)
+    recorder.close()
+
+
+def test_payloads_are_read_back_in_recorded_order(tmp_path):
+    _record(tmp_path, chunk_size=16)
+
+    assert len([name for name in os.listdir(tmp_path) if name.startswith("chunk-")]) > 1
+    assert read_payloads(str(tmp_path)) == {'VehiclePositions.pb': [b"positions 0", b"positions 1", b"positions 2"],
+                                            'TripUpdates.pb': [b"trips 0", b"trips 1"]}
+
+
+def test_replay_follows_the_clock_feed_then_answers_not_modified(tmp_path):
+    _record(tmp_path)
+    client = ReplayFeedClient(str(tmp_path), speed=None, clock_feed=VEHICLE_POSITIONS_URL)
+
+    served = []
+    for _ in range(3):
+        served.append((client.fetch(VEHICLE_POSITIONS_URL).content, client.fetch(TRIP_UPDATES_URL)))
+    assert [positions for positions, _ in served] == [b"positions 0", b"positions 1", b"positions 2"]
+    # trip updates follow in recorded time, and are not modified until a newer one was recorded
+    assert [trips.content for _, trips in served] == [b"trips 0", None, b"trips 1"]
+    assert served[1][1].not_modified
+    assert client.finished
+
+    assert client.fetch(VEHICLE_POSITIONS_URL).not_modified
+    assert client.fetch(TRIP_UPDATES_URL).not_modified
+
+
+def test_forgetting_a_feed_serves_its_last_payload_again(tmp_path):
+    _record(tmp_path)
+    client = ReplayFeedClient(str(tmp_path), speed=None, clock_feed=VEHICLE_POSITIONS_URL)
+    for _ in range(3):
+        client.fetch(VEHICLE_POSITIONS_URL)
+
+    client.forget(VEHICLE_POSITIONS_URL)
+    assert client.fetch(VEHICLE_POSITIONS_URL).content == b"positions 2"
+    assert client.fetch(VEHICLE_POSITIONS_URL).not_modified
+
+
+def test_a_record_cut_off_while_written_is_ignored(tmp_path):
+    _record(tmp_path)
+    chunk = os.path.join(tmp_path, "chunk-000000.log")
+    with open(chunk, 'r+b') as chunk_file:
+        chunk_file.truncate(os.path.getsize(chunk) - 3)
+
+    payloads = read_payloads(str(tmp_path))
+    assert payloads['TripUpdates.pb'] == [b"trips 0"]
+    assert len(payloads['VehiclePositions.pb']) == 3
+
+
+def test_recording_appends_to_an_existing_recording(tmp_path):
+    _record(tmp_path)
+    recorder = FeedRecorder(str(tmp_path))
+    recorder.append("VehiclePositions.pb", b"positions 3", recorded_at=1030)
+    recorder.close()
+
+    assert read_payloads(str(tmp_path))['VehiclePositions.pb'][-1] == b"positions 3"
+
+
+def test_recording_after_a_record_was_cut_off_keeps_every_complete_record(tmp_path):
+    _record(tmp_path)
+    chunk = os.path.join(tmp_path, "chunk-000000.log")
+    with open(chunk, 'r+b') as chunk_file:
+        chunk_file.truncate(os.path.getsize(chunk) - 3)
+    recorder = FeedRecorder(str(tmp_path))
+    recorder.append("TripUpdates.pb", b"trips 2", recorded_at=1030)
+    recorder.append("VehiclePositions.pb", b"positions 3", recorded_at=1030)
+    recorder.close()
+
+    payloads = read_payloads(str(tmp_path))
+    assert payloads['TripUpdates.pb'] == [b"trips 0", b"trips 2"]
+    assert payloads['VehiclePositions.pb'] == [b"positions 0", b"positions 1", b"positions 2", b"positions 3"]
@@ -0,0 +1,91 @@
+import multiprocessing
+
+import numpy as np
+
+from ttracker.shared_snapshot import SharedSnapshot
+from ttracker.system import ARRIVALS_PER_STATION, TrainPositions
+
+CAPACITY, N_STATIONS = 64, 5
+
+
+def _positions(step: int) -> TrainPositions:
+    # every value of a write is its step, and the number of trains changes with it, so a torn read shows
+    n_trains = step % CAPACITY + 1
+    values = np.full(n_trains, float(step))
+    codes = np.full(n_trains, step % 30000)
+    return TrainPositions(ids=np.full(n_trains, str(step), dtype=object), route_codes=codes, station_codes=codes,
+                          current_status=np.full(n_trains, step % 3), target_station_codes=codes, x=values, y=values,
+                          vx=values, vy=values, target_x=values, target_y=values, timestamp=float(step))
+
+
+def _arrivals(step: int):
+    shape = (N_STATIONS, ARRIVALS_PER_STATION)
+    return np.full(shape, step % 30000), np.full(shape, step)
+
+
+def _problem(positions: TrainPositions, arrivals) -> str:
+    step = int(positions.timestamp)
+    expected = _positions(step)
+    if len(positions.x) != len(expected.x):
+        return f"{len(positions.x)} trains in step {step}"
+    for name in ['x', 'y', 'vx', 'vy', 'target_x', 'target_y', 'station_codes', 'route_codes', 'current_status']:
+        if (getattr(positions, name) != getattr(expected, name)).any():
+            return f"{name} of another step than {step}"
+    if (positions.ids != str(step).encode()).any():
+        return f"ids of another step than {step}"
+    if any((values != expected_values).any() for values, expected_values in zip(arrivals, _arrivals(step))):
+        return f"arrivals of another step than {step}"
+    return ""
+
+
+def _write(path: str, steps: int):
+    snapshot = SharedSnapshot(path, CAPACITY, N_STATIONS)
+    for step in range(1, steps + 1):
+        snapshot.write(_positions(step), _arrivals(step))
+
+
+def _read(path: str, done, problems):
+    snapshot = SharedSnapshot(path, CAPACITY, N_STATIONS)
+    while not done.is_set():
+        result = snapshot.read(_problem)
+        if result is not None and result[1]:
+            problems.put(result[1])
+
+
+def test_readers_in_other_processes_never_get_a_torn_slot(tmp_path):
+    path = str(tmp_path / "trains")
+    SharedSnapshot(path, CAPACITY, N_STATIONS)
+    context = multiprocessing.get_context("fork")
+    done, problems = context.Event(), context.Queue()
+    readers = [context.Process(target=_read, args=(path, done, problems)) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    writer = context.Process(target=_write, args=(path, 5000))
+    writer.start()
+    writer.join(timeout=60)
+    done.set()
+    for reader in readers:
+        reader.join(timeout=10)
+
+    assert writer.exitcode == 0 and all(reader.exitcode == 0 for reader in readers)
+    assert problems.empty()
+    assert SharedSnapshot(path, CAPACITY, N_STATIONS).version == 5000
+
+
+def test_a_file_with_another_layout_is_replaced(tmp_path):
+    path = str(tmp_path / "trains")
+    old = SharedSnapshot(path, CAPACITY, N_STATIONS)
+    old.write(_positions(7), _arrivals(7))
+    assert SharedSnapshot(path, CAPACITY, N_STATIONS).version == 1
+
+    # the same file size with other header fields, then another number of stations
+    with open(path, 'r+b') as snapshot_file:
+        snapshot_file.write(b"\0" * 8)
+    assert SharedSnapshot(path, CAPACITY, N_STATIONS).version == 0
+    SharedSnapshot(path, CAPACITY, N_STATIONS).write(_positions(7), _arrivals(7))
+    replaced = SharedSnapshot(path, CAPACITY, N_STATIONS + 1)
+    assert replaced.version == 0 and replaced.read(lambda positions, arrivals: arrivals[1].shape) is None
+    replaced.write(_positions(7), (np.zeros((N_STATIONS + 1, ARRIVALS_PER_STATION)),) * 2)
+    assert replaced.read(lambda positions, arrivals: arrivals[1].shape)[1] == (N_STATIONS + 1, ARRIVALS_PER_STATION)
+    # the process that still maps the old file keeps reading it
+    assert old.read(_problem) == (1, "")
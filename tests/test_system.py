@@ -0,0 +1,14 @@
+import numpy as np
+
+from ttracker.system import _advance
+
+
+def test_trains_are_advanced_to_the_message_time_but_not_past_their_target():
+    positions = np.asarray([[0.0, 0.0], [0.0, 0.0], [5.0, 5.0], [1.0, 1.0]])
+    velocities = np.asarray([[1.0, 0.0], [0.0, 2.0], [0.0, 0.0], [1.0, 1.0]])
+    targets = np.asarray([[10.0, 0.0], [0.0, 4.0], [9.0, 9.0], [0.0, 0.0]])
+
+    advanced = _advance(positions, velocities, targets, np.asarray([3.0, 3.0, 3.0, 3.0]))
+    # on its way, at its target, stopped, and already past its target
+    assert advanced.tolist() == [[3.0, 0.0], [0.0, 4.0], [5.0, 5.0], [1.0, 1.0]]
+    assert _advance(positions, velocities, targets, np.asarray([-1.0, 0, 0, 0])).tolist() == positions.tolist()
@@ -0,0 +1,41 @@
+import numpy as np
+
+from ttracker.track_snapping import LocalProjection, TrackSnapper
+
+PROJECTION = LocalProjection(-71.0, 42.0)
+
+
+def _lon_lat(meters):
+    return PROJECTION.origin + np.asarray(meters, dtype=float) / PROJECTION.scale
+
+
+def test_vehicles_snap_onto_their_own_track():
+    # an L-shaped link with a repeated point, a straight link the other way, and a self-link
+    polylines = [_lon_lat([[0, 0], [100, 0], [100, 0], [100, 100]]), _lon_lat([[100, 100], [0, 0]]),
+                 _lon_lat([[0, 0], [0, 0]])]
+    snapper = TrackSnapper(polylines, np.asarray([0, 0, 0]), np.asarray([0, 1, 0]), PROJECTION, max_distance=50)
+
+    with np.errstate(divide='raise', invalid='raise'):
+        snapped = snapper.snap(_lon_lat([[50, 10], [105, 50], [50, 60], [500, 500]]), [0, 0, 0, 0], [0, 0, 1, 0])
+    assert snapped.link_rows.tolist() == [0, 0, 1, -1]
+    assert np.allclose(snapped.fractions[:3], [0.25, 0.75, 0.45], atol=1e-6)
+    assert np.allclose(snapped.distances[:3], [10, 5, np.hypot(5, 5)], atol=1e-6)
+    assert np.isfinite(snapped.fractions).all()
+
+
+def test_zero_length_segments_of_a_bundled_snapper_are_harmless():
+    arrays = TrackSnapper([_lon_lat([[0, 0], [100, 0]])], np.asarray([0]), np.asarray([0]), PROJECTION).to_arrays()
+    # a segment of zero length at the start of the link, as builds before they were dropped kept it
+    arrays['segment_starts'] = np.vstack([arrays['segment_starts'][:1], arrays['segment_starts']])
+    arrays['segment_vectors'] = np.vstack([[[0, 0]], arrays['segment_vectors']])
+    for name in ['segment_links', 'segment_offsets', 'segment_groups']:
+        arrays[name] = np.concatenate([arrays[name][:1], arrays[name]])
+    snapper = TrackSnapper.from_arrays(arrays)
+    starts, ends = snapper._segment_starts, snapper._segment_starts + snapper._segment_vectors
+    snapper._build_grid(np.minimum(starts, ends), np.maximum(starts, ends))
+
+    with np.errstate(divide='raise', invalid='raise'):
+        snapped = snapper.snap(_lon_lat([[-5, 0], [50, 0]]), [0, 0], [0, 0])
+    assert snapped.link_rows.tolist() == [0, 0]
+    assert np.allclose(snapped.fractions, [0, 0.5], atol=1e-6)
+    assert np.allclose(snapped.distances, [5, 0], atol=1e-6)
@@ -0,0 +1,77 @@
+import numpy as np
+
+from ttracker.vehicle_state import VehicleTable
+
+
+def _ids(*ids):
+    return np.asarray(ids, dtype=object)
+
+
+def test_vehicles_keep_their_slot_while_in_service():
+    table = VehicleTable(capacity=4)
+    slots, new = table.assign(_ids("a", "b", "c"))
+    assert new.tolist() == [True, True, True]
+    assert len(set(slots.tolist())) == 3
+
+    again, new = table.assign(_ids("c", "a", "b"))
+    assert not new.any()
+    assert again.tolist() == [slots[2], slots[0], slots[1]]
+    assert len(table) == 3
+
+
+def test_slots_of_vehicles_that_left_are_reused():
+    table = VehicleTable(capacity=4)
+    slots, _ = table.assign(_ids("a", "b", "c"))
+
+    reused, new = table.assign(_ids("a", "d"))
+    assert new.tolist() == [False, True]
+    assert reused[0] == slots[0]
+    assert reused[1] in slots[1:]
+    assert table.ids[reused].tolist() == ["a", "d"]
+    assert table.in_service().tolist() == sorted(reused.tolist())
+    assert table.capacity == 4
+
+
+def test_the_table_grows_without_moving_vehicles():
+    table = VehicleTable(capacity=2)
+    slots, _ = table.assign(_ids("a", "b"))
+    table.x[slots] = [10.0, 20.0]
+
+    grown, new = table.assign(_ids("a", "b", "c", "d", "e"))
+    assert table.capacity >= 5
+    assert grown[:2].tolist() == slots.tolist()
+    assert new.tolist() == [False, False, True, True, True]
+    assert table.x[grown[:2]].tolist() == [10.0, 20.0]
+    assert len(set(grown.tolist())) == 5
+
+
+def test_a_vehicle_listed_twice_gets_a_slot_for_one_report_only():
+    table = VehicleTable(capacity=4)
+    slots, new = table.assign(_ids("a", "a", "b"))
+    assert new.tolist() == [True, True, True]
+    assert len(set(slots.tolist())) == 3
+    assert len(table) == 2
+
+    again, new = table.assign(_ids("a", "b"))
+    assert not new.any()
+    assert again.tolist() == [slots[0], slots[2]]
+    # the transient slot is free again, and taken by the next vehicle to enter service
+    entered, new = table.assign(_ids("a", "b", "c"))
+    assert new.tolist() == [False, False, True]
+    assert entered[2] == slots[1]
+
+
+def test_changes_and_stalled_vehicles():
+    table = VehicleTable(capacity=4)
+    slots, _ = table.assign(_ids("a", "b"))
+    table.positions_map[slots] = [[-71.0, 42.0], [-71.1, 42.1]]
+    table.station_codes[slots] = [3, 4]
+    table.last_moved[slots] = [1000.0, 1250.0]
+    table.current_status[slots] = [1, 2]
+    table.stopped_since[slots] = [1000.0, 0.0]
+
+    assert table.moved(slots, np.asarray([[-71.0, 42.0], [-71.2, 42.1]])).tolist() == [False, True]
+    assert table.changed(slots, table.route_codes[slots], np.asarray([3, 5]), table.directions[slots],
+                         table.current_status[slots]).tolist() == [False, True]
+    assert table.stalled(now=1300.0, after=300).tolist() == ["a"]
+    assert table.dwell_seconds(slots, now=1300.0).tolist() == [300.0, 0.0]
@@ -0,0 +1,88 @@
+import json
+from base64 import b64decode
+from time import time
+
+import numpy as np
+
+from ttracker.poller import Poller
+from ttracker.streaming import SnapshotStream
+from ttracker.system import ARRIVALS_PER_STATION, TrainMarkers
+from ttracker.wire import VELOCITY_SCALE, TrainEncoder
+
+N_STATIONS = 4
+LEGEND = {'station_names': ["Alewife Station", "Davis Station", "Porter Station", "Harvard Station"],
+          'station_x': [-3.0, -1.0, 1.0, 3.0],
+          'station_y': [0.0, 1.5, -1.5, 0.0],
+          'route_colors': ["#DA291C"],
+          'route_names': ["Red Line"],
+          'arrivals_per_station': ARRIVALS_PER_STATION,
+          'status_labels': ["Next Stop: ", "Stopped At: ", "Next Stop: "],
+          'modes': [],
+          'mode_colors': [],
+          'geographic_origin': [-71.1, 42.4]}
+
+
+def _trains(seed: int, n_trains: int = 50) -> TrainMarkers:
+    rng = np.random.default_rng(seed)
+    timestamp = 1_700_000_000.0 + seed
+    arrival_route_codes = rng.integers(-1, 1, (N_STATIONS, ARRIVALS_PER_STATION))
+    return TrainMarkers(ids=np.asarray([f"train-{i}" for i in range(n_trains)], dtype=object),
+                        route_codes=np.zeros(n_trains, dtype=np.int16),
+                        station_codes=rng.integers(0, N_STATIONS, n_trains),
+                        current_status=rng.integers(0, 3, n_trains),
+                        target_station_codes=rng.integers(0, N_STATIONS, n_trains),
+                        x=rng.uniform(-3, 3, n_trains),
+                        y=rng.uniform(-1.5, 1.5, n_trains),
+                        vx=rng.uniform(-0.05, 0.05, n_trains),
+                        vy=rng.uniform(-0.05, 0.05, n_trains),
+                        timestamp=timestamp,
+                        arrival_route_codes=arrival_route_codes,
+                        arrival_times=np.where(arrival_route_codes >= 0,
+                                               timestamp + rng.integers(0, 1200, arrival_route_codes.shape), 0),
+                        other_vehicles=None)
+
+
+def _decode(field: dict) -> np.ndarray:
+    return np.frombuffer(b64decode(field['bdata']), dtype=np.dtype(field['dtype']))
+
+
+def test_encoded_trains_decode_back_within_a_quantization_step():
+    encoder = TrainEncoder(LEGEND, trace=2, station_trace=1)
+    trains = _trains(0)
+    encoded = encoder.encode(trains)
+    payload = json.loads(encoded.json_with_age(trains.timestamp + 2))
+
+    assert payload['age'] == 2 and payload['trace'] == 2
+    assert payload['ids'] == trains.ids.tolist()
+    scale = encoder.legend['position_scale']
+    assert np.abs(_decode(payload['x']) / scale - trains.x).max() <= 0.5 / scale
+    assert np.abs(_decode(payload['y']) / scale - trains.y).max() <= 0.5 / scale
+    assert np.abs(_decode(payload['vx']) / VELOCITY_SCALE - trains.vx).max() <= 0.5 / VELOCITY_SCALE
+    assert np.abs(_decode(payload['vy']) / VELOCITY_SCALE - trains.vy).max() <= 0.5 / VELOCITY_SCALE
+    assert _decode(payload['route']).tolist() == trains.route_codes.tolist()
+    assert _decode(payload['station']).tolist() == trains.station_codes.tolist()
+    assert _decode(payload['status']).tolist() == trains.current_status.tolist()
+    assert _decode(payload['target']).tolist() == trains.target_station_codes.tolist()
+
+    found = trains.arrival_route_codes.ravel() >= 0
+    arrival_routes = _decode(payload['arrival_route'])
+    assert arrival_routes[found].tolist() == trains.arrival_route_codes.ravel()[found].tolist()
+    assert (arrival_routes[~found] == encoder.legend['no_arrival']).all()
+    assert (_decode(payload['arrival_in'])[found]
+            == (trains.arrival_times - trains.timestamp).ravel()[found]).all()
+
+
+def test_the_legend_is_sent_once_rather_than_with_every_update():
+    encoder = TrainEncoder(LEGEND, trace=2, station_trace=1)
+    assert encoder.legend['station_names'] == LEGEND['station_names']
+    assert {'position_scale', 'velocity_scale', 'geographic_scale', 'no_arrival'} <= set(encoder.legend)
+
+    updates = iter([_trains(0), _trains(1)])
+    poller = Poller(lambda: next(updates), render=encoder.encode)
+    stream = SnapshotStream(poller, lambda snapshot: snapshot.rendered.json_with_age(time()), event="trains")
+    frames = [stream.frame(poller.refresh()) for _ in range(2)]
+
+    for frame in frames:
+        payload = json.loads(frame.decode().split("data: ", 1)[1])
+        assert not set(payload) & set(encoder.legend)
+        assert not any(name.encode() in frame for name in LEGEND['station_names'] + LEGEND['route_names'])
@@ -0,0 +1,118 @@
+import json
+import os
+from typing import FrozenSet, List, Mapping, NamedTuple, Optional, Tuple
+
+# configuration files of the agencies the app serves, one JSON file per agency
+AGENCY_DIRECTORY = "./agencies"
+
+
+class RouteSet(NamedTuple):
+    """Which vehicles of the feed are followed.
+
+    Vehicles on a ``schematic`` route, keyed by its GTFS-realtime route id and mapped to the route id of the static
+    data, are placed on the links of the schematic map. Vehicles on any other route whose id starts with one of the
+    ``geographic`` prefixes are kept as reported, for a map in longitude and latitude; the prefix '' keeps all of them.
+    """
+    schematic: Mapping[str, str]
+    geographic: Tuple[str, ...] = ()
+
+
+class Branches(NamedTuple):
+    # trips of a route that stop at any of ``stop_ids`` run on ``branch``, and all the others on ``otherwise``
+    stop_ids: FrozenSet[str]
+    branch: str
+    otherwise: str
+
+
+class AgencyConfig(NamedTuple):
+    """Everything that is specific to one transit agency, as read from its configuration file.
+
+    Paths are relative to the directory the app runs from. ``track_shapes``, ``runtime_bundle`` and ``map_background``
+    may be left out; links are then snapped to as straight lines, the map is always built from the CSV files, and the
+    map style is drawn without a background. Track shapes are built from the agency's GTFS on deploy, so a configured
+    file that is missing, as in a fresh checkout, is warned about and links are snapped to as straight lines.
+    """
+    name: str
+    title: str
+    vehicle_positions_url: str
+    trip_updates_url: str
+    # seconds between refreshes of the train positions, and at least between TripUpdates fetches
+    refresh_interval: float
+    trip_updates_interval: float
+    station_data: str
+    links_data: str
+    crosswalk: str
+    track_shapes: Optional[str]
+    runtime_bundle: Optional[str]
+    # a style of plotting_tools.plot_map, and the data of the background it draws
+    map_style: str
+    map_background: Optional[str]
+    route_sets: Mapping[str, RouteSet]
+    default_route_set: str
+    # route id prefix, label and color of each mode of the geographic layer; the first match wins
+    geographic_modes: List[Tuple[str, str, str]]
+    # routes of the static data that the feed publishes as one route, by that route's static route id
+    branches: Mapping[str, Branches]
+    # stops published under a name containing the key, rather than under their stop code
+    stop_aliases: Mapping[str, int]
+    # stop ids of vehicles that are dropped from the feed
+    ignored_stop_ids: FrozenSet[str]
+
+    def route_set(self, name: Optional[str] = None) -> RouteSet:
+        name = self.default_route_set if name is None else name
+        if name not in self.route_sets:
+            raise ValueError(f"{self.name} has no route set {name!r}; it has {', '.join(self.route_sets)}.")
+        return self.route_sets[name]
+
+
+def load_agency_config(path: str) -> AgencyConfig:
+    with open(path) as config_file:
+        config = json.load(config_file)
+    schematic_routes = config['schematic_routes']
+    # without route sets, only the schematic routes are followed
+    route_sets = {name: RouteSet(schematic_routes, tuple(prefixes))
+                  for name, prefixes in config.get('route_sets', {'schematic': []}).items()}
+    return AgencyConfig(
+        name=config['name'],
+        title=config.get('title', config['name']),
+        vehicle_positions_url=config['vehicle_positions_url'],
+        trip_updates_url=config['trip_updates_url'],
+        refresh_interval=float(config.get('refresh_interval', 3)),
+        trip_updates_interval=float(config.get('trip_updates_interval', 15)),
+        station_data=config['station_data'],
+        links_data=config['links_data'],
+        crosswalk=config['crosswalk'],
+        track_shapes=config.get('track_shapes'),
+        runtime_bundle=config.get('runtime_bundle'),
+        map_style=config.get('map_style', "schematic"),
+        map_background=config.get('map_background'),
+        route_sets=route_sets,
+        default_route_set=config.get('default_route_set', next(iter(route_sets))),
+        geographic_modes=[tuple(mode) for mode in config.get('geographic_modes', [])],
+        branches={route_id: Branches(frozenset(branches['stop_ids']), branches['branch'], branches['otherwise'])
+                  for route_id, branches in config.get('branches', {}).items()},
+        stop_aliases=config.get('stop_aliases', {}),
+        ignored_stop_ids=frozenset(config.get('ignored_stop_ids', [])))
+
+
+def load_agency_configs(directory: str = AGENCY_DIRECTORY, names: Optional[List[str]] = None) -> List[AgencyConfig]:
+    """The configurations in ``directory``, all of them sorted by file name, or the ``names`` ones in that order."""
+    if names is None:
+        names = sorted(file_name[:-len(".json")] for file_name in os.listdir(directory)
+                       if file_name.endswith(".json"))
+    configs = [load_agency_config(os.path.join(directory, f"{name}.json")) for name in names]
+    if not configs:
+        raise ValueError(f"No agency configuration in {directory}.")
+    return configs
+
+
+def optional_path(path: Optional[str]) -> Optional[str]:
+    # an optional file of a configuration, if it was given and exists
+    return path if path is not None and os.path.exists(path) else None
+
+
+def bundle_sources(agency: AgencyConfig) -> List[str]:
+    # the files a runtime bundle of the agency is built from; the map background and the track shapes are optional,
+    # so a bundle built before the track shapes were is not current once they are
+    return [agency.station_data, agency.links_data, agency.crosswalk] + \
+        [path for path in [agency.map_background, agency.track_shapes] if optional_path(path)]
@@ -0,0 +1,118 @@
+from typing import Dict, Iterable, Mapping, NamedTuple, Tuple
+
+from numpy import (arange, argsort, asarray, concatenate, empty, full, insert, int16, int32, int64, isin, minimum,
+                   ndarray, searchsorted, where)
+
+# arrival times take the low 32 bits of a sort key, and the station or route code the bits above them
+_TIME_BITS = 32
+
+
+class Arrivals(NamedTuple):
+    trip_ids: ndarray
+    route_codes: ndarray
+    station_codes: ndarray
+    # POSIX seconds
+    times: ndarray
+
+
+def _keys(codes, times) -> ndarray:
+    return (asarray(codes, dtype=int64) << _TIME_BITS) | asarray(times, dtype=int64)
+
+
+def _merge(rows: Dict[str, ndarray], keep: ndarray, added: Dict[str, ndarray]) -> Dict[str, ndarray]:
+    # rows sorted by 'keys', without the rows not kept and with the added ones, inserted where they sort
+    kept = {name: column[keep] for name, column in rows.items()}
+    order = argsort(added['keys'], kind='stable')
+    positions = searchsorted(kept['keys'], added['keys'][order], side='right')
+    return {name: insert(column, positions, added[name][order]) for name, column in kept.items()}
+
+
+class ArrivalIndex:
+    """Predicted arrivals of every trip, as columns sorted by station and then time, and by route and then time.
+
+    Each row is one arrival of one trip. A query for the next arrivals at a station, or on a route, is a binary search
+    for the code and the time in the sort keys of one of the two orders, and the rows that follow are the answer.
+    ``update`` only replaces the rows of the trips that changed: the rows of the others stay as they are, and the new
+    rows are sorted on their own and inserted where they belong, rather than sorting the whole index again.
+    """
+    n_stations: int
+    _trip_codes: Dict[str, int]
+    _trip_ids: Dict[int, str]
+
+    def __init__(self, n_stations: int):
+        self.n_stations = n_stations
+        self._trip_codes = {}
+        self._trip_ids = {}
+        self._next_trip_code = 0
+        empty_rows = {'keys': empty(0, dtype=int64), 'trip_codes': empty(0, dtype=int64),
+                      'route_codes': empty(0, dtype=int16), 'station_codes': empty(0, dtype=int32),
+                      'times': empty(0, dtype=int64)}
+        self._by_station = empty_rows
+        self._by_route = dict(empty_rows)
+
+    def __len__(self):
+        return len(self._by_station['keys'])
+
+    def update(self, trips: Mapping[str, Tuple[int, ndarray, ndarray]], ended: Iterable[str] = ()):
+        """Replace the arrivals of each trip in ``trips``, given as its route code, station codes and times, and drop
+        those of the ``ended`` trips."""
+        replaced = []
+        for trip_id in list(trips) + list(ended):
+            trip_code = self._trip_codes.pop(trip_id, None)
+            if trip_code is not None:
+                del self._trip_ids[trip_code]
+                replaced.append(trip_code)
+
+        columns = {'trip_codes': [], 'route_codes': [], 'station_codes': [], 'times': []}
+        for trip_id, (route_code, station_codes, times) in trips.items():
+            trip_code = self._trip_codes[trip_id] = self._next_trip_code
+            self._trip_ids[trip_code] = trip_id
+            self._next_trip_code += 1
+            columns['trip_codes'].append(full(len(times), trip_code, dtype=int64))
+            columns['route_codes'].append(full(len(times), route_code, dtype=int16))
+            columns['station_codes'].append(asarray(station_codes, dtype=int32))
+            columns['times'].append(asarray(times, dtype=int64))
+        added = {name: concatenate(parts) if parts else self._by_station[name][:0] for name, parts in columns.items()}
+        # rows for unknown stations or routes are left out, rather than sorted in under a negative code
+        known = (added['station_codes'] >= 0) & (added['route_codes'] >= 0)
+        added = {name: column[known] for name, column in added.items()}
+
+        self._by_station = _merge(self._by_station, ~isin(self._by_station['trip_codes'], replaced),
+                                  dict(added, keys=_keys(added['station_codes'], added['times'])))
+        self._by_route = _merge(self._by_route, ~isin(self._by_route['trip_codes'], replaced),
+                                dict(added, keys=_keys(added['route_codes'], added['times'])))
+
+    def _rows(self, rows: Dict[str, ndarray], code: int, after: float, n: int) -> Arrivals:
+        start = searchsorted(rows['keys'], _keys(code, int(after)))
+        end = min(searchsorted(rows['keys'], _keys(code + 1, 0)), start + n)
+        return Arrivals(trip_ids=asarray([self._trip_ids[trip_code] for trip_code in rows['trip_codes'][start:end]],
+                                         dtype=object),
+                        route_codes=rows['route_codes'][start:end],
+                        station_codes=rows['station_codes'][start:end],
+                        times=rows['times'][start:end])
+
+    def at_station(self, station_code: int, after: float, n: int = 3) -> Arrivals:
+        # the next n arrivals at a station from ``after`` on, soonest first
+        return self._rows(self._by_station, station_code, after, n)
+
+    def on_route(self, route_code: int, after: float, n: int = 10) -> Arrivals:
+        # the next n arrivals anywhere on a route from ``after`` on, soonest first
+        return self._rows(self._by_route, route_code, after, n)
+
+    def upcoming(self, after: float, n: int) -> Tuple[ndarray, ndarray]:
+        """Route codes and times of the next ``n`` arrivals at every station, one row per station code.
+
+        All stations are searched at once; a station with fewer than ``n`` arrivals to come has route code -1 and time
+        0 in the rest of its row.
+        """
+        rows = self._by_station
+        if not len(rows['keys']):
+            return full((self.n_stations, n), -1, dtype=int16), full((self.n_stations, n), 0, dtype=int64)
+        station_codes = arange(self.n_stations)
+        starts = searchsorted(rows['keys'], _keys(station_codes, int(after)))
+        ends = searchsorted(rows['keys'], _keys(station_codes + 1, 0))
+        offsets = starts[:, None] + arange(n)
+        found = offsets < ends[:, None]
+        offsets = minimum(offsets, len(rows['keys']) - 1)
+        return where(found, rows['route_codes'][offsets], -1), where(found, rows['times'][offsets], 0)
+
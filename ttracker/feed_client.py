@@ -0,0 +1,63 @@
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class FeedResponse(NamedTuple):
+    content: Optional[bytes]
+    not_modified: bool
+
+
+class FeedClient:
+    """Fetches feeds over one pooled, keep-alive session with strict timeouts and bounded retries.
+
+    The ``ETag`` and ``Last-Modified`` validators of each URL are remembered, so an unchanged feed comes back as a
+    304 with no content.
+    """
+    timeout: Tuple[float, float]
+    _session: Session
+    _validators: Dict[str, Dict[str, str]]
+
+    def __init__(self,
+                 connect_timeout: float = 3.05,
+                 read_timeout: float = 5,
+                 retries: int = 2,
+                 backoff_factor: float = 0.5,
+                 pool_maxsize: int = 4):
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(["GET"]),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
+        self._session = Session()
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._validators = {}
+
+    def fetch(self, url: str) -> FeedResponse:
+        headers = {}
+        validators = self._validators.get(url, {})
+        if 'ETag' in validators:
+            headers['If-None-Match'] = validators['ETag']
+        if 'Last-Modified' in validators:
+            headers['If-Modified-Since'] = validators['Last-Modified']
+
+        response = self._session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return FeedResponse(None, True)
+        response.raise_for_status()
+
+        self._validators[url] = {header: response.headers[header] for header in ['ETag', 'Last-Modified']
+                                 if header in response.headers}
+        return FeedResponse(response.content, False)
+
+    def forget(self, url: str):
+        # the next fetch of url returns it in full, even if it did not change
+        self._validators.pop(url, None)
+
+    def close(self):
+        self._session.close()
@@ -1,152 +1,513 @@
-from typing import List
-from pandas import read_csv, Series, DataFrame, json_normalize
-
-from requests import get
-from protobuf_to_dict import protobuf_to_dict
+import logging
+from collections import Counter
+from time import monotonic, perf_counter
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple, Union
+from numpy import empty, float64, int64, ndarray
+from pandas import factorize, isna, notna, read_csv, Series, DataFrame
+
+from requests import RequestException
 from google.transit import gtfs_realtime_pb2
 
-
-def _clean_stop_code(raw_stop_code: str):
-    stop_code = raw_stop_code
-    if "Braintree" in raw_stop_code:
-        stop_code = 38671
-    elif "Oak Grove" in raw_stop_code:
-        stop_code = 70036
-    elif "Union Square" in raw_stop_code:
-        stop_code = 70503
-    elif "Alewife" in raw_stop_code:
-        stop_code = 141
-    elif "Forest Hills" in raw_stop_code:
-        stop_code = 10642
-
-    return int(stop_code)
+from ttracker.agency import AgencyConfig, Branches, RouteSet
+from ttracker.feed_client import FeedClient, FeedResponse
+from ttracker.metrics import REGISTRY, SIZE_BUCKETS, stage_timer
+from ttracker.recording import feed_name
+
+logger = logging.getLogger(__name__)
+
+
+class FeedMetrics:
+    """The metrics that GTFSRealtime records for one agency, each labelled with the agency's name."""
+    agency: str
+
+    def __init__(self, agency: str):
+        self.agency = agency
+        self.parse_seconds = stage_timer("parse", agency)
+        self.decode_seconds = stage_timer("decode", agency)
+        self.clean_seconds = stage_timer("clean", agency)  # including a TripUpdates fetch, when one is needed
+        self.arrivals_decode_seconds = stage_timer("arrivals_decode", agency)
+        self.header_cache_hits = REGISTRY.counter("ttracker_header_cache_hits",
+                                                  "Feed messages skipped for an unchanged header.", agency=agency)
+        self.header_cache_misses = REGISTRY.counter("ttracker_header_cache_misses",
+                                                    "Feed messages processed for a new header.", agency=agency)
+        # TripUpdates fetches by what needed them: new trips of a branched route to classify, or the arrival
+        # predictions
+        self.trip_updates_fetched = {reason: REGISTRY.counter("ttracker_trip_updates_fetches",
+                                                              "TripUpdates fetches, by reason.", reason=reason,
+                                                              agency=agency)
+                                     for reason in ["branches", "arrivals"]}
+        # TripUpdates fetches spared because every trip of a branched route was classified already, or because new
+        # trips wait for the next trip_updates_interval
+        self.trip_updates_skipped = {reason: REGISTRY.counter("ttracker_trip_updates_skipped",
+                                                              "TripUpdates fetches skipped, by reason.",
+                                                              reason=reason, agency=agency)
+                                     for reason in ["classified", "interval"]}
+        self.vehicles_kept = self._vehicle_counter("kept")
+        self.vehicles_filtered = self._vehicle_counter("filtered")  # not on a route of the route set, or missing fields
+        self.vehicles_unclassified = self._vehicle_counter("unclassified")
+        self.vehicles_unmapped = self._vehicle_counter("unmapped_stop")
+        self.vehicles_geographic = self._vehicle_counter("geographic")  # kept for the geographic layer only
+
+    def _vehicle_counter(self, outcome: str):
+        return REGISTRY.counter("ttracker_vehicles", "Vehicles in decoded feeds, by what happened to them.",
+                                outcome=outcome, agency=self.agency)
+
+    def fetch_counter(self, feed: str, outcome: str):
+        return REGISTRY.counter("ttracker_feed_fetches", "Feed fetches, by outcome.", feed=feed, outcome=outcome,
+                                agency=self.agency)
+
+    def fetch_seconds(self, feed: str):
+        return REGISTRY.histogram("ttracker_feed_fetch_seconds", "Time to fetch a feed.", feed=feed,
+                                  agency=self.agency)
+
+    def fetched_bytes(self, feed: str):
+        return REGISTRY.histogram("ttracker_feed_bytes", "Size of the fetched feeds.", SIZE_BUCKETS, feed=feed,
+                                  agency=self.agency)
+
+
+def _clean_stop_code(raw_stop_code: str, stop_aliases: Mapping[str, int]) -> Optional[int]:
+    for stop_name, stop_code in stop_aliases.items():
+        if stop_name in raw_stop_code:
+            return stop_code
+    try:
+        return int(raw_stop_code)
+    except ValueError:
+        return None
+
+
+def _branch(branches: Branches, stop_time_updates) -> str:
+    # the branch of a trip, from the stops it makes
+    if any(stop_time_update.stop_id in branches.stop_ids for stop_time_update in stop_time_updates):
+        return branches.branch
+    return branches.otherwise
+
+
+class OtherVehicles(NamedTuple):
+    # vehicles of the geographic layer, as reported
+    ids: ndarray
+    route_ids: ndarray
+    current_status: ndarray
+    longitude: ndarray
+    latitude: ndarray
+
+
+class TripArrivals(NamedTuple):
+    # predicted arrivals of one trip, in stop order: the station and the POSIX time of each
+    route_id: str
+    station_ids: List[str]
+    times: List[int]
+
+
+class TripBranchCache:
+    """Remembers which branch each trip runs on, since that never changes during the trip.
+
+    Trips that have not been seen for ``ttl`` seconds are evicted.
+    """
+    ttl: float
+    _branches: Dict[str, str]
+    _last_seen: Dict[str, float]
+
+    def __init__(self, ttl: float = 900):
+        self.ttl = ttl
+        self._branches = {}
+        self._last_seen = {}
+
+    def __contains__(self, trip_id: str):
+        return trip_id in self._branches
+
+    def __len__(self):
+        return len(self._branches)
+
+    def get(self, trip_id: str, default: Optional[str] = None) -> Optional[str]:
+        return self._branches.get(trip_id, default)
+
+    def add(self, trip_id: str, branch: str):
+        self._branches[trip_id] = branch
+        self._last_seen[trip_id] = monotonic()
+
+    def touch(self, trip_ids: Iterable[str]):
+        now = monotonic()
+        for trip_id in trip_ids:
+            if trip_id in self._branches:
+                self._last_seen[trip_id] = now
+
+        expired = [trip_id for trip_id, last_seen in self._last_seen.items() if now - last_seen > self.ttl]
+        for trip_id in expired:
+            del self._branches[trip_id]
+            del self._last_seen[trip_id]
 
 
 class GTFSRealtime:
+    agency: AgencyConfig
+    route_set: RouteSet
+    unmapped_stop_ids: Counter
+    trip_branches: TripBranchCache
+    trip_updates_interval: float
+    trip_updates_fetched: int
+    trip_updates_skipped: int
+    stale: bool
+    header_cache_hits: int
+    header_cache_misses: int
+    feed_update_interval: Optional[float]
+    _header_timestamps: Dict[str, int]
+    _client: FeedClient
+    _train_positions: Optional[DataFrame]
+    _other_vehicles: Optional[OtherVehicles]
     _gtfs_rt_vehicle_positions: str
     _gtfs_rt_trip_updates: str
-    _stop_code_to_station_id_crosswalk: Series
+    _station_ids_by_stop_code: Dict[int, str]
+    _station_ids_by_stop_id: Dict[str, Optional[str]]
+    _trip_update_signatures: Dict[str, bytes]
+    _metrics: FeedMetrics
 
     def __init__(self,
-                 gtfs_rt_vehicle_positions_url: str,
-                 path_to_stop_code_to_station_id_crosswalk: str):
-        self._gtfs_rt_vehicle_positions = gtfs_rt_vehicle_positions_url
-        self._gtfs_rt_trip_updates = "https://cdn.mbta.com/realtime/TripUpdates.pb"  # TODO: add as param
+                 agency: AgencyConfig,
+                 path_to_stop_code_to_station_id_crosswalk: Union[str, Mapping[int, str], None] = None,
+                 trip_updates_interval: Optional[float] = None,
+                 client: Optional[FeedClient] = None,
+                 route_set: Optional[str] = None):
+        self._client = FeedClient() if client is None else client
+        self.agency = agency
+        self._metrics = FeedMetrics(agency.name)
+        # the agency's default route set unless another one of its route sets is named
+        self.route_set = agency.route_set(route_set)
+        self._gtfs_rt_vehicle_positions = agency.vehicle_positions_url
+        self._gtfs_rt_trip_updates = agency.trip_updates_url
+        if path_to_stop_code_to_station_id_crosswalk is None:
+            path_to_stop_code_to_station_id_crosswalk = agency.crosswalk
         self._vehicle_positions_feed = gtfs_realtime_pb2.FeedMessage()
         self._trip_updates_feed = gtfs_realtime_pb2.FeedMessage()
-        self._stop_code_to_station_id_crosswalk = read_csv(path_to_stop_code_to_station_id_crosswalk,
-                                                              index_col='stop_code')['station_id'].astype("category")
-
-    def _clean_vehicle_positions_df(self, vehicles_df: DataFrame):
-
-
-        # rename columns
-        clean_vehicles_df = vehicles_df.rename(columns=lambda column: column.split(".")[-1])
-
-        # keep only rapid transit route ids
-        rapid_transit_route_ids = ["Blue", "Red", "Orange", "Green-B", "Green-C", "Green-D", "Green-E"]
-        clean_vehicles_df = clean_vehicles_df.loc[clean_vehicles_df['route_id'].isin(rapid_transit_route_ids), :]
-
-        # make route ids lowercase
-        clean_vehicles_df.loc[:, 'route_id'] = clean_vehicles_df['route_id'].str.lower()
-
-        # drop 71199 stop ids
-        clean_vehicles_df = clean_vehicles_df.loc[clean_vehicles_df['stop_id'] != '71199', :]
-
-        # drop rows without information
-        clean_vehicles_df = clean_vehicles_df.dropna()
-
-        # rename
-        clean_vehicles_df = clean_vehicles_df.rename(columns={'stop_id': 'next_stop_id'})
-
-        return clean_vehicles_df
-
-    def _clean_trip_updates_df(self,
-                               trip_updates_df: DataFrame,
-                               routes_to_keep: List[str]):
-
-
-        # rename columns
-        clean_trip_updates_df = trip_updates_df.rename(columns=lambda column: column.split(".")[-1])
-
-        # keep only rapid transit route ids
-        rapid_transit_mask = clean_trip_updates_df['route_id'].isin(routes_to_keep)
-        clean_trip_updates_df = clean_trip_updates_df.loc[rapid_transit_mask, :]
-
-        # no longer need route id column
-        clean_trip_updates_df = clean_trip_updates_df.drop(columns='route_id')
-
-        # drop rows without information
-        clean_trip_updates_df = clean_trip_updates_df.dropna()
-
-        # convert stop_time_update, which is a column of lists, into a column of dicts by expanding rows
-        clean_trip_updates_df = clean_trip_updates_df.explode('stop_time_update')
-
-        # get sequence of stop_ids for each trip
-        stop_id = json_normalize(clean_trip_updates_df['stop_time_update'],
-                                    max_level=0)[['stop_id']]
-
-        # drop original stop_time_updates column
-        clean_trip_updates_df = clean_trip_updates_df.drop(columns='stop_time_update')
-
-        # add stop_id column
-        clean_trip_updates_df.loc[:, ['stop_id']] = stop_id.values
-
-        return clean_trip_updates_df
+        # the crosswalk is a CSV file, or a stop code -> station id mapping that was already loaded
+        if isinstance(path_to_stop_code_to_station_id_crosswalk, str):
+            self._station_ids_by_stop_code = read_csv(path_to_stop_code_to_station_id_crosswalk,
+                                                      index_col='stop_code')['station_id'].to_dict()
+        else:
+            self._station_ids_by_stop_code = dict(path_to_stop_code_to_station_id_crosswalk)
+        # raw stop id -> station id, grows as new raw stop ids are resolved
+        self._station_ids_by_stop_id = {str(stop_code): station_id
+                                        for stop_code, station_id in self._station_ids_by_stop_code.items()}
+        self.unmapped_stop_ids = Counter()
+        self.trip_branches = TripBranchCache()
+        # TripUpdates is only needed to classify the trips of new branched routes and for the arrival predictions, so
+        # it is fetched at most once per interval
+        self.trip_updates_interval = agency.trip_updates_interval if trip_updates_interval is None \
+            else trip_updates_interval
+        self.trip_updates_fetched = 0
+        self.trip_updates_skipped = 0
+        self._trip_updates_fetched_at = None
+        # bumped for every new TripUpdates message parsed, so that each consumer of it notices a new one
+        self._trip_updates_version = 0
+        self._classified_version = 0
+        self._arrivals_version = 0
+        # serialized trip update of each trip, to only decode the predictions of trips that changed
+        self._trip_update_signatures = {}
+        # last good result, served (flagged as stale) when the feed cannot be fetched
+        self._train_positions = None
+        self._other_vehicles = None
+        self.stale = False
+        # header timestamp of the last processed message of each feed; unchanged messages are not processed again
+        self._header_timestamps = {}
+        self.header_cache_hits = 0
+        self.header_cache_misses = 0
+        # moving average of the seconds between VehiclePositions updates, None until two updates have been seen
+        self.feed_update_interval = None
+
+    def _decode_vehicle_positions(self, feed: gtfs_realtime_pb2.FeedMessage
+                                  ) -> Tuple[DataFrame, Optional[OtherVehicles]]:
+        # walk the entities once, straight into pre-sized columns: complete vehicles of the schematic routes, and
+        # vehicles with a position of the geographic routes, which need nothing else
+        schematic_route_ids = self.route_set.schematic
+        geographic_prefixes = self.route_set.geographic
+        ignored_stop_ids = self.agency.ignored_stop_ids
+        n_entities = len(feed.entity)
+        ids = empty(n_entities, dtype=object)
+        trip_ids = empty(n_entities, dtype=object)
+        route_ids = empty(n_entities, dtype=object)
+        next_stop_ids = empty(n_entities, dtype=object)
+        current_statuses = empty(n_entities, dtype=int64)
+        direction_ids = empty(n_entities, dtype=int64)
+        longitudes = empty(n_entities, dtype=float64)
+        latitudes = empty(n_entities, dtype=float64)
+        timestamps = empty(n_entities, dtype=int64)
+        feed_timestamp = feed.header.timestamp
+        n_other = n_entities if geographic_prefixes else 0
+        other_ids = empty(n_other, dtype=object)
+        other_route_ids = empty(n_other, dtype=object)
+        other_statuses = empty(n_other, dtype=int64)
+        other_longitudes = empty(n_other, dtype=float64)
+        other_latitudes = empty(n_other, dtype=float64)
+
+        n_kept = 0
+        n_other = 0
+        for entity in feed.entity:
+            vehicle = entity.vehicle
+            trip = vehicle.trip
+            route_id = schematic_route_ids.get(trip.route_id)
+            if route_id is None:
+                if (geographic_prefixes and trip.route_id and trip.route_id.startswith(geographic_prefixes)
+                        and vehicle.HasField('position')):
+                    other_ids[n_other] = entity.id
+                    other_route_ids[n_other] = trip.route_id
+                    other_statuses[n_other] = vehicle.current_status
+                    other_longitudes[n_other] = vehicle.position.longitude
+                    other_latitudes[n_other] = vehicle.position.latitude
+                    n_other += 1
+                continue
+            # drop rows without information
+            if not (trip.HasField('trip_id') and trip.HasField('direction_id') and vehicle.HasField('stop_id')
+                    and vehicle.HasField('current_status') and vehicle.HasField('position')):
+                continue
+            stop_id = vehicle.stop_id
+            if stop_id in ignored_stop_ids:
+                continue
+
+            ids[n_kept] = entity.id
+            trip_ids[n_kept] = trip.trip_id
+            route_ids[n_kept] = route_id
+            next_stop_ids[n_kept] = stop_id
+            current_statuses[n_kept] = vehicle.current_status
+            direction_ids[n_kept] = trip.direction_id
+            longitudes[n_kept] = vehicle.position.longitude
+            latitudes[n_kept] = vehicle.position.latitude
+            # time of the position report, falling back to the time of the feed
+            timestamps[n_kept] = vehicle.timestamp or feed_timestamp
+            n_kept += 1
+
+        self._metrics.vehicles_filtered.inc(n_entities - n_kept - n_other)
+        self._metrics.vehicles_geographic.inc(n_other)
+        other_vehicles = None
+        if geographic_prefixes:
+            other_vehicles = OtherVehicles(ids=other_ids[:n_other],
+                                           route_ids=other_route_ids[:n_other],
+                                           current_status=other_statuses[:n_other],
+                                           longitude=other_longitudes[:n_other],
+                                           latitude=other_latitudes[:n_other])
+        return DataFrame({'id': ids[:n_kept],
+                          'trip_id': trip_ids[:n_kept],
+                          'route_id': route_ids[:n_kept],
+                          'next_stop_id': next_stop_ids[:n_kept],
+                          'current_status': current_statuses[:n_kept],
+                          'direction_id': direction_ids[:n_kept],
+                          'longitude': longitudes[:n_kept],
+                          'latitude': latitudes[:n_kept],
+                          'timestamp': timestamps[:n_kept]}), other_vehicles
+
+    def _classify_branched_trips(self, feed: gtfs_realtime_pb2.FeedMessage, trip_ids: Set[str]):
+        # only trips that are not cached yet get classified
+        for entity in feed.entity:
+            trip = entity.trip_update.trip
+            branches = self.agency.branches.get(self.route_set.schematic.get(trip.route_id))
+            if branches is None or trip.trip_id not in trip_ids:
+                continue
+            stop_time_updates = entity.trip_update.stop_time_update
+            if len(stop_time_updates) == 0:
+                continue
+            self.trip_branches.add(trip.trip_id, _branch(branches, stop_time_updates))
+
+    def _trip_updates_due(self) -> bool:
+        return (self._trip_updates_fetched_at is None or
+                monotonic() - self._trip_updates_fetched_at >= self.trip_updates_interval)
+
+    def _should_fetch_trip_updates(self, unclassified_trip_ids: Set[str]) -> bool:
+        # a skip is only counted when it is what spared a fetch: a fetch was due but every trip is classified already,
+        # or new trips wait for the next interval with no newer message, like one fetched for the arrivals, to use
+        due = self._trip_updates_due()
+        if unclassified_trip_ids and due:
+            return True
+        if not unclassified_trip_ids and due:
+            self._skip_trip_updates("classified")
+        elif unclassified_trip_ids and self._classified_version == self._trip_updates_version:
+            self._skip_trip_updates("interval")
+        return False
+
+    def _skip_trip_updates(self, reason: str):
+        self.trip_updates_skipped += 1
+        self._metrics.trip_updates_skipped[reason].inc()
+
+    def _fetch_trip_updates(self, reason: str):
+        # on a 304 or a failed fetch, the last TripUpdates message that was parsed stays in use
+        self.trip_updates_fetched += 1
+        self._metrics.trip_updates_fetched[reason].inc()
+        self._trip_updates_fetched_at = monotonic()
+        trip_updates_response = self._fetch(self._gtfs_rt_trip_updates)
+        if trip_updates_response is None or trip_updates_response.not_modified:
+            return
+        with self._metrics.parse_seconds.time():
+            self._trip_updates_feed.ParseFromString(trip_updates_response.content)
+        if self._is_new_message(self._gtfs_rt_trip_updates, self._trip_updates_feed):
+            self._trip_updates_version += 1
+
+    def get_trip_arrivals(self) -> Optional[Tuple[Dict[str, TripArrivals], List[str]]]:
+        """Predicted arrivals of the trips on the schematic that changed since the last call, and the trips that ended.
+
+        TripUpdates is fetched at most once per ``trip_updates_interval``, shared with the classification of the trips
+        of branched routes. Returns None when there is no new message since the last call; otherwise only the trips
+        whose update changed are decoded again.
+        """
+        if self._trip_updates_due():
+            self._fetch_trip_updates("arrivals")
+        if self._trip_updates_version == self._arrivals_version:
+            return None
+        self._arrivals_version = self._trip_updates_version
+        with self._metrics.arrivals_decode_seconds.time():
+            return self._decode_trip_arrivals(self._trip_updates_feed)
+
+    def _decode_trip_arrivals(self, feed: gtfs_realtime_pb2.FeedMessage
+                              ) -> Tuple[Dict[str, TripArrivals], List[str]]:
+        changed = {}
+        signatures = {}
+        skipped = gtfs_realtime_pb2.TripUpdate.StopTimeUpdate.SKIPPED
+        for entity in feed.entity:
+            trip_update = entity.trip_update
+            trip = trip_update.trip
+            route_id = self.route_set.schematic.get(trip.route_id)
+            if route_id is None or not trip.trip_id:
+                continue
+            signature = signatures[trip.trip_id] = trip_update.SerializeToString()
+            if self._trip_update_signatures.get(trip.trip_id) == signature:
+                continue
+
+            station_ids, times = [], []
+            for stop_time_update in trip_update.stop_time_update:
+                # the first stop of a trip only has a departure
+                event = stop_time_update.arrival if stop_time_update.HasField('arrival') else stop_time_update.departure
+                station_id = self._station_id(stop_time_update.stop_id)
+                if stop_time_update.schedule_relationship == skipped or not event.time or station_id is None:
+                    continue
+                station_ids.append(station_id)
+                times.append(event.time)
+            branches = self.agency.branches.get(route_id)
+            if branches is not None:
+                route_id = self.trip_branches.get(trip.trip_id) or _branch(branches, trip_update.stop_time_update)
+            changed[trip.trip_id] = TripArrivals(route_id, station_ids, times)
+        ended = [trip_id for trip_id in self._trip_update_signatures if trip_id not in signatures]
+        self._trip_update_signatures = signatures
+        return changed, ended
+
+    def _station_id(self, stop_id: str) -> Optional[str]:
+        # station of a raw stop id, None if it is unknown
+        if stop_id not in self._station_ids_by_stop_id:
+            self._station_ids_by_stop_id[stop_id] = self._station_ids_by_stop_code.get(
+                _clean_stop_code(stop_id, self.agency.stop_aliases))
+        return self._station_ids_by_stop_id[stop_id]
+
+    def _normalize_stop_ids(self, stop_ids: Series) -> ndarray:
+        # resolve each distinct raw stop id once, then broadcast the results back over the column
+        stop_id_codes, unique_stop_ids = factorize(stop_ids)
+        station_ids = empty(len(unique_stop_ids), dtype=object)
+        for i, stop_id in enumerate(unique_stop_ids):
+            station_ids[i] = self._station_id(stop_id)
+        station_ids = station_ids[stop_id_codes]
+
+        unmapped = isna(station_ids)
+        if unmapped.any():
+            self.unmapped_stop_ids.update(stop_ids[unmapped])
+            self._metrics.vehicles_unmapped.inc(int(unmapped.sum()))
+        return station_ids
+
+    @property
+    def other_vehicles(self) -> Optional[OtherVehicles]:
+        # vehicles of the geographic layer in the last vehicle positions message, None without a geographic layer
+        return self._other_vehicles
+
+    @property
+    def feed_timestamp(self) -> int:
+        # POSIX time of the last vehicle positions message that was parsed
+        return self._vehicle_positions_feed.header.timestamp
+
+    @property
+    def header_cache_hit_rate(self) -> float:
+        lookups = self.header_cache_hits + self.header_cache_misses
+        return self.header_cache_hits / lookups if lookups else 0.0
+
+    def _is_new_message(self, url: str, feed: gtfs_realtime_pb2.FeedMessage) -> bool:
+        timestamp = feed.header.timestamp
+        previous_timestamp = self._header_timestamps.get(url)
+        if timestamp and timestamp == previous_timestamp:
+            self.header_cache_hits += 1
+            self._metrics.header_cache_hits.inc()
+            return False
+        self.header_cache_misses += 1
+        self._metrics.header_cache_misses.inc()
+        self._header_timestamps[url] = timestamp
+        if url == self._gtfs_rt_vehicle_positions and timestamp and previous_timestamp:
+            interval = timestamp - previous_timestamp
+            self.feed_update_interval = (interval if self.feed_update_interval is None
+                                         else 0.8 * self.feed_update_interval + 0.2 * interval)
+        return True
+
+    def _fetch(self, url: str) -> Optional[FeedResponse]:
+        name = feed_name(url)
+        started_at = perf_counter()
+        try:
+            response = self._client.fetch(url)
+        except RequestException:
+            logger.warning("Could not fetch %s.", url, exc_info=True)
+            self._metrics.fetch_counter(name, "error").inc()
+            return None
+        self._metrics.fetch_seconds(name).observe(perf_counter() - started_at)
+        self._metrics.fetch_counter(name, "not_modified" if response.not_modified else "ok").inc()
+        if not response.not_modified:
+            self._metrics.fetched_bytes(name).observe(len(response.content))
+        return response
 
     def get_train_positions(self):
-        vehicle_positions_response = get(self._gtfs_rt_vehicle_positions)
-        self._vehicle_positions_feed.ParseFromString(vehicle_positions_response.content)
-        columns_to_keep = ['id', 'vehicle.trip.trip_id', 'vehicle.trip.route_id', 'vehicle.stop_id',
-                           'vehicle.current_status', 'vehicle.trip.direction_id', 'vehicle.position.longitude',
-                           'vehicle.position.latitude']
-        vehicle_positions_df = json_normalize(protobuf_to_dict(self._vehicle_positions_feed)['entity'])[columns_to_keep]
-        vehicle_positions_df = self._clean_vehicle_positions_df(vehicle_positions_df).set_index(
-            'trip_id')
-        trip_updates_response = get(self._gtfs_rt_trip_updates)
-        self._trip_updates_feed.ParseFromString(trip_updates_response.content)
-        columns_to_keep = ['trip_update.trip.trip_id',
-                           'trip_update.stop_time_update',
-                           'trip_update.trip.route_id']
-        trip_updates_df = json_normalize(protobuf_to_dict(self._trip_updates_feed)['entity'])[columns_to_keep]
-
-        routes_to_keep = ["Red"]
-        trip_updates_df = self._clean_trip_updates_df(trip_updates_df, routes_to_keep)
-        red_line_a_station_codes = ['334', '70093', '70094', '70261', '70091', '70092', '323', '70089', '70090',
-                                    '70087', '70088']
-        # true if red-a, false if red-b
-        red_line_trips = (trip_updates_df
-                          .groupby('trip_id')['stop_id']
-                          .agg(lambda group: group.isin(red_line_a_station_codes).any()))
-        red_a_trips = Series(red_line_trips.loc[red_line_trips].index)
-        red_a_trips = red_a_trips.loc[red_a_trips.isin(vehicle_positions_df.index)]
-        red_b_trips = Series(red_line_trips.loc[~red_line_trips].index)
-        red_b_trips = red_b_trips.loc[red_b_trips.isin(vehicle_positions_df.index)]
-
-        vehicle_positions_df.loc[red_a_trips, 'route_id'] = 'red-a'
-        vehicle_positions_df.loc[red_b_trips, 'route_id'] = 'red-b'
-        vehicle_positions_df = vehicle_positions_df.loc[vehicle_positions_df['route_id'] != 'red']
-
-        vehicle_positions_df.loc[vehicle_positions_df['next_stop_id'].str.contains("Oak Grove",
-                                                                                   regex=False,
-                                                                                   na=False), 'next_stop_id'] = 70036
-        vehicle_positions_df.loc[vehicle_positions_df['next_stop_id'].str.contains("Braintree",
-                                                                                   regex=False,
-                                                                                   na=False), 'next_stop_id'] = 38671
-        vehicle_positions_df.loc[vehicle_positions_df['next_stop_id'].str.contains("Alewife",
-                                                                                   regex=False,
-                                                                                   na=False), 'next_stop_id'] = 141
-        vehicle_positions_df.loc[vehicle_positions_df['next_stop_id'].str.contains("Forest Hills",
-                                                                                   regex=False,
-                                                                                   na=False), 'next_stop_id'] = 10642
-        vehicle_positions_df.loc[vehicle_positions_df['next_stop_id'].str.contains("Union Square",
-                                                                                   regex=False,
-                                                                                   na=False), 'next_stop_id'] = 70503
-
-        vehicle_positions_df.loc[:, 'next_stop_id'] = vehicle_positions_df['next_stop_id'].astype(int)
-        vehicle_positions_df.loc[:, 'next_station_id'] = self._stop_code_to_station_id_crosswalk[
-            vehicle_positions_df['next_stop_id']].values
+        vehicle_positions_response = self._fetch(self._gtfs_rt_vehicle_positions)
+        if (vehicle_positions_response is not None and vehicle_positions_response.not_modified
+                and self._train_positions is None):
+            # the message the client's validators stand for was never turned into positions, e.g. processing it
+            # failed, so fetch it again in full
+            self._client.forget(self._gtfs_rt_vehicle_positions)
+            vehicle_positions_response = self._fetch(self._gtfs_rt_vehicle_positions)
+        if vehicle_positions_response is None:
+            if self._train_positions is None:
+                raise ConnectionError(f"Could not fetch {self._gtfs_rt_vehicle_positions}.")
+            self.stale = True
+            return self._train_positions
+        if vehicle_positions_response.not_modified:
+            if self._train_positions is None:
+                raise ConnectionError(f"{self._gtfs_rt_vehicle_positions} was not modified, and there are no "
+                                      "positions from it yet.")
+            self.stale = False
+            return self._train_positions
+        self.stale = False
+        with self._metrics.parse_seconds.time():
+            self._vehicle_positions_feed.ParseFromString(vehicle_positions_response.content)
+        if (not self._is_new_message(self._gtfs_rt_vehicle_positions, self._vehicle_positions_feed)
+                and self._train_positions is not None):
+            return self._train_positions
+        with self._metrics.decode_seconds.time():
+            vehicle_positions_df, self._other_vehicles = self._decode_vehicle_positions(self._vehicle_positions_feed)
+            vehicle_positions_df = vehicle_positions_df.set_index('trip_id')
+        with self._metrics.clean_seconds.time():
+            vehicle_positions_df = self._clean_vehicle_positions(vehicle_positions_df)
+        self._train_positions = vehicle_positions_df
+        return vehicle_positions_df
 
+    def _clean_vehicle_positions(self, vehicle_positions_df: DataFrame) -> DataFrame:
+        branched_mask = vehicle_positions_df['route_id'].isin(list(self.agency.branches)).to_numpy()
+        branched_trip_ids = vehicle_positions_df.index[branched_mask]
+        self.trip_branches.touch(branched_trip_ids)
+        unclassified_trip_ids = {trip_id for trip_id in branched_trip_ids if trip_id not in self.trip_branches}
+        fetched = self._should_fetch_trip_updates(unclassified_trip_ids)
+        if fetched:
+            self._fetch_trip_updates("branches")
+        # a message parsed for the arrival predictions may classify the new trips without fetching again
+        if unclassified_trip_ids and (fetched or self._classified_version != self._trip_updates_version):
+            self._classified_version = self._trip_updates_version
+            self._classify_branched_trips(self._trip_updates_feed, unclassified_trip_ids)
+
+        # split the branched routes into their branches; trips that could not be classified are dropped
+        vehicle_positions_df.loc[branched_mask, 'route_id'] = [self.trip_branches.get(trip_id)
+                                                                for trip_id in branched_trip_ids]
+        classified = notna(vehicle_positions_df['route_id']).to_numpy()
+        self._metrics.vehicles_unclassified.inc(int((~classified).sum()))
+        vehicle_positions_df = vehicle_positions_df.loc[classified]
+
+        # map raw stop ids to station ids, dropping trains whose stop id is unknown
+        next_station_ids = self._normalize_stop_ids(vehicle_positions_df['next_stop_id'])
         vehicle_positions_df = vehicle_positions_df.drop(columns='next_stop_id')
-
+        vehicle_positions_df.loc[:, 'next_station_id'] = next_station_ids
+        vehicle_positions_df = vehicle_positions_df.loc[notna(next_station_ids)]
+        self._metrics.vehicles_kept.inc(len(vehicle_positions_df))
         return vehicle_positions_df
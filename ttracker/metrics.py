@@ -0,0 +1,197 @@
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# upper bounds, in seconds, of the latency buckets; the pipeline stages range from tens of microseconds to seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# upper bounds, in bytes, of the payload size buckets
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 131072, 262144, 524288, 1048576, 2097152, 4194304, 8388608)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """A value that only goes up, e.g. the number of bytes fetched. Its family is rendered with a ``_total`` suffix."""
+    kind = "counter"
+    labels: Tuple[Tuple[str, str], ...]
+
+    def __init__(self, labels: Tuple[Tuple[str, str], ...] = ()):
+        self.labels = labels
+        self.value = 0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str) -> List[str]:
+        return [f"{name}{_format_labels(self.labels)} {_format_value(self.value)}"]
+
+
+class Gauge:
+    """A value read from ``function`` whenever the metrics are scraped, so it costs nothing on the hot path."""
+    kind = "gauge"
+    labels: Tuple[Tuple[str, str], ...]
+
+    def __init__(self, function: Callable[[], Optional[float]], labels: Tuple[Tuple[str, str], ...] = ()):
+        self.labels = labels
+        self._function = function
+
+    def samples(self, name: str) -> List[str]:
+        value = self._function()
+        if value is None:
+            return []
+        return [f"{name}{_format_labels(self.labels)} {_format_value(value)}"]
+
+
+class FunctionCounter(Gauge):
+    """A counter read from ``function`` whenever the metrics are scraped, for a total kept elsewhere, e.g. the CPU time
+    of the process."""
+    kind = "counter"
+
+
+class Histogram:
+    """Counts observations into cumulative buckets, e.g. the latency of a pipeline stage.
+
+    ``time()`` measures a block of code::
+
+        with DECODE_SECONDS.time():
+            ...
+    """
+    kind = "histogram"
+    labels: Tuple[Tuple[str, str], ...]
+    buckets: Tuple[float, ...]
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS, labels: Tuple[Tuple[str, str], ...] = ()):
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # one count per bucket plus one for observations above the largest bound; made cumulative when scraped
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[bucket] += 1
+            self._sum += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def samples(self, name: str) -> List[str]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = self.labels + (("le", _format_value(bound)),)
+            samples.append(f"{name}_bucket{_format_labels(labels)} {cumulative}")
+        samples.append(f"{name}_sum{_format_labels(self.labels)} {_format_value(total)}")
+        samples.append(f"{name}_count{_format_labels(self.labels)} {cumulative}")
+        return samples
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_started_at")
+
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started_at = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(perf_counter() - self._started_at)
+
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text exposition format.
+
+    Metrics are registered by name and label values; asking for the same combination again returns the same metric,
+    so modules can declare the metrics they update at import time.
+    """
+    _families: Dict[str, Tuple[str, str]]
+    _metrics: Dict[str, Dict[Tuple[Tuple[str, str], ...], object]]
+
+    def __init__(self):
+        self._families = {}
+        self._metrics = {}
+        self._lock = Lock()
+
+    def _get(self, kind: str, name: str, documentation: str, labels: Dict[str, str], create: Callable):
+        label_items = tuple(sorted((key, str(value)) for key, value in labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, documentation))
+            if family[0] != kind:
+                raise ValueError(f"{name} is already registered as a {family[0]}.")
+            metrics = self._metrics.setdefault(name, {})
+            if label_items not in metrics:
+                metrics[label_items] = create(label_items)
+            return metrics[label_items]
+
+    def counter(self, name: str, documentation: str, **labels: str) -> Counter:
+        return self._get("counter", name, documentation, labels, lambda label_items: Counter(label_items))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  **labels: str) -> Histogram:
+        return self._get("histogram", name, documentation, labels,
+                         lambda label_items: Histogram(buckets, label_items))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], Optional[float]], **labels: str) -> Gauge:
+        # registering a gauge again replaces the function it reads from
+        return self._set_function(Gauge, name, documentation, function, labels)
+
+    def function_counter(self, name: str, documentation: str, function: Callable[[], Optional[float]],
+                         **labels: str) -> FunctionCounter:
+        # like a gauge, but for a value that only goes up
+        return self._set_function(FunctionCounter, name, documentation, function, labels)
+
+    def _set_function(self, metric_class, name: str, documentation: str, function: Callable[[], Optional[float]],
+                      labels: Dict[str, str]):
+        label_items = tuple(sorted((key, str(value)) for key, value in labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (metric_class.kind, documentation))
+            if family[0] != metric_class.kind:
+                raise ValueError(f"{name} is already registered as a {family[0]}.")
+            metric = self._metrics.setdefault(name, {})[label_items] = metric_class(function, label_items)
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            families = [(name, kind, documentation, list(self._metrics[name].values()))
+                        for name, (kind, documentation) in sorted(self._families.items())]
+        lines = []
+        for name, kind, documentation, metrics in families:
+            # the samples of a counter, and so its family, are named with a _total suffix
+            if kind == "counter":
+                name = f"{name}_total"
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in metrics:
+                lines.extend(metric.samples(name))
+        return "\n".join(lines) + "\n"
+
+
+# the registry that the ttracker modules record into and that the app serves on /metrics
+REGISTRY = Registry()
+
+
+def stage_timer(stage: str, agency: str) -> Histogram:
+    return REGISTRY.histogram("ttracker_stage_seconds", "Time spent in each stage of a train update.", stage=stage,
+                              agency=agency)
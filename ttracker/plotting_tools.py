@@ -1,120 +1,208 @@
+from json import loads
+from typing import NamedTuple, Optional
+
+from numpy import cos, empty, radians
 import pandas as pd
 import plotly.graph_objects as go
 
 
-def plot_map(style: str,
-             figure: go.Figure,
-             links_df: pd.DataFrame,
-             stations_df: pd.DataFrame,
-             charles_river_df: pd.DataFrame):
-    if style == "mbta":
-
-        # Add charles river
-        figure.add_trace(
-            go.Scatter(
-                x=charles_river_df['x'],
-                y=charles_river_df['y1'],
-                mode='lines',
-                line=dict(color='rgb(145,193,217)'),
-                showlegend=False,
-                hoverinfo='none'
-            ))
-        figure.add_trace(go.Scatter(
-            x=charles_river_df['x'],
-            y=charles_river_df['y2'],
+class FrozenFigure(NamedTuple):
+    payload: dict
+    json: str
+
+
+def _join_segments(starts: pd.Series, ends: pd.Series):
+    # [start_0, end_0, None, start_1, end_1, None, ...] draws every segment without connecting them
+    joined = empty(3 * len(starts), dtype=object)
+    joined[0::3] = starts.values
+    joined[1::3] = ends.values
+    return joined
+
+
+def freeze_figure(figure: go.Figure) -> FrozenFigure:
+    # serialize once; the payload holds only plain python values, so re-encoding it later is cheap
+    figure_json = figure.to_json()
+    return FrozenFigure(loads(figure_json), figure_json)
+
+
+def thaw_figure(figure_json: str) -> FrozenFigure:
+    # the inverse of freeze_figure, for a figure that was serialized ahead of time
+    return FrozenFigure(loads(figure_json), figure_json)
+
+
+def build_base_map(links_df: pd.DataFrame, stations_df: pd.DataFrame, style: str,
+                   background_df: Optional[pd.DataFrame] = None) -> go.Figure:
+    figure = go.Figure(layout={'dragmode': False})
+    plot_map(style, figure, links_df, stations_df, background_df)
+    # empty train trace, drawn on top of the static map; only this trace is ever updated
+    figure.add_trace(
+        go.Scatter(
+            x=[],
+            y=[],
+            mode='markers',
+            marker=dict(color=[], size=5, line=dict(
+                        color='black',  # Outline color
+                        width=1  # Outline width
+                    )),
+            name='Trains',
+            text=[],
+            hoverinfo='text',
+            showlegend=False
+        )
+    )
+    return figure
+
+
+def build_geographic_map(station_positions_map) -> go.Figure:
+    """Map of the vehicles that are not on the schematic, by longitude and latitude.
+
+    The rapid transit stations are drawn in grey for reference. The vehicle trace is drawn last and starts out empty;
+    only this trace is ever updated.
+    """
+    figure = go.Figure(layout={'dragmode': 'pan'})
+    figure.add_trace(go.Scattergl(x=station_positions_map[:, 0], y=station_positions_map[:, 1], mode='markers',
+                                  marker=dict(color='lightgrey', size=6), hoverinfo='none', showlegend=False,
+                                  name='Stations'))
+    figure.add_trace(go.Scattergl(x=[], y=[], mode='markers', marker=dict(color=[], size=5), text=[],
+                                  hoverinfo='text', showlegend=False, name='Vehicles'))
+    hidden_axis = dict(showgrid=False, zeroline=False, showline=False, showticklabels=False)
+    figure.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        xaxis=hidden_axis,
+        # a degree of longitude is shorter than one of latitude by the cosine of the latitude
+        yaxis=dict(hidden_axis, scaleanchor='x',
+                   scaleratio=1 / cos(radians(station_positions_map[:, 1].mean()))),
+        plot_bgcolor='white'
+    )
+    return figure
+
+
+def describe_figure(frozen_figure: FrozenFigure) -> dict:
+    layout = frozen_figure.payload.get('layout', {})
+    return {'traces': len(frozen_figure.payload.get('data', [])),
+            'shapes': len(layout.get('shapes', [])),
+            'bytes': len(frozen_figure.json.encode())}
+
+
+def _plot_charles_river(figure: go.Figure, background_df: pd.DataFrame):
+    # the MBTA's background: the Charles river between its banks, y1 and y2, and its basin
+    figure.add_trace(
+        go.Scatter(
+            x=background_df['x'],
+            y=background_df['y1'],
             mode='lines',
-            fill='tonexty',  # Fills between y2 and the previous trace (y1)
             line=dict(color='rgb(145,193,217)'),
-            fillcolor='rgb(145,193,217)',
             showlegend=False,
             hoverinfo='none'
         ))
+    figure.add_trace(go.Scatter(
+        x=background_df['x'],
+        y=background_df['y2'],
+        mode='lines',
+        fill='tonexty',  # Fills between y2 and the previous trace (y1)
+        line=dict(color='rgb(145,193,217)'),
+        fillcolor='rgb(145,193,217)',
+        showlegend=False,
+        hoverinfo='none'
+    ))
+
+    # Add a triangle using a custom SVG path
+    figure.add_shape(
+        type="path",
+        path="M 214 150 L 214 93 L 272 150 Z",  # Define the triangle (M = move, L = line, Z = close path)
+        line=dict(color='rgb(145,193,217)', width=2),  # Outline color and width
+        fillcolor='rgb(145,193,217)'
+    )
 
-        # Add a triangle using a custom SVG path
-        figure.add_shape(
-            type="path",
-            path="M 214 150 L 214 93 L 272 150 Z",  # Define the triangle (M = move, L = line, Z = close path)
-            line=dict(color='rgb(145,193,217)', width=2),  # Outline color and width
-            fillcolor='rgb(145,193,217)'
-        )
-
-        figure.add_shape(
-            # Second rectangle
-            type="rect",
-            x0=211, x1=214,  # x-coordinates of the rectangle
-            y0=50, y1=150,  # y-coordinates of the rectangle
-            line=dict(color='rgb(145,193,217)', width=3),
-            fillcolor='rgb(145,193,217)',
-            layer='below'
-        )
-
-        # Add a triangle using a custom SVG path
-        figure.add_shape(
-            type="path",
-            path="M 211 50 L 272 50 L 272 -10 Z",  # Define the triangle (M = move, L = line, Z = close path)
-            line=dict(color='rgb(145,193,217)', width=2),  # Outline color and width
-            fillcolor='rgb(145,193,217)'
-        )
-
-        figure.add_shape(
-            # Second rectangle
-            type="rect",
-            x0=211, x1=272,  # x-coordinates of the rectangle
-            y0=50, y1=75,  # y-coordinates of the rectangle
-            line=dict(color='rgb(145,193,217)', width=3),
-            fillcolor='rgb(145,193,217)'
-        )
-
-        figure.add_shape(
-            # Second rectangle
-            type="rect",
-            x0=190, x1=214,  # x-coordinates of the rectangle
-            y0=147, y1=150,  # y-coordinates of the rectangle
-            line=dict(color='rgb(145,193,217)', width=3),
-            fillcolor='rgb(145,193,217)',
-            layer='below'
-        )
+    figure.add_shape(
+        # Second rectangle
+        type="rect",
+        x0=211, x1=214,  # x-coordinates of the rectangle
+        y0=50, y1=150,  # y-coordinates of the rectangle
+        line=dict(color='rgb(145,193,217)', width=3),
+        fillcolor='rgb(145,193,217)',
+        layer='below'
+    )
 
-        figure.add_shape(
-            # Second rectangle
-            type="rect",
-            x0=190, x1=192,  # x-coordinates of the rectangle
-            y0=147, y1=160,  # y-coordinates of the rectangle
-            line=dict(color='rgb(145,193,217)', width=3),
-            fillcolor='rgb(145,193,217)',
-            layer='below'
-        )
+    # Add a triangle using a custom SVG path
+    figure.add_shape(
+        type="path",
+        path="M 211 50 L 272 50 L 272 -10 Z",  # Define the triangle (M = move, L = line, Z = close path)
+        line=dict(color='rgb(145,193,217)', width=2),  # Outline color and width
+        fillcolor='rgb(145,193,217)'
+    )
 
-        for link in links_df.loc[links_df['direction'] == 0].to_dict('records'):
-            link = go.Scatter(x=[link['x_source'], link['x_target']],
-                              y=[link['y_source'], link['y_target']],
-                              mode='lines',
-                              line=dict(color='grey', width=6),
-                              showlegend=False,
-                              name=f"{link['source_station_id']}_to_{link['target_station_id']}")
-            figure.add_trace(link)
+    figure.add_shape(
+        # Second rectangle
+        type="rect",
+        x0=211, x1=272,  # x-coordinates of the rectangle
+        y0=50, y1=75,  # y-coordinates of the rectangle
+        line=dict(color='rgb(145,193,217)', width=3),
+        fillcolor='rgb(145,193,217)'
+    )
 
-            # Add stations
-            figure.add_trace(
-                go.Scatter(
-                    x=stations_df['x'],
-                    y=stations_df['y'],
-                    mode='markers',
-                    text=list(stations_df['name']),
-                    hoverinfo='text',
-                    textposition='top left',
-                    marker=dict(color='grey', size=10),
-                    showlegend=False,
-                    name='Stations'
-                )
-            )
+    figure.add_shape(
+        # Second rectangle
+        type="rect",
+        x0=190, x1=214,  # x-coordinates of the rectangle
+        y0=147, y1=150,  # y-coordinates of the rectangle
+        line=dict(color='rgb(145,193,217)', width=3),
+        fillcolor='rgb(145,193,217)',
+        layer='below'
+    )
 
+    figure.add_shape(
+        # Second rectangle
+        type="rect",
+        x0=190, x1=192,  # x-coordinates of the rectangle
+        y0=147, y1=160,  # y-coordinates of the rectangle
+        line=dict(color='rgb(145,193,217)', width=3),
+        fillcolor='rgb(145,193,217)',
+        layer='below'
+    )
 
 
+# what each style draws below the routes and stations, from the background data of the agency
+MAP_STYLES = {"mbta": _plot_charles_river,
+              "schematic": None}
 
 
-    else:
-        raise ValueError("Style argument must be \"mbta\".")
+def plot_map(style: str,
+             figure: go.Figure,
+             links_df: pd.DataFrame,
+             stations_df: pd.DataFrame,
+             background_df: Optional[pd.DataFrame] = None):
+    if style not in MAP_STYLES:
+        raise ValueError(f"Style argument must be one of {', '.join(map(repr, MAP_STYLES))}.")
+    if MAP_STYLES[style] is not None and background_df is not None:
+        MAP_STYLES[style](figure, background_df)
+
+    # one trace per route, with the route's links joined into a single None-separated polyline
+    self_links = links_df['source_station_id'].astype(str) == links_df['target_station_id'].astype(str)
+    links_to_draw = links_df.loc[(links_df['direction'] == 0) & ~self_links]
+    for route_id, route_links in links_to_draw.groupby('route_id', sort=False, observed=True):
+        figure.add_trace(go.Scatter(x=_join_segments(route_links['x_source'], route_links['x_target']),
+                                    y=_join_segments(route_links['y_source'], route_links['y_target']),
+                                    mode='lines',
+                                    line=dict(color='grey', width=6),
+                                    hoverinfo='none',
+                                    showlegend=False,
+                                    name=str(route_id)))
+
+    # Add stations
+    figure.add_trace(
+        go.Scatter(
+            x=stations_df['x'],
+            y=stations_df['y'],
+            mode='markers',
+            text=list(stations_df['name']),
+            hoverinfo='text',
+            textposition='top left',
+            marker=dict(color='grey', size=10),
+            showlegend=False,
+            name='Stations'
+        )
+    )
 
     figure.update_layout(
         margin=dict(l=0, r=0, t=0, b=0),
@@ -0,0 +1,132 @@
+import logging
+from threading import Condition, Event, Lock, Thread
+from time import time
+from typing import Any, Callable, NamedTuple, Optional
+
+from numpy import ndarray
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot(NamedTuple):
+    version: int
+    created_at: float
+    data: Any
+    stale: bool
+    # data as served, rendered once when the snapshot is published rather than by every reader
+    rendered: Any = None
+
+
+def _freeze(data: Any):
+    # readers share the same arrays, so make sure none of them can modify the snapshot in place
+    if isinstance(data, ndarray):
+        data.setflags(write=False)
+    elif isinstance(data, tuple):
+        for item in data:
+            _freeze(item)
+    return data
+
+
+class Poller:
+    """Runs ``refresh`` on a background thread and publishes its result as an immutable snapshot.
+
+    Only the poller thread ever calls ``refresh``, so the number of upstream fetches is independent of the number of
+    readers. Readers always get the most recently published snapshot, including while a refresh is in progress.
+    Publishing replaces a single reference to a snapshot that is never modified afterwards, so reading one takes no
+    lock, and everything a reader needs, including ``render``'s output, is consistent with the rest of its snapshot.
+    """
+    interval: float
+    max_interval: float
+    _refresh: Callable[[], Any]
+    _is_stale: Callable[[], bool]
+    _update_interval: Callable[[], Optional[float]]
+    _render: Optional[Callable[[Any], Any]]
+    _snapshot: Optional[Snapshot]
+
+    def __init__(self,
+                 refresh: Callable[[], Any],
+                 interval: float = 3.0,
+                 is_stale: Callable[[], bool] = lambda: False,
+                 update_interval: Callable[[], Optional[float]] = lambda: None,
+                 max_interval: float = 15.0,
+                 render: Optional[Callable[[Any], Any]] = None):
+        self.interval = interval
+        self.max_interval = max_interval
+        self._update_interval = update_interval
+        self._refresh = refresh
+        self._render = render
+        self._is_stale = is_stale
+        self._snapshot = None
+        self._ready = Event()
+        self._published = Condition()
+        self._stopped = Event()
+        self._refresh_lock = Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name="ttracker-poller", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def refresh(self) -> Optional[Snapshot]:
+        # single flight: a refresh requested while another is running waits for it instead of fetching again
+        with self._refresh_lock:
+            data = self._refresh()
+            if data is None:
+                # nothing to publish yet, keep the previous snapshot
+                return self._snapshot
+            stale = self._is_stale()
+            previous = self._snapshot
+            if previous is not None and data is previous.data and stale == previous.stale:
+                # the source had nothing new, so subscribers already have this snapshot
+                return previous
+            data = _freeze(data)
+            rendered = None if self._render is None else self._render(data)
+            version = 1 if previous is None else previous.version + 1
+            self._snapshot = Snapshot(version, time(), data, stale, rendered)
+            self._ready.set()
+            with self._published:
+                self._published.notify_all()
+            return self._snapshot
+
+    def latest(self, timeout: Optional[float] = None) -> Optional[Snapshot]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self._ready.wait(timeout)
+            snapshot = self._snapshot
+        return snapshot
+
+    def wait_for_newer(self, version: int, timeout: Optional[float] = None) -> Optional[Snapshot]:
+        # the first snapshot published after ``version``, or the latest one if none is within timeout
+        with self._published:
+            self._published.wait_for(lambda: self._snapshot is not None and self._snapshot.version > version,
+                                     timeout)
+        return self._snapshot
+
+    def tick(self) -> float:
+        # one refresh, as the poller thread or a RefreshScheduler runs it, and the seconds until the next one
+        try:
+            self.refresh()
+        except Exception:
+            # keep serving the previous snapshot; the next tick will try again
+            logger.exception("Feed refresh failed.")
+        return self.next_wait()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._stopped.wait(self.tick())
+
+    def next_wait(self) -> float:
+        # poll twice per observed source update, but never faster than interval or slower than max_interval
+        update_interval = self._update_interval()
+        if update_interval is None:
+            return self.interval
+        return min(max(update_interval / 2, self.interval), self.max_interval)
@@ -0,0 +1,196 @@
+import os
+import struct
+import zlib
+from bisect import bisect_right
+from glob import glob
+from threading import Lock
+from time import monotonic, time
+from typing import BinaryIO, Dict, List, NamedTuple, Optional
+from urllib.parse import urlparse
+
+from ttracker.feed_client import FeedClient, FeedResponse
+
+# every record is this header, then the feed name, then the zlib-compressed payload
+_RECORD_HEADER = struct.Struct("<dHI")  # recorded at (POSIX time), name length, payload length
+_CHUNK_PATTERN = "chunk-{:06d}.log"
+
+
+def feed_name(url: str) -> str:
+    # feeds are recorded and replayed by the last part of their URL, e.g. "VehiclePositions.pb"
+    return os.path.basename(urlparse(url).path) or url
+
+
+class FeedRecorder:
+    """Appends raw feed payloads to a log of compressed records, split into chunks of about ``chunk_size`` bytes.
+
+    Each recorder starts a chunk of its own, so that a record cut off by a recorder that died while writing it stays at
+    the end of its chunk, where readers skip it.
+    """
+    directory: str
+    chunk_size: int
+    _file: Optional[BinaryIO]
+
+    def __init__(self, directory: str, chunk_size: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+        chunks = sorted(glob(os.path.join(directory, "chunk-*.log")))
+        self._chunk_number = int(os.path.basename(chunks[-1])[len("chunk-"):-len(".log")]) + 1 if chunks else 0
+        self._file = None
+        self._lock = Lock()
+
+    def _open_chunk(self):
+        path = os.path.join(self.directory, _CHUNK_PATTERN.format(self._chunk_number))
+        self._file = open(path, 'ab')
+        if self._file.tell() >= self.chunk_size:
+            self._file.close()
+            self._chunk_number += 1
+            self._open_chunk()
+
+    def append(self, name: str, payload: bytes, recorded_at: Optional[float] = None):
+        encoded_name = name.encode()
+        compressed_payload = zlib.compress(payload)
+        record = (_RECORD_HEADER.pack(time() if recorded_at is None else recorded_at,
+                                      len(encoded_name),
+                                      len(compressed_payload)) + encoded_name + compressed_payload)
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.chunk_size:
+                if self._file is not None:
+                    self._file.close()
+                    self._chunk_number += 1
+                self._open_chunk()
+            self._file.write(record)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class RecordingFeedClient:
+    """Fetches through ``client`` and records every new payload."""
+    _client: FeedClient
+    _recorder: FeedRecorder
+
+    def __init__(self, client: FeedClient, recorder: FeedRecorder):
+        self._client = client
+        self._recorder = recorder
+
+    def fetch(self, url: str) -> FeedResponse:
+        response = self._client.fetch(url)
+        if not response.not_modified:
+            self._recorder.append(feed_name(url), response.content)
+        return response
+
+    def forget(self, url: str):
+        self._client.forget(url)
+
+
+class _Record(NamedTuple):
+    recorded_at: float
+    path: str
+    offset: int
+    length: int
+
+
+def _read_index(directory: str) -> Dict[str, List[_Record]]:
+    records = {}
+    for path in sorted(glob(os.path.join(directory, "chunk-*.log"))):
+        with open(path, 'rb') as chunk:
+            while True:
+                header = chunk.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break  # end of the chunk, or a record that was cut off while being written
+                recorded_at, name_length, payload_length = _RECORD_HEADER.unpack(header)
+                name = chunk.read(name_length).decode()
+                offset = chunk.tell()
+                chunk.seek(payload_length, os.SEEK_CUR)
+                if chunk.tell() > os.fstat(chunk.fileno()).st_size:
+                    break
+                records.setdefault(name, []).append(_Record(recorded_at, path, offset, payload_length))
+    for name_records in records.values():
+        name_records.sort(key=lambda record: record.recorded_at)
+    return records
+
+
+def read_payloads(directory: str) -> Dict[str, List[bytes]]:
+    # every recorded payload of every feed, in recorded order
+    payloads = {}
+    for name, name_records in _read_index(directory).items():
+        payloads[name] = []
+        for record in name_records:
+            with open(record.path, 'rb') as chunk:
+                chunk.seek(record.offset)
+                payloads[name].append(zlib.decompress(chunk.read(record.length)))
+    return payloads
+
+
+class ReplayFeedClient:
+    """Serves recorded payloads in place of the live feeds, with the same ``fetch`` interface as FeedClient.
+
+    With a ``speed`` the recording is replayed against the wall clock, ``speed`` times faster than it was recorded,
+    and each fetch returns the latest payload recorded up to that point. Without one it is replayed as fast as
+    possible: every fetch of ``clock_feed`` (by default the feed with the most records) returns its next payload, and
+    the other feeds follow along in recorded time. A fetch with nothing new to return, including past the end of the
+    recording, is answered as not modified.
+    """
+    speed: Optional[float]
+    clock_feed: str
+    _records: Dict[str, List[_Record]]
+
+    def __init__(self, directory: str, speed: Optional[float] = 1.0, clock_feed: Optional[str] = None):
+        self.speed = speed
+        self._records = _read_index(directory)
+        if not self._records:
+            raise ValueError(f"No recorded feeds in {directory}.")
+        self.clock_feed = (max(self._records, key=lambda name: len(self._records[name])) if clock_feed is None
+                           else feed_name(clock_feed))
+        self._recorded_times = {name: [record.recorded_at for record in name_records]
+                                for name, name_records in self._records.items()}
+        self._first_recorded_at = min(name_records[0].recorded_at for name_records in self._records.values())
+        self._clock = self._first_recorded_at
+        self._started_at = None
+        self._served = {}
+        self._lock = Lock()
+
+    @property
+    def finished(self) -> bool:
+        return all(self._served.get(name, -1) == len(name_records) - 1
+                   for name, name_records in self._records.items())
+
+    def _latest_before(self, name: str, recorded_at: float) -> int:
+        return bisect_right(self._recorded_times[name], recorded_at) - 1
+
+    def fetch(self, url: str) -> FeedResponse:
+        name = feed_name(url)
+        if name not in self._records:
+            raise KeyError(f"{name} was not recorded.")
+        with self._lock:
+            served = self._served.get(name, -1)
+            if self.speed is not None:
+                if self._started_at is None:
+                    self._started_at = monotonic()
+                self._clock = self._first_recorded_at + (monotonic() - self._started_at) * self.speed
+                position = max(self._latest_before(name, self._clock), 0)
+            elif name == self.clock_feed:
+                position = min(served + 1, len(self._records[name]) - 1)
+                self._clock = self._records[name][position].recorded_at
+            else:
+                position = self._latest_before(name, self._clock)
+            if position <= served:
+                return FeedResponse(None, True)
+            self._served[name] = position
+
+        record = self._records[name][position]
+        with open(record.path, 'rb') as chunk:
+            chunk.seek(record.offset)
+            return FeedResponse(zlib.decompress(chunk.read(record.length)), False)
+
+    def forget(self, url: str):
+        # the next fetch of url returns the last payload it returned again, rather than not modified
+        name = feed_name(url)
+        with self._lock:
+            if name in self._served:
+                self._served[name] -= 1
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, List, Optional
+
+from numpy import asarray, dtype, frombuffer, ndarray
+
+# format of the bundle file itself; bump it whenever the arrays written into bundles change
+BUNDLE_FORMAT = 1
+_MAGIC = b"TTRKBNDL"
+_HEADER_LENGTH = struct.Struct("<Q")
+# every array starts on a cache line, so that mapped views are aligned for any dtype
+_ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def hash_files(paths: Iterable[str]) -> Dict[str, str]:
+    # content hashes of the files a bundle was built from, to tell whether it is still current
+    hashes = {}
+    for path in paths:
+        with open(path, 'rb') as source:
+            hashes[os.path.normpath(path)] = hashlib.sha256(source.read()).hexdigest()
+    return hashes
+
+
+def write_bundle(path: str, arrays: Dict[str, ndarray], sources: Iterable[str], metadata: Optional[dict] = None):
+    """Write ``arrays`` to a single file that RuntimeBundle maps back without parsing or copying.
+
+    The file is a magic number, the length of a JSON header, the header (the ``metadata``, the content hashes of the
+    ``sources`` the arrays were built from, and the dtype, shape and offset of every array), and then the raw arrays.
+    It is written next to ``path`` and moved into place, so a server starting up meanwhile sees either the old bundle
+    or the new one.
+    """
+    arrays = {name: asarray(array) for name, array in arrays.items()}
+    for name, array in arrays.items():
+        if array.dtype.hasobject:
+            raise TypeError(f"{name} holds Python objects; convert it to a fixed-width dtype first.")
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+    metadata = dict(metadata or {}, sources=hash_files(sources))
+    header = json.dumps({'format': BUNDLE_FORMAT, 'metadata': metadata, 'arrays': layout}).encode()
+    data_start = _aligned(len(_MAGIC) + _HEADER_LENGTH.size + len(header))
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as bundle:
+        bundle.write(_MAGIC + _HEADER_LENGTH.pack(len(header)) + header)
+        for name, array in arrays.items():
+            bundle.seek(data_start + layout[name]['offset'])
+            bundle.write(array.tobytes())
+        bundle.truncate(data_start + offset)
+    os.replace(temporary_path, path)
+
+
+class RuntimeBundle:
+    """Read-only, memory-mapped view of a file written by write_bundle.
+
+    Arrays are views straight into the mapping, so loading a bundle costs one ``mmap`` call no matter its size, and
+    every worker on the host shares the same pages.
+    """
+    path: str
+    metadata: dict
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as bundle:
+            self._mmap = mmap.mmap(bundle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a runtime bundle.")
+        header_length, = _HEADER_LENGTH.unpack_from(self._mmap, len(_MAGIC))
+        header_start = len(_MAGIC) + _HEADER_LENGTH.size
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+        if header['format'] != BUNDLE_FORMAT:
+            raise ValueError(f"{path} has bundle format {header['format']}, expected {BUNDLE_FORMAT}.")
+        self.metadata = header['metadata']
+        self._layout = header['arrays']
+        self._data_start = _aligned(header_start + header_length)
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._layout)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._layout
+
+    def __getitem__(self, name: str) -> ndarray:
+        layout = self._layout[name]
+        array_dtype = dtype(layout['dtype'])
+        count = 1
+        for size in layout['shape']:
+            count *= size
+        return frombuffer(self._mmap, dtype=array_dtype, count=count,
+                          offset=self._data_start + layout['offset']).reshape(layout['shape'])
+
+    def is_current(self, expected_sources: Iterable[str] = ()) -> bool:
+        # true if every file the bundle was built from, as listed in its metadata, still has the same content, and the
+        # ``expected_sources`` are among them
+        sources = self.metadata.get('sources', {})
+        if any(os.path.normpath(path) not in sources for path in expected_sources):
+            return False
+        try:
+            return hash_files(sources) == sources
+        except OSError:
+            return False
@@ -0,0 +1,91 @@
+import heapq
+from itertools import count
+from queue import Queue
+from threading import Condition, Thread
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from ttracker.metrics import REGISTRY
+from ttracker.poller import Poller
+
+REFRESH_LAG_SECONDS = REGISTRY.histogram("ttracker_refresh_lag_seconds",
+                                         "Seconds a due refresh waited for a free scheduler thread.")
+
+
+class RefreshScheduler:
+    """Refreshes many pollers, one per agency, on a single pool of threads, each poller at its own cadence.
+
+    A poller is due again ``next_wait`` seconds after its last refresh finished, exactly as if it ran on its own
+    thread, so its interval, and how it adapts to the observed feed updates, is still its own. One thread waits for the
+    next poller to come due and hands it to the ``workers``; since a poller is only queued again once its refresh is
+    done, it is never refreshed twice at once, and a slow feed only delays the other agencies when every worker is
+    busy with one. The threads are daemons, like the poller's own, so an unreachable feed never holds up an exit.
+    """
+    workers: int
+    _queue: List[Tuple[float, int, Poller]]
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        # pollers waiting for their next refresh, soonest first; the counter breaks ties in the order they were queued
+        self._queue = []
+        self._order = count()
+        self._changed = Condition()
+        self._due = Queue()
+        self._stopped = True
+        self._threads = []
+
+    def add(self, poller: Poller) -> Poller:
+        # refreshed as soon as the scheduler is running
+        with self._changed:
+            self._schedule(poller, monotonic())
+        return poller
+
+    def _schedule(self, poller: Poller, due_at: float):
+        # with _changed held
+        heapq.heappush(self._queue, (due_at, next(self._order), poller))
+        self._changed.notify()
+
+    def start(self):
+        with self._changed:
+            if not self._stopped:
+                return self
+            self._stopped = False
+        self._threads = [Thread(target=self._dispatch, name="ttracker-scheduler", daemon=True)]
+        self._threads += [Thread(target=self._work, name=f"ttracker-refresh-{i}", daemon=True)
+                          for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        # refreshes in progress finish, but no other one starts; the pollers keep their latest snapshots
+        with self._changed:
+            self._stopped = True
+            self._changed.notify()
+        for _ in range(self.workers):
+            self._due.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _dispatch(self):
+        while True:
+            with self._changed:
+                while not self._stopped and (not self._queue or self._queue[0][0] > monotonic()):
+                    self._changed.wait(self._queue[0][0] - monotonic() if self._queue else None)
+                if self._stopped:
+                    return
+                due_at, _, poller = heapq.heappop(self._queue)
+            self._due.put((due_at, poller))
+
+    def _work(self):
+        while True:
+            item = self._due.get()
+            if item is None:
+                return
+            due_at, poller = item
+            if not self._stopped:
+                REFRESH_LAG_SECONDS.observe(max(monotonic() - due_at, 0))
+                due_at = monotonic() + poller.tick()
+            with self._changed:
+                # queued again even once stopped, to be refreshed when the scheduler is started again
+                self._schedule(poller, due_at)
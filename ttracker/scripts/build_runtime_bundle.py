@@ -0,0 +1,54 @@
+"""Build the runtime bundles that the app loads at startup instead of the clean CSV files.
+
+    python -m ttracker.scripts.build_runtime_bundle [--agency NAME ...] [--output PATH]
+
+Run it from the repository root after changing any of the clean data, or the map style of an agency; ``python -m
+ttracker.scripts.build_static_data`` runs it too. Every agency configured in ``agencies/`` with a ``runtime_bundle``
+gets one, unless ``--agency`` names some of them. A bundle holds the lookup tables of the System and the serialized
+base map; the app falls back to the CSV files when the bundle is missing or was built from different data.
+"""
+import argparse
+import os
+from numpy import frombuffer, uint8
+from pandas import read_csv
+
+from ttracker.agency import AgencyConfig, bundle_sources, load_agency_configs, optional_path
+from ttracker.plotting_tools import build_base_map, describe_figure, freeze_figure
+from ttracker.runtime_bundle import write_bundle
+from ttracker.system import System
+
+
+def build_agency_base_map(agency: AgencyConfig, system: System):
+    background_path = optional_path(agency.map_background)
+    return build_base_map(system.links_data, system.station_data, agency.map_style,
+                          None if background_path is None else read_csv(background_path))
+
+
+def build_runtime_bundle(agency: AgencyConfig, output: str = None) -> str:
+    output = agency.runtime_bundle if output is None else output
+    system = System(agency)
+    base_map = freeze_figure(build_agency_base_map(agency, system))
+
+    arrays = system.bundle_arrays()
+    arrays['base_map_json'] = frombuffer(base_map.json.encode(), dtype=uint8)
+    write_bundle(output, arrays, bundle_sources(agency))
+    return (f"{os.path.getsize(output)} bytes, base map with "
+            "{traces} traces, {shapes} shapes, {bytes} bytes".format(**describe_figure(base_map)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the runtime bundles.")
+    parser.add_argument("--agency", nargs="+", help="agencies to build the bundle of, by default all of them")
+    parser.add_argument("--output", help="where to write the bundle of a single agency, instead of its runtime_bundle")
+    args = parser.parse_args()
+    agencies = [agency for agency in load_agency_configs(names=args.agency)
+                if agency.runtime_bundle is not None or args.output]
+    if args.output and len(agencies) != 1:
+        parser.error("--output needs a single --agency.")
+    for agency in agencies:
+        output = args.output or agency.runtime_bundle
+        print(f"Wrote {output}: {build_runtime_bundle(agency, output)}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,453 @@
+"""Build the clean data, the track shapes and the runtime bundle from the raw data.
+
+    python -m ttracker.scripts.build_static_data [--agency agencies/mbta.json] [--force] [--only stations links ...]
+
+Run it from the repository root, e.g. after downloading a new MBTA_GTFS.zip into static/data/raw. The outputs are
+written where the agency configuration reads them from. The GTFS zip is parsed once, and only for the tables the build
+reads, into a pickle under static/data/cache that later builds of the same zip load instead. Every output records the
+content hashes of its inputs (including this file) in a build_manifest.json next to the agency's stations, and is only
+rebuilt when one of them changed, so a new GTFS that leaves the stations untouched rebuilds the crosswalk and the track
+shapes but not the stations or the links. The manifest and the track shapes are build products, which are not
+committed.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import math
+import os
+import pickle
+import zipfile
+from functools import lru_cache
+from time import perf_counter
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ttracker.agency import AGENCY_DIRECTORY, AgencyConfig, load_agency_config
+from ttracker.runtime_bundle import hash_files
+from ttracker.scripts import build_runtime_bundle
+
+RAW_DATA = "./static/data/raw"
+GREEN_LINE_STATION_COORDINATES = f"{RAW_DATA}/spider_green_line.json"
+GREEN_LINE_STATION_NAMES = f"{RAW_DATA}/station-network_green_line.json"
+NON_GREEN_LINE_STATION_COORDINATES = f"{RAW_DATA}/spider.json"
+NON_GREEN_LINE_STATION_NAMES = f"{RAW_DATA}/station-network.json"
+MBTA_GTFS = f"{RAW_DATA}/MBTA_GTFS.zip"
+GTFS_CACHE = "./static/data/cache"
+# the raw data above is the MBTA's, so its configuration is the one built by default
+DEFAULT_AGENCY_CONFIG = f"{AGENCY_DIRECTORY}/mbta.json"
+# relative, so that manifests compare equal across checkouts
+BUILD_CODE = os.path.relpath(__file__)
+
+ROUTE_IDS = ['red-a', 'red-b', 'blue', 'orange', 'green-b', 'green-c', 'green-d', 'green-e']
+STOP_ORDERS = {route_id: f"{RAW_DATA}/{route_id}_stop_order.csv" for route_id in ROUTE_IDS}
+# the columns of each GTFS table that the build reads; nothing else of the zip is parsed
+GTFS_TABLES = {
+    'stops': {'usecols': ['stop_code', 'stop_name', 'parent_station', 'location_type', 'stop_lat', 'stop_lon'],
+              'dtype': {'stop_code': str, 'stop_name': str, 'parent_station': str, 'location_type': 'Int8'}},
+    'trips': {'usecols': ['route_id', 'shape_id'], 'dtype': {'route_id': str, 'shape_id': str}},
+    'shapes': {'usecols': ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence'],
+               'dtype': {'shape_id': str}},
+}
+
+# static route ids mapped to the GTFS route ids whose shapes they run on
+GTFS_ROUTE_IDS = {'red-a': "Red", 'red-b': "Red", 'blue': "Blue", 'orange': "Orange", 'green-b': "Green-B",
+                  'green-c': "Green-C", 'green-d': "Green-D", 'green-e': "Green-E"}
+# only the most used shapes of each route are considered, so that links don't follow rare detours
+SHAPES_PER_ROUTE = 4
+
+# links of the shared green and red line trunks, as drawn in the raw network, that each branch runs over
+GREEN_LINE_TRUNK = [('place-gover', 'place-pktrm'), ('place-pktrm', 'place-boyls'), ('place-boyls', 'place-armnl'),
+                    ('place-armnl', 'place-coecl'), ('place-coecl', 'place-hymnl'), ('place-hymnl', 'place-kencl')]
+GREEN_LINE_BRANCH_LINKS = {
+    'green-b': GREEN_LINE_TRUNK,
+    'green-c': GREEN_LINE_TRUNK,
+    'green-d': [('place-lech', 'place-spmnl'), ('place-spmnl', 'place-north'), ('place-north', 'place-haecl'),
+                ('place-haecl', 'place-gover')] + GREEN_LINE_TRUNK,
+    'green-e': [('place-lech', 'place-spmnl'), ('place-spmnl', 'place-north'), ('place-north', 'place-haecl'),
+                ('place-haecl', 'place-gover')] + GREEN_LINE_TRUNK[:4],
+}
+RED_LINE_TRUNK = [('place-jfk', 'place-andrw'), ('place-andrw', 'place-brdwy'), ('place-brdwy', 'place-sstat'),
+                  ('place-sstat', 'place-dwnxg'), ('place-dwnxg', 'place-pktrm'), ('place-pktrm', 'place-chmnl'),
+                  ('place-chmnl', 'place-knncl'), ('place-knncl', 'place-cntsq'), ('place-cntsq', 'place-harsq'),
+                  ('place-harsq', 'place-portr'), ('place-portr', 'place-davis'), ('place-davis', 'place-alfcl')]
+RED_LINE_BRANCH_LINKS = {
+    'red-a': [('place-asmnl', 'place-smmnl'), ('place-smmnl', 'place-fldcr'), ('place-fldcr', 'place-shmnl'),
+              ('place-shmnl', 'place-jfk')] + RED_LINE_TRUNK,
+    'red-b': [('place-brntn', 'place-qamnl'), ('place-qamnl', 'place-qnctr'), ('place-qnctr', 'place-wlsta'),
+              ('place-wlsta', 'place-nqncy'), ('place-nqncy', 'place-jfk')] + RED_LINE_TRUNK,
+}
+
+
+@lru_cache(maxsize=None)
+def read_gtfs(path: str = MBTA_GTFS) -> Dict[str, pd.DataFrame]:
+    """The tables of GTFS_TABLES from the zip at ``path``, parsed at most once per zip.
+
+    Parsed tables are pickled under GTFS_CACHE, named after the hash of the zip, so a build of an unchanged zip only
+    unpickles them. Caches of other zips are removed.
+    """
+    with open(path, 'rb') as gtfs_zip:
+        digest = hashlib.sha256(gtfs_zip.read()).hexdigest()[:16]
+    cache_path = os.path.join(GTFS_CACHE, f"gtfs-{digest}.pkl")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as cache:
+            return pickle.load(cache)
+
+    with zipfile.ZipFile(path) as gtfs_zip:
+        tables = {name: pd.read_csv(gtfs_zip.open(f"{name}.txt"), **options) for name, options in GTFS_TABLES.items()}
+    for stale_cache in glob.glob(os.path.join(GTFS_CACHE, "gtfs-*.pkl")):
+        os.remove(stale_cache)
+    os.makedirs(GTFS_CACHE, exist_ok=True)
+    with open(cache_path, 'wb') as cache:
+        pickle.dump(tables, cache, protocol=pickle.HIGHEST_PROTOCOL)
+    return tables
+
+
+def build_stations(agency: AgencyConfig):
+    # Get station coordinates on canvas.
+    # read raw green line coordinates.
+    green_line_station_coordinates = pd.read_json(GREEN_LINE_STATION_COORDINATES).T
+    green_line_station_coordinates.columns = ['x', 'y']
+    # read raw non-green line coordinates.
+    non_green_line_station_coordinates = pd.read_json(NON_GREEN_LINE_STATION_COORDINATES).T
+    non_green_line_station_coordinates.columns = ['x', 'y']
+    # adjust non-green line coordinates so that they are not offset relative to other stations; the difference
+    # between the coordinates of park street in the two datasets is the offset
+    non_green_line_station_coordinates += (green_line_station_coordinates.loc['place-pktrm', ['x', 'y']] -
+                                           non_green_line_station_coordinates.loc['place-pktrm', ['x', 'y']])
+    # append non-green line station coordinates to green line station coordinates, dropping stations which appear in
+    # both
+    station_coordinates = pd.concat([green_line_station_coordinates, non_green_line_station_coordinates], axis=0)
+    station_coordinates = station_coordinates.loc[~station_coordinates.index.duplicated()]
+    station_coordinates.index.name = "station_id"
+    # flip map vertically
+    station_coordinates['y'] = station_coordinates['y'].max() - station_coordinates['y']
+    # space out stations
+    station_coordinates = station_coordinates * 10
+
+    # Merge with station names.
+    station_names_dfs = []
+    for json_file in [NON_GREEN_LINE_STATION_NAMES, GREEN_LINE_STATION_NAMES]:
+        with open(json_file) as station_json:
+            station_names_dfs.append(pd.DataFrame.from_records(json.load(station_json)['nodes']))
+    station_names = (pd.concat(station_names_dfs, axis=0)
+                     .drop_duplicates(subset='id')  # drop stations which appear in both green line and non-green line
+                     .set_index('id'))
+    station_df = pd.concat([station_coordinates, station_names], axis=1)
+
+    # Add GLX stations and Assembly
+    # GLX E stations are on the same line as lechmere and science park, spaced as far apart
+    lechmere = station_df.loc['place-lech', ['x', 'y']].to_numpy(dtype=float)
+    science_park = station_df.loc['place-spmnl', ['x', 'y']].to_numpy(dtype=float)
+    steps = np.arange(1, 6)[:, np.newaxis]
+    glx_e = lechmere - (science_park - lechmere) * steps
+    # plot union square station directly west of lechmere
+    union_square = lechmere - [math.dist(science_park, lechmere), 0]
+    # Add assembly in current Oak Grove location
+    assembly = station_df.loc['place-welln', ['x', 'y']].to_numpy(dtype=float)
+    glx_and_assembly_df = pd.DataFrame(np.vstack([glx_e, union_square, assembly]), columns=['x', 'y'],
+                                       index=["place-esomr", "place-gilmn", "place-mgngl", "place-balsq",
+                                              "place-mdftf", "place-unsqu", "place-astao"])
+    glx_and_assembly_df['name'] = ["East Somerville", "Gilman Square", "Magoun Square", "Ball Square",
+                                   "Medford/Tufts", "Union Square", "Assembly"]
+    # Move Oak Grove, Malden Center, wellington, up one unit
+    moved_up = ['place-ogmnl', 'place-welln', 'place-mlmnl']
+    station_df.loc[moved_up, 'y'] += station_df.loc['place-ogmnl', 'y'] - station_df.loc['place-mlmnl', 'y']
+    station_df = pd.concat([station_df, glx_and_assembly_df], axis=0)
+
+    # update stations around BU
+    delta = station_df.loc['place-brico', ['x', 'y']] - station_df.loc['place-plsgr', ['x', 'y']]
+    station_df = station_df.drop(labels=['place-babck', 'place-plsgr'])
+    station_df = station_df.rename(index={'place-buwst': 'place-amory', 'place-stplb': 'place-babck'})
+    station_df = station_df.replace({"Boston University West Station": "Amory Street Station",
+                                     "Saint Paul Street": "Babcock Street Station"})
+    green_line_b_to_shift = ['place-brico', 'place-harvd', 'place-grigg', 'place-alsgr', 'place-wrnst', 'place-wascm',
+                             'place-sthld', 'place-chswk', 'place-chill', 'place-sougr', 'place-lake']
+    station_df.loc[green_line_b_to_shift, ['x', 'y']] -= delta.to_numpy(dtype=float)
+
+    # Merge with station latitudes and longitudes of the parent stations in the MBTA GTFS
+    stops = read_gtfs()['stops']
+    station_latitudes_and_longitudes = (stops.groupby('stop_name')[['parent_station', 'stop_lat', 'stop_lon']]
+                                        # parent stations have no parent station; take it from their first child
+                                        .bfill()
+                                        .loc[stops['location_type'].eq(1).to_numpy(dtype=bool, na_value=False)]
+                                        .rename(columns={'parent_station': 'station_id'})
+                                        .set_index('station_id'))
+    station_df = pd.concat([station_df, station_latitudes_and_longitudes], axis=1)
+
+    # drop stations which could not be merged with canvas coordinates
+    station_df = station_df.dropna(subset=['x'])
+
+    # Add line endpoint data
+    endpoints = ["place-alfcl", "place-asmnl", "place-brntn",
+                 "place-mdftf", "place-unsqu", "place-lake", "place-clmnl", "place-river", "place-hsmnl",
+                 "place-forhl", "place-ogmnl",
+                 "place-bomnl", "place-wondl"]
+    station_df['endpoint'] = station_df.index.isin(endpoints).astype(int)
+
+    station_df.index.name = "station_id"
+    station_df.to_csv(agency.station_data)
+
+
+def build_crosswalk(agency: AgencyConfig):
+    stops = read_gtfs()['stops']
+    (stops[['stop_code', 'parent_station']]
+     .dropna()
+     .rename(columns={'parent_station': 'station_id'})
+     .set_index('stop_code')
+     .to_csv(agency.crosswalk))
+
+
+def _read_network_links(path: str) -> pd.DataFrame:
+    with open(path) as route_information:
+        data = json.load(route_information)
+    station_ids = pd.DataFrame.from_records(data['nodes'])['id']
+    links = pd.DataFrame.from_records(data['links'])
+    return pd.DataFrame({'source_station_id': station_ids.loc[links['source']].to_numpy(),
+                         'target_station_id': station_ids.loc[links['target']].to_numpy(),
+                         'line': links['line'].to_numpy()})
+
+
+def _links_from_records(records: List[Tuple[str, str, str]]) -> pd.DataFrame:
+    return pd.DataFrame.from_records(records, columns=['source_station_id', 'target_station_id', 'line'])
+
+
+def _without_links(links_df: pd.DataFrame, removed: List[Tuple[str, str]]) -> pd.DataFrame:
+    # anti-join on (source, target)
+    removed = pd.DataFrame.from_records(removed, columns=['source_station_id', 'target_station_id'])
+    matches = links_df.merge(removed, how='left', on=['source_station_id', 'target_station_id'], indicator=True)
+    return links_df.loc[(matches['_merge'] == 'left_only').to_numpy()]
+
+
+def _unordered_pair(sources: pd.Series, targets: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    sources, targets = sources.to_numpy(dtype=object), targets.to_numpy(dtype=object)
+    first = sources < targets
+    return np.where(first, sources, targets), np.where(first, targets, sources)
+
+
+def _split_into_branches(links_df: pd.DataFrame,
+                         trunk_route_id: str,
+                         branch_links: Dict[str, List[Tuple[str, str]]]) -> pd.DataFrame:
+    """Replace the links of ``trunk_route_id`` by a copy for every branch that runs over them, in both directions.
+
+    ``branch_links`` lists the (source, target) stations of the links that each branch runs over, in either order.
+    """
+    pairs = pd.DataFrame.from_records([(branch, *sorted(pair)) for branch, pairs in branch_links.items()
+                                       for pair in pairs], columns=['branch', 'station_a', 'station_b'])
+    trunk = links_df.loc[links_df['route_id'] == trunk_route_id]
+    station_a, station_b = _unordered_pair(trunk['source_station_id'], trunk['target_station_id'])
+    # an inner merge keeps the order of the pairs, and of the trunk links within each pair
+    branched = pairs.merge(trunk.assign(station_a=station_a, station_b=station_b), on=['station_a', 'station_b'])
+    branched['route_id'] = branched['branch']
+    return pd.concat([links_df.loc[links_df['route_id'] != trunk_route_id], branched[links_df.columns]],
+                     ignore_index=True)
+
+
+def _link_directions(links_df: pd.DataFrame) -> np.ndarray:
+    # 0 if a link runs in the order of the stops of its route, 1 against it
+    stop_orders = pd.concat([pd.read_csv(path, usecols=['station_id']).assign(route_id=route_id,
+                                                                              position=lambda df: np.arange(len(df)))
+                             for route_id, path in STOP_ORDERS.items()])
+    stop_orders = stop_orders.drop_duplicates(['route_id', 'station_id'])
+    positions = (links_df[['route_id', 'source_station_id', 'target_station_id']]
+                 .merge(stop_orders.rename(columns={'station_id': 'source_station_id', 'position': 'source'}),
+                        how='left', on=['route_id', 'source_station_id'])
+                 .merge(stop_orders.rename(columns={'station_id': 'target_station_id', 'position': 'target'}),
+                        how='left', on=['route_id', 'target_station_id']))
+    unordered = positions[['source', 'target']].isna().any(axis=1)
+    if unordered.any():
+        raise ValueError("Links with stations missing from the stop order of their route: "
+                         f"{positions.loc[unordered, ['route_id', 'source_station_id', 'target_station_id']]}")
+    return (positions['source'] >= positions['target']).to_numpy(dtype=int)
+
+
+def build_links(agency: AgencyConfig):
+    links_df = pd.concat([_read_network_links(GREEN_LINE_STATION_NAMES),
+                          _read_network_links(NON_GREEN_LINE_STATION_NAMES),
+                          # manually add glx stations
+                          _links_from_records([('place-lech', 'place-unsqu', 'green-d'),
+                                               ('place-lech', 'place-esomr', 'green-e'),
+                                               ('place-esomr', 'place-gilmn', 'green-e'),
+                                               ('place-gilmn', 'place-mgngl', 'green-e'),
+                                               ('place-mgngl', 'place-balsq', 'green-e'),
+                                               ('place-balsq', 'place-mdftf', 'green-e')])],
+                         ignore_index=True)
+
+    # replace the link between sullivan square and wellington by links through assembly, and update links to reflect
+    # the bu west, st paul, pleasant, babcock consolidation
+    links_df = _without_links(links_df, [('place-sull', 'place-welln'),
+                                         ('place-bucen', 'place-buwst'), ('place-buwst', 'place-stplb'),
+                                         ('place-stplb', 'place-plsgr'), ('place-plsgr', 'place-babck')])
+    links_df = pd.concat([links_df, _links_from_records([('place-astao', 'place-welln', 'orange'),
+                                                         ('place-sull', 'place-astao', 'orange'),
+                                                         ('place-amory', 'place-bucen', 'green-b'),
+                                                         ('place-babck', 'place-amory', 'green-b')])],
+                         ignore_index=True)
+
+    # add the reverse of each link
+    reversed_links = links_df.rename(columns={'source_station_id': 'target_station_id',
+                                              'target_station_id': 'source_station_id'})
+    links_df = pd.concat([links_df, reversed_links[links_df.columns]], ignore_index=True)
+
+    # add x, y coordinates and lat, long coordinates to links
+    station_df = pd.read_csv(agency.station_data, index_col='station_id')
+    sources = station_df.loc[links_df['source_station_id']]
+    targets = station_df.loc[links_df['target_station_id']]
+    links_df[['x_source', 'y_source']] = sources[['x', 'y']].to_numpy()
+    links_df[['x_target', 'y_target']] = targets[['x', 'y']].to_numpy()
+    links_df[['lon_source', 'lat_source']] = sources[['stop_lon', 'stop_lat']].to_numpy()
+    links_df[['lon_target', 'lat_target']] = targets[['stop_lon', 'stop_lat']].to_numpy()
+
+    # rename line column for consistency across project
+    links_df = links_df.rename(columns={'line': 'route_id'})
+    # the raw network draws the green line trunk as route "green" and the red line as one route; give each branch
+    # its own copy of the links it runs over
+    links_df = _split_into_branches(links_df, "green", GREEN_LINE_BRANCH_LINKS)
+    links_df = _split_into_branches(links_df, "red", RED_LINE_BRANCH_LINKS)
+
+    links_df['direction'] = _link_directions(links_df)
+    links_df = links_df.drop_duplicates(ignore_index=True)
+
+    # add self-links for endpoints
+    endpoints = ['place-gover', 'place-forhl', 'place-wondl', 'place-bomnl', 'place-brntn', 'place-asmnl',
+                 'place-alfcl', 'place-alfcl', 'place-clmnl', 'place-lake', 'place-ogmnl', 'place-gover',
+                 'place-spmnl', 'place-river', 'place-hsmnl']
+    endpoint_coordinates = station_df.loc[endpoints, ['x', 'y', 'stop_lon', 'stop_lat']].to_numpy()
+    self_links = pd.DataFrame({'source_station_id': endpoints,
+                               'target_station_id': endpoints,
+                               'route_id': ['green-c', 'orange', 'blue', 'blue', 'red-b', 'red-a', 'red-b', 'red-a',
+                                            'green-c', 'green-b', 'orange', 'green-b', 'green-c', 'green-d',
+                                            'green-e']})
+    self_links[['x_source', 'y_source', 'lon_source', 'lat_source']] = endpoint_coordinates
+    self_links[['x_target', 'y_target', 'lon_target', 'lat_target']] = endpoint_coordinates
+    self_links['direction'] = [0, 1, 0, 1, 1, 1, 0, 0, 1, 1, 0, 0, 0, 1, 1]
+
+    pd.concat([links_df, self_links[links_df.columns]], ignore_index=True).to_csv(agency.links_data)
+
+
+def build_track_shapes(agency: AgencyConfig):
+    gtfs = read_gtfs()
+    shapes_df = gtfs['shapes'].sort_values(['shape_id', 'shape_pt_sequence'])
+    shape_points = {shape_id: points[['shape_pt_lon', 'shape_pt_lat']].to_numpy()
+                    for shape_id, points in shapes_df.groupby('shape_id')}
+    trips = gtfs['trips']
+    route_shapes = (trips.loc[trips['route_id'].isin(GTFS_ROUTE_IDS.values())]
+                    .groupby('route_id')['shape_id']
+                    .agg(lambda shape_ids: shape_ids.value_counts().index[:SHAPES_PER_ROUTE].tolist())
+                    .to_dict())
+
+    station_df = pd.read_csv(agency.station_data, index_col='station_id')
+    links_df = pd.read_csv(agency.links_data, index_col=0)
+    links_df = links_df.loc[links_df['source_station_id'] != links_df['target_station_id']]
+    # distances are compared in roughly metric units, so shrink longitudes to the length of a degree of latitude
+    longitude_scale = np.cos(np.radians(station_df['stop_lat'].mean()))
+    sources = station_df.loc[links_df['source_station_id'], ['stop_lon', 'stop_lat']].to_numpy(dtype=float)
+    targets = station_df.loc[links_df['target_station_id'], ['stop_lon', 'stop_lat']].to_numpy(dtype=float)
+
+    tracks = []
+    for route_id, source, target in zip(links_df['route_id'], sources, targets):
+        # take the track between the shape points closest to the two stations, from the shape that passes closest to
+        # both
+        best_match = None
+        for shape_id in route_shapes[GTFS_ROUTE_IDS[route_id]]:
+            points = shape_points[shape_id]
+            source_distances = np.hypot((points[:, 0] - source[0]) * longitude_scale, points[:, 1] - source[1])
+            target_distances = np.hypot((points[:, 0] - target[0]) * longitude_scale, points[:, 1] - target[1])
+            source_index, target_index = source_distances.argmin(), target_distances.argmin()
+            error = source_distances[source_index] + target_distances[target_index]
+            if best_match is None or error < best_match[0]:
+                best_match = (error, points, source_index, target_index)
+        _, points, source_index, target_index = best_match
+        if source_index <= target_index:
+            track = points[source_index:target_index + 1]
+        else:
+            track = points[target_index:source_index + 1][::-1]
+        # start and end exactly at the stations, so that links join up
+        tracks.append(np.vstack([source, track[1:-1], target]))
+
+    lengths = np.array([len(track) for track in tracks])
+    points = np.concatenate(tracks)
+    track_shapes = pd.DataFrame({'route_id': np.repeat(links_df['route_id'].to_numpy(), lengths),
+                                 'source_station_id': np.repeat(links_df['source_station_id'].to_numpy(), lengths),
+                                 'target_station_id': np.repeat(links_df['target_station_id'].to_numpy(), lengths),
+                                 'sequence': np.arange(len(points)) - np.repeat(np.cumsum(lengths) - lengths, lengths),
+                                 'lon': points[:, 0],
+                                 'lat': points[:, 1]})
+    track_shapes.to_csv(agency.track_shapes, index=False)
+
+
+class Step(NamedTuple):
+    name: str
+    output: str
+    inputs: List[str]
+    build: Callable[[AgencyConfig], object]
+
+
+STEP_NAMES = ['stations', 'crosswalk', 'links', 'track_shapes', 'runtime_bundle']
+
+
+def build_steps(agency: AgencyConfig, config_path: str) -> List[Step]:
+    """The steps that build the static data of ``agency``, whose configuration is at ``config_path``.
+
+    In dependency order: a step's inputs include the outputs of the steps it reads, so that it is rebuilt when they
+    change, and this file, so that every step is rebuilt when the build itself changes. Missing inputs are left out of
+    the hashes; a step that needs them fails when it is built.
+    """
+    return [
+        Step('stations', agency.station_data,
+             [GREEN_LINE_STATION_COORDINATES, GREEN_LINE_STATION_NAMES, NON_GREEN_LINE_STATION_COORDINATES,
+              NON_GREEN_LINE_STATION_NAMES, MBTA_GTFS, BUILD_CODE],
+             build_stations),
+        Step('crosswalk', agency.crosswalk, [MBTA_GTFS, BUILD_CODE], build_crosswalk),
+        Step('links', agency.links_data,
+             [GREEN_LINE_STATION_NAMES, NON_GREEN_LINE_STATION_NAMES, agency.station_data, *STOP_ORDERS.values(),
+              BUILD_CODE],
+             build_links),
+        Step('track_shapes', agency.track_shapes, [MBTA_GTFS, agency.station_data, agency.links_data, BUILD_CODE],
+             build_track_shapes),
+        # the bundle also depends on the code that fills it, which the app does not check
+        Step('runtime_bundle', agency.runtime_bundle,
+             [agency.station_data, agency.links_data, agency.crosswalk, agency.map_background, agency.track_shapes,
+              config_path, os.path.relpath(build_runtime_bundle.__file__), "./ttracker/system.py",
+              "./ttracker/track_snapping.py", "./ttracker/plotting_tools.py"],
+             build_runtime_bundle.build_runtime_bundle),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agency", default=DEFAULT_AGENCY_CONFIG,
+                        help="configuration of the agency to build, whose paths the outputs are written to")
+    parser.add_argument("--force", action="store_true", help="rebuild every selected step, changed or not")
+    parser.add_argument("--only", nargs="+", choices=STEP_NAMES, help="steps to run")
+    args = parser.parse_args()
+
+    agency = load_agency_config(args.agency)
+    build_manifest = os.path.join(os.path.dirname(agency.station_data), "build_manifest.json")
+    manifest = {}
+    if os.path.exists(build_manifest):
+        with open(build_manifest) as manifest_file:
+            manifest = json.load(manifest_file)
+    for step in build_steps(agency, args.agency):
+        if args.only and step.name not in args.only:
+            continue
+        if step.output is None:
+            print(f"{step.name:<16}not configured for {agency.name}")
+            continue
+        # hashed when the step is reached, after the steps before it rebuilt their outputs
+        input_hashes = hash_files(path for path in step.inputs if path is not None and os.path.exists(path))
+        if not args.force and os.path.exists(step.output) and manifest.get(step.name) == input_hashes:
+            print(f"{step.name:<16}up to date")
+            continue
+        started = perf_counter()
+        step.build(agency)
+        manifest[step.name] = input_hashes
+        with open(build_manifest, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        print(f"{step.name:<16}built {step.output} in {perf_counter() - started:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Record an agency's GTFS-realtime feeds for offline replay.
+
+    python -m ttracker.scripts.record_feeds OUTPUT_DIRECTORY [--agency NAME] [--interval SECONDS] [--duration SECONDS]
+
+Replay a recording by starting the app with TTRACKER_REPLAY=OUTPUT_DIRECTORY, and optionally TTRACKER_REPLAY_SPEED
+(0 replays as fast as possible).
+"""
+import argparse
+import logging
+from time import monotonic, sleep
+
+from requests import RequestException
+
+from ttracker.agency import AGENCY_DIRECTORY, load_agency_config
+from ttracker.feed_client import FeedClient
+from ttracker.recording import FeedRecorder, RecordingFeedClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record GTFS-realtime feeds.")
+    parser.add_argument("output_directory")
+    parser.add_argument("--agency", default="mbta", help="name of a configuration in agencies/")
+    parser.add_argument("--interval", type=float, default=3)
+    parser.add_argument("--duration", type=float, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    agency = load_agency_config(f"{AGENCY_DIRECTORY}/{args.agency}.json")
+    feed_urls = [agency.vehicle_positions_url, agency.trip_updates_url]
+
+    recorder = FeedRecorder(args.output_directory)
+    client = RecordingFeedClient(FeedClient(), recorder)
+    started_at = monotonic()
+    while args.duration is None or monotonic() - started_at < args.duration:
+        for url in feed_urls:
+            try:
+                client.fetch(url)
+            except RequestException:
+                logging.warning("Could not fetch %s.", url, exc_info=True)
+        sleep(args.interval)
+    recorder.close()
+
+
+if __name__ == '__main__':
+    main()
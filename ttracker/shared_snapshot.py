@@ -0,0 +1,249 @@
+import fcntl
+import mmap
+import os
+import zlib
+from tempfile import gettempdir
+from time import sleep
+from typing import Callable, Optional, Tuple, TypeVar
+
+from numpy import dtype, float64, int64, ndarray
+
+from ttracker.system import ARRIVALS_PER_STATION, System, TrainPositions
+
+T = TypeVar("T")
+
+# every array is laid out back to back in a slot, in this order
+_FIELDS = [('x', dtype('<f8')),
+           ('y', dtype('<f8')),
+           ('vx', dtype('<f8')),
+           ('vy', dtype('<f8')),
+           ('target_x', dtype('<f8')),
+           ('target_y', dtype('<f8')),
+           ('station_codes', dtype('<i4')),
+           ('target_station_codes', dtype('<i4')),
+           ('route_codes', dtype('<i2')),
+           ('current_status', dtype('i1')),
+           ('ids', dtype('S32'))]
+# then the next arrivals at every station, as System.upcoming_arrivals returns them
+_ARRIVAL_FIELDS = [('route_codes', dtype('<i2')),
+                   ('times', dtype('<i8'))]
+# layout, capacity, number of stations, published version, write sequence of slot 0, write sequence of slot 1, stale
+# flag
+_HEADER_SIZE = 7 * 8
+_VERSION, _SEQUENCES, _STALE = 3, 4, 6
+# changes whenever the fields, their types or the number of arrivals per station do, so that a file written by another
+# release is never read with this one's layout
+_LAYOUT = zlib.crc32(repr((_HEADER_SIZE, _FIELDS, _ARRIVAL_FIELDS, ARRIVALS_PER_STATION)).encode())
+
+
+def default_snapshot_path(name: str) -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else gettempdir()
+    return os.path.join(directory, name)
+
+
+class SharedSnapshot:
+    """Train positions and the next arrivals at ``n_stations`` stations in a fixed-layout, memory-mapped file that
+    every worker process on the host can map.
+
+    The file holds two slots. A writer always fills the slot that is not currently published and then publishes it by
+    bumping the version, so readers keep reading the other slot undisturbed. Each slot also has a sequence number that
+    is odd while the slot is being written; readers check it before and after reading, and retry if it moved, so they
+    never act on a half-written snapshot.
+
+    The header records the layout, capacity and number of stations the file was made for. A file left behind with any
+    other, e.g. by a previous release or another configuration, is replaced by a new one rather than reused; processes
+    that still map the old file keep reading it until they restart.
+    """
+    capacity: int
+    n_stations: int
+    path: str
+
+    def __init__(self, path: str, capacity: int = 2048, n_stations: int = 0):
+        self.path = path
+        self.capacity = capacity
+        self.n_stations = n_stations
+        self._n_arrivals = n_stations * ARRIVALS_PER_STATION
+        self._slot_size = (16 + sum(field_dtype.itemsize * capacity for _, field_dtype in _FIELDS)
+                           + sum(field_dtype.itemsize * self._n_arrivals for _, field_dtype in _ARRIVAL_FIELDS))
+        self._mmap = self._map_file(_HEADER_SIZE + 2 * self._slot_size)
+        self._header = ndarray((7,), dtype=int64, buffer=self._mmap)
+        self._slots = [self._map_slot(_HEADER_SIZE + i * self._slot_size) for i in range(2)]
+
+    def _map_file(self, size: int) -> mmap.mmap:
+        # every process checks the file under an exclusive lock, so only one of them creates or replaces it
+        layout = [_LAYOUT, self.capacity, self.n_stations]
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                if not os.path.exists(self.path) or os.stat(self.path).st_ino != os.fstat(fd).st_ino:
+                    # replaced by another process while this one waited for the lock
+                    continue
+                file_size = os.fstat(fd).st_size
+                if file_size == 0:
+                    os.ftruncate(fd, size)
+                    mapped = mmap.mmap(fd, size)
+                    ndarray((3,), dtype=int64, buffer=mapped)[:] = layout
+                    return mapped
+                if file_size == size:
+                    mapped = mmap.mmap(fd, size)
+                    if ndarray((3,), dtype=int64, buffer=mapped).tolist() == layout:
+                        return mapped
+                    mapped.close()
+                os.unlink(self.path)
+            finally:
+                # the map holds a duplicate of the descriptor, and with it the lock, until it is unlocked explicitly
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _map_slot(self, offset: int):
+        # number of trains, then the feed timestamp, then the arrays of the trains, then those of the arrivals
+        count = ndarray((1,), dtype=int64, buffer=self._mmap, offset=offset)
+        timestamp = ndarray((1,), dtype=float64, buffer=self._mmap, offset=offset + 8)
+        offset += 16
+        fields = {}
+        for name, field_dtype in _FIELDS:
+            fields[name] = ndarray((self.capacity,), dtype=field_dtype, buffer=self._mmap, offset=offset)
+            offset += field_dtype.itemsize * self.capacity
+        arrivals = []
+        for _, field_dtype in _ARRIVAL_FIELDS:
+            arrivals.append(ndarray((self.n_stations, ARRIVALS_PER_STATION), dtype=field_dtype, buffer=self._mmap,
+                                    offset=offset))
+            offset += field_dtype.itemsize * self._n_arrivals
+        return count, timestamp, fields, tuple(arrivals)
+
+    @property
+    def version(self) -> int:
+        return int(self._header[_VERSION])
+
+    @property
+    def stale(self) -> bool:
+        return bool(self._header[_STALE])
+
+    def write(self, positions: TrainPositions, arrivals: Tuple[ndarray, ndarray], stale: bool = False) -> int:
+        n_trains = min(len(positions.x), self.capacity)
+        version = self.version + 1
+        slot = version % 2
+        sequence = self._header[_SEQUENCES + slot:_SEQUENCES + slot + 1]
+        count, timestamp, fields, arrival_fields = self._slots[slot]
+
+        sequence += 1  # odd: slot is being written
+        count[0] = n_trains
+        timestamp[0] = positions.timestamp
+        for name, _ in _FIELDS:
+            values = getattr(positions, name)[:n_trains]
+            fields[name][:n_trains] = values.astype(object).astype('S32') if name == 'ids' else values
+        for field, values in zip(arrival_fields, arrivals):
+            field[:] = values
+        sequence += 1  # even: slot is consistent again
+        self._header[_STALE] = stale
+        self._header[_VERSION] = version
+        return version
+
+    def set_stale(self, stale: bool):
+        self._header[_STALE] = stale
+
+    def read(self, consume: Callable[[TrainPositions, Tuple[ndarray, ndarray]], T],
+             retries: int = 100) -> Optional[Tuple[int, T]]:
+        # consume gets zero-copy views of the positions and the arrivals in the published slot; its result is only
+        # returned if the slot was not rewritten while it ran
+        for _ in range(retries):
+            version = self.version
+            if version == 0:
+                return None
+            slot = version % 2
+            sequence_before = int(self._header[_SEQUENCES + slot])
+            if sequence_before % 2 == 0:
+                count, timestamp, fields, arrivals = self._slots[slot]
+                n_trains = int(count[0])
+                result = consume(TrainPositions(timestamp=float(timestamp[0]),
+                                                **{name: field[:n_trains] for name, field in fields.items()}),
+                                 arrivals)
+                if int(self._header[_SEQUENCES + slot]) == sequence_before:
+                    return version, result
+            sleep(0.001)
+        return None
+
+    def close(self):
+        self._mmap.close()
+
+
+class ProducerElection:
+    """Elects one process per host as the producer by holding an exclusive lock on a file.
+
+    The lock is released by the operating system when the producer exits, so another process takes over on its next
+    attempt.
+    """
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock_file = None
+
+    @property
+    def is_producer(self) -> bool:
+        return self._lock_file is not None
+
+    def try_acquire(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+
+class SharedTrains:
+    """Refresh function for a poller that shares one set of train positions between all workers on a host.
+
+    Whichever worker wins the election fetches the feeds, computes positions and the next arrivals at every station,
+    and writes them to the shared snapshot; every worker, the producer included, then formats its trains from the
+    shared snapshot. Only the producer fetches anything upstream, TripUpdates included. If the producer exits, the next
+    worker to refresh takes over.
+    """
+    _system: System
+    _snapshot: SharedSnapshot
+    _election: ProducerElection
+
+    def __init__(self, system: System, snapshot: SharedSnapshot, election: ProducerElection):
+        self._system = system
+        self._snapshot = snapshot
+        self._election = election
+        self._written_positions = None
+        self._version = 0
+        self._trains = None
+
+    @property
+    def stale(self) -> bool:
+        return self._snapshot.stale
+
+    def _describe_trains(self, positions: TrainPositions, arrivals: Tuple[ndarray, ndarray]):
+        # the views into the snapshot are reused two versions later, so describe copies of them; ids are decoded from
+        # bytes, which copies them already
+        return self._system.describe_trains(positions._replace(
+            ids=positions.ids.astype(str).astype(object),
+            **{name: getattr(positions, name).copy() for name, _ in _FIELDS if name != 'ids'}),
+            tuple(values.copy() for values in arrivals))
+
+    def __call__(self):
+        if self._election.try_acquire():
+            # the predictions are indexed by the producer alone, and published with the positions
+            arrivals_changed = self._system.update_arrivals()
+            positions = self._system.locate_trains()
+            if positions is not self._written_positions or arrivals_changed:
+                self._snapshot.write(positions, self._system.upcoming_arrivals(positions.timestamp),
+                                     stale=self._system.stale)
+                self._written_positions = positions
+            else:
+                self._snapshot.set_stale(self._system.stale)
+
+        # format the trains again only when a new version has been published
+        if self._snapshot.version != self._version:
+            result = self._snapshot.read(self._describe_trains)
+            if result is not None:
+                self._version, self._trains = result
+        return self._trains
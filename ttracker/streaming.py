@@ -0,0 +1,91 @@
+from threading import Lock
+from time import monotonic
+from typing import Callable, Iterator, Optional, Tuple
+
+from ttracker.metrics import REGISTRY
+from ttracker.poller import Poller, Snapshot
+
+STREAM_FRAMES_ENCODED = REGISTRY.counter("ttracker_stream_frames_encoded",
+                                         "Snapshots encoded into server-sent events, once for all subscribers.")
+STREAM_EVENTS_SENT = REGISTRY.counter("ttracker_stream_events_sent", "Server-sent events written to subscribers.")
+STREAM_BYTES_SENT = REGISTRY.counter("ttracker_stream_bytes_sent", "Bytes of server-sent events written.")
+
+
+class SnapshotStream:
+    """Pushes the snapshots of a Poller to any number of subscribers as server-sent events.
+
+    Each snapshot is encoded into an event once, by whichever subscriber sees it first, and the same bytes are written
+    to every other subscriber, including ones that connect later: a ``<event>-delay`` event ahead of their first one
+    tells them how many seconds ago it was encoded, so that what the encoding derived from the time, like the age of
+    the positions, can be corrected. Subscribers hold no state besides the version they last sent, so an idle connection
+    costs a blocked generator and its socket; serve them from a worker that can keep thousands of those open, such as
+    gunicorn's gevent worker.
+    """
+    poller: Poller
+    event: str
+    keepalive: float
+
+    def __init__(self, poller: Poller, encode: Callable[[Snapshot], str], event: str = "message",
+                 keepalive: float = 15.0, retry: float = 5.0):
+        self.poller = poller
+        self.event = event
+        self.keepalive = keepalive
+        self._encode = encode
+        # tells browsers how long to wait before reconnecting, sent once per connection
+        self._preamble = f"retry: {int(retry * 1000)}\n\n".encode()
+        # version, event and monotonic time at which it was encoded
+        self._frame: Optional[Tuple[int, bytes, float]] = None
+        self._encode_lock = Lock()
+        self._subscribers = 0
+        self._subscribers_lock = Lock()
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def _encode_frame(self, snapshot: Snapshot) -> bytes:
+        # events are single lines of data, so the JSON must not span lines; JSON encoders escape newlines
+        STREAM_FRAMES_ENCODED.inc()
+        return f"event: {self.event}\ndata: {self._encode(snapshot)}\n\n".encode()
+
+    def frame(self, snapshot: Snapshot) -> bytes:
+        # the event of snapshot, encoded at most once
+        return self._cached_frame(snapshot)[1]
+
+    def _cached_frame(self, snapshot: Snapshot) -> Tuple[int, bytes, float]:
+        frame = self._frame
+        if frame is not None and frame[0] == snapshot.version:
+            return frame
+        with self._encode_lock:
+            frame = self._frame
+            if frame is None or frame[0] != snapshot.version:
+                frame = self._frame = (snapshot.version, self._encode_frame(snapshot), monotonic())
+            return frame
+
+    def subscribe(self) -> Iterator[bytes]:
+        """Events for one subscriber: the latest snapshot right away, then every newer one as it is published.
+
+        The first event is the shared one too, preceded by how long ago it was encoded, so that a reconnect storm
+        costs no more encodes than a single subscriber. A comment is sent when nothing was published for ``keepalive``
+        seconds, which keeps proxies from closing the connection and lets the server notice clients that left.
+        """
+        with self._subscribers_lock:
+            self._subscribers += 1
+        try:
+            yield self._preamble
+            version = 0
+            while True:
+                snapshot = self.poller.wait_for_newer(version, self.keepalive)
+                if snapshot is None or snapshot.version <= version:
+                    yield b": keepalive\n\n"
+                    continue
+                _, frame, encoded_at = self._cached_frame(snapshot)
+                if not version:
+                    frame = f"event: {self.event}-delay\ndata: {monotonic() - encoded_at:.3f}\n\n".encode() + frame
+                version = snapshot.version
+                STREAM_EVENTS_SENT.inc()
+                STREAM_BYTES_SENT.inc(len(frame))
+                yield frame
+        finally:
+            with self._subscribers_lock:
+                self._subscribers -= 1
@@ -1,8 +1,82 @@
-from numpy import sqrt, where, newaxis
+import logging
+import os
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from numpy import (arange, array, asarray, clip, column_stack, cumsum, ndarray, float64, full, int32, int64, newaxis,
+                   sqrt, where, zeros)
 import pandas as pd
 
-from ttracker.gtfs_realtime import GTFSRealtime
+from ttracker.agency import AgencyConfig, optional_path
+from ttracker.arrivals import ArrivalIndex, Arrivals
+from ttracker.feed_client import FeedClient
+from ttracker.gtfs_realtime import GTFSRealtime, OtherVehicles
+from ttracker.metrics import REGISTRY, stage_timer
+from ttracker.runtime_bundle import RuntimeBundle
+from ttracker.track_snapping import TrackSnapper
+from ttracker.vehicle_state import VehicleTable
+
+logger = logging.getLogger(__name__)
+
+
+# hover text prefix for each GTFS-realtime vehicle stop status (INCOMING_AT, STOPPED_AT, IN_TRANSIT_TO)
+STATUS_LABELS = array(["Next Stop: ", "Stopped At: ", "Next Stop: "], dtype=object)
+
+
+# fastest plausible train speed in degrees per second (~100 km/h), so that a bad report cannot fling a marker away
+MAX_SPEED = 0.00035
+
+# upcoming trains shown for each station
+ARRIVALS_PER_STATION = 3
+
+# moving trains reported further than this many meters from their track are placed by their next stop instead
+MAX_SNAP_DISTANCE = 250
+
+
+class TrainPositions(NamedTuple):
+    ids: ndarray
+    route_codes: ndarray
+    station_codes: ndarray
+    current_status: ndarray
+    # station each train is moving towards, or stopped at
+    target_station_codes: ndarray
+    x: ndarray
+    y: ndarray
+    # screen units per second along the current link, and the screen position where that motion ends
+    vx: ndarray
+    vy: ndarray
+    target_x: ndarray
+    target_y: ndarray
+    timestamp: float
+
+
+class VehicleMarkers(NamedTuple):
+    # vehicles of the geographic layer, with codes into the route ids of this update and into the agency's
+    # geographic modes
+    ids: ndarray
+    route_ids: ndarray
+    route_codes: ndarray
+    mode_codes: ndarray
+    longitude: ndarray
+    latitude: ndarray
+
 
+class TrainMarkers(NamedTuple):
+    # codes into System.marker_legend, which the browser turns into marker colors and hover text
+    ids: ndarray
+    route_codes: ndarray
+    station_codes: ndarray
+    current_status: ndarray
+    target_station_codes: ndarray
+    x: ndarray
+    y: ndarray
+    vx: ndarray
+    vy: ndarray
+    timestamp: float
+    # route codes and POSIX times of the next ARRIVALS_PER_STATION arrivals at each station, route code -1 for none
+    arrival_route_codes: ndarray
+    arrival_times: ndarray
+    # None unless the route set has a geographic layer
+    other_vehicles: Optional[VehicleMarkers]
 
 
 def _get_portion_of_distance_traveled(p1s, p2s, p3s, vehicle_stop_status):
@@ -26,66 +100,419 @@ def _midpoint(p1s, p2s, percent):
     return p1s + (p2s - p1s) * percent[:, newaxis]
 
 
+def _advance(positions, velocities, targets, elapsed):
+    # positions after moving at velocities for elapsed seconds, stopping at the targets as the browser does
+    speeds_squared = (velocities ** 2).sum(axis=1)
+    moving = speeds_squared > 0
+    arrivals = ((targets - positions) * velocities).sum(axis=1) / where(moving, speeds_squared, 1)
+    elapsed = where(moving, clip(elapsed, 0, clip(arrivals, 0, None)), 0)
+    return positions + velocities * elapsed[:, newaxis]
+
+
 class System:
     station_data: pd.DataFrame
     links_data: pd.DataFrame
+    lookup_misses: int
     _gtfs: GTFSRealtime
     _map_view: bool
+    # lookup tables stored as they are in a runtime bundle
+    _BUNDLED_ARRAYS = ['_station_positions_map', '_station_positions_screen', '_link_rows',
+                       '_previous_station_positions_map', '_previous_station_positions_screen', '_link_route_codes',
+                       '_link_target_station_codes']
 
-    def __init__(self, path_to_station_data: str,
-                 path_to_links_data: str,
-                 path_to_stop_codes_station_id_crosswalk: str,
-                 gtfs_realtime_url: str):
+    def __init__(self, agency: AgencyConfig,
+                 trip_updates_interval: Optional[float] = None,
+                 client: Optional[FeedClient] = None,
+                 route_set: Optional[str] = None):
         cols_to_keep = ['station_id', 'name', 'x', 'y', 'stop_lat', 'stop_lon', 'endpoint']
-        self.station_data = pd.read_csv(path_to_station_data, usecols=cols_to_keep, index_col='station_id')
+        self.station_data = pd.read_csv(agency.station_data, usecols=cols_to_keep, index_col='station_id')
 
-        self.links_data = (pd.read_csv(path_to_links_data, dtype={'source_station_id': 'category',
-                                                                 'target_station_id': 'category',
-                                                                 'route_id': 'category'})
+        self.links_data = (pd.read_csv(agency.links_data, dtype={'source_station_id': 'category',
+                                                                'target_station_id': 'category',
+                                                                'route_id': 'category'})
                            .drop(columns=['Unnamed: 0']))
-        self._previous_station = pd.read_csv(path_to_links_data).set_index(
-            ['route_id', 'target_station_id', 'direction'])
+        self._build_lookup_tables()
+        # without track shapes, every link is snapped to as a straight line between its stations; the shapes are built
+        # from the agency's GTFS, which a checkout does not have, so a missing file is only warned about
+        if agency.track_shapes is not None and not os.path.exists(agency.track_shapes):
+            logger.warning("%s is missing, so %s's trains are snapped to straight links; build it with `python -m "
+                           "ttracker.scripts.build_static_data --only track_shapes`.", agency.track_shapes, agency.name)
+        path_to_track_shapes = optional_path(agency.track_shapes)
+        track_shapes = None if path_to_track_shapes is None else pd.read_csv(path_to_track_shapes)
+        self._snapper = TrackSnapper.from_links(self.links_data, self.station_data, self._link_route_codes,
+                                                track_shapes, max_distance=MAX_SNAP_DISTANCE)
+        self._start(GTFSRealtime(agency,
+                                 trip_updates_interval=trip_updates_interval,
+                                 client=client,
+                                 route_set=route_set))
 
-        self._gtfs = GTFSRealtime(gtfs_realtime_url, path_to_stop_codes_station_id_crosswalk)
-    def update_trains(self):
+    @classmethod
+    def from_bundle(cls,
+                    bundle: RuntimeBundle,
+                    agency: AgencyConfig,
+                    trip_updates_interval: Optional[float] = None,
+                    client: Optional[FeedClient] = None,
+                    route_set: Optional[str] = None) -> "System":
+        """Load a system from the lookup tables that ``bundle_arrays`` wrote to a runtime bundle.
+
+        Nothing is parsed or rebuilt, and the numeric tables stay views of the mapped bundle. ``station_data`` and
+        ``links_data`` are only needed to draw the map, which the bundle holds already drawn, so they are left unset.
+        """
+        system = cls.__new__(cls)
+        system.station_data = None
+        system.links_data = None
+        for name in cls._BUNDLED_ARRAYS:
+            setattr(system, name, bundle[name.lstrip('_')])
+        system._station_ids = pd.Index(bundle['station_ids'].astype(object))
+        system._station_names = bundle['station_names'].astype(object)
+        system._route_ids = pd.Index(bundle['route_ids'].astype(object))
+        system._route_colors = bundle['route_colors'].astype(object)
+        system._snapper = TrackSnapper.from_arrays({name[len('snapper.'):]: bundle[name] for name in
+                                                    bundle.names if name.startswith('snapper.')})
+        crosswalk = dict(zip(bundle['crosswalk_stop_codes'].tolist(), bundle['crosswalk_station_ids'].tolist()))
+        system._start(GTFSRealtime(agency, crosswalk, trip_updates_interval=trip_updates_interval,
+                                   client=client, route_set=route_set))
+        return system
+
+    def bundle_arrays(self) -> Dict[str, ndarray]:
+        # everything from_bundle needs, as arrays of fixed-width dtypes
+        arrays = {name.lstrip('_'): getattr(self, name) for name in self._BUNDLED_ARRAYS}
+        arrays.update(station_ids=self._station_ids.to_numpy(dtype=str),
+                      station_names=self._station_names.astype(str),
+                      route_ids=self._route_ids.to_numpy(dtype=str),
+                      route_colors=self._route_colors.astype(str),
+                      crosswalk_stop_codes=asarray(list(self._gtfs._station_ids_by_stop_code), dtype=int64),
+                      crosswalk_station_ids=asarray(list(self._gtfs._station_ids_by_stop_code.values()), dtype=str))
+        arrays.update({f"snapper.{name}": array for name, array in self._snapper.to_arrays().items()})
+        return arrays
+
+    def _start(self, gtfs: GTFSRealtime):
+        # state that changes as the feed is followed, the same however the lookup tables were loaded
+        self.lookup_misses = 0
+        self._last_train_positions = None
+        self._last_positions = None
+        self._last_described_positions = None
+        self._last_trains = None
+        # last report of each vehicle and where it was placed, to only place the vehicles that changed
+        self._vehicles = VehicleTable()
+        # predicted arrivals at every station, from TripUpdates
+        self._arrivals = ArrivalIndex(len(self._station_ids))
+        # index into the agency's geographic modes of every route id of the geographic layer seen so far
+        self._route_modes = {}
+        self._gtfs = gtfs
+        # stage timings and counters of this agency
+        agency = gtfs.agency.name
+        self._geometry_seconds = stage_timer("geometry", agency)
+        self._describe_seconds = stage_timer("describe", agency)
+        self._arrivals_index_seconds = stage_timer("arrivals_index", agency)
+        self._vehicles_placed = REGISTRY.counter("ttracker_vehicles_placed",
+                                                 "Vehicles placed on the map again for a changed report.",
+                                                 agency=agency)
+        self._lookup_misses = REGISTRY.counter("ttracker_link_lookup_misses",
+                                               "Trains dropped for an unknown route, station and direction.",
+                                               agency=agency)
+
+    @property
+    def agency(self) -> AgencyConfig:
+        return self._gtfs.agency
+
+    @property
+    def stale(self) -> bool:
+        # true while the feed cannot be fetched and the last good positions are being served
+        return self._gtfs.stale
+
+    @property
+    def has_geographic_layer(self) -> bool:
+        return bool(self._gtfs.route_set.geographic)
+
+    @property
+    def n_stations(self) -> int:
+        return len(self._station_ids)
+
+    @property
+    def station_positions_map(self) -> ndarray:
+        # longitude and latitude of every station, by station code
+        return self._station_positions_map
+
+    @property
+    def feed_update_interval(self) -> Optional[float]:
+        # observed seconds between updates of the vehicle positions feed
+        return self._gtfs.feed_update_interval
+
+    def _build_lookup_tables(self):
+        # integer codes for routes and stations, and station coordinates as contiguous arrays indexed by those codes
+        self._station_ids = self.station_data.index
+        self._station_names = self.station_data['name'].to_numpy()
+        self._station_positions_map = self.station_data[['stop_lon', 'stop_lat']].to_numpy(dtype=float64)
+        self._station_positions_screen = self.station_data[['x', 'y']].to_numpy(dtype=float64)
+        self._route_ids = pd.Index(self.links_data['route_id'].cat.categories)
+        # trains are colored by line, so both red branches are "red" and all green branches are "green"
+        self._route_colors = self._route_ids.str.split("-").str[0].to_numpy()
+
+        # (route, next station, direction) -> row of the link arriving at that station, -1 if there is none
+        route_codes = self._route_ids.get_indexer(self.links_data['route_id'])
+        target_station_codes = self._station_ids.get_indexer(self.links_data['target_station_id'])
+        self._link_route_codes = route_codes
+        self._link_target_station_codes = target_station_codes
+        directions = self.links_data['direction'].to_numpy()
+        self._link_rows = full((len(self._route_ids), len(self._station_ids), 2), -1, dtype=int32)
+        known = (route_codes >= 0) & (target_station_codes >= 0)
+        # assign in reverse so that the first link listed for a combination wins, like a .loc lookup would
+        link_rows = arange(len(self.links_data), dtype=int32)[known][::-1]
+        self._link_rows[route_codes[known][::-1], target_station_codes[known][::-1], directions[known][::-1]] = link_rows
+
+        self._previous_station_positions_map = self.links_data[['lon_source', 'lat_source']].to_numpy(dtype=float64)
+        self._previous_station_positions_screen = self.links_data[['x_source', 'y_source']].to_numpy(dtype=float64)
+
+    def _find_link_rows(self, route_codes, station_codes, direction_ids):
+        direction_codes = asarray(direction_ids, dtype=int64)
+        link_rows = full(len(route_codes), -1, dtype=int32)
+        valid = (route_codes >= 0) & (station_codes >= 0) & ((direction_codes == 0) | (direction_codes == 1))
+        link_rows[valid] = self._link_rows[route_codes[valid], station_codes[valid], direction_codes[valid]]
+        return link_rows
+
+    def locate_trains(self) -> TrainPositions:
         train_position_data = self._gtfs.get_train_positions()
-        current_position_map = train_position_data[['longitude', 'latitude']].values
+        # the feed has not changed since the last update, so neither have the trains
+        if train_position_data is self._last_train_positions:
+            return self._last_positions
+        self._last_train_positions = train_position_data
+        with self._geometry_seconds.time():
+            self._last_positions = self._locate_trains(train_position_data)
+        return self._last_positions
+
+    def _locate_trains(self, train_position_data: pd.DataFrame) -> TrainPositions:
+        # only vehicles whose report changed since the last message are placed again; the others keep their place in
+        # the vehicle table, and only their speed changes if they reported again without moving
+        ids = train_position_data['id'].to_numpy()
+        route_codes = self._route_ids.get_indexer(train_position_data['route_id'])
+        station_codes = self._station_ids.get_indexer(train_position_data['next_station_id'])
+        directions = train_position_data['direction_id'].to_numpy()
+        current_status = train_position_data['current_status'].to_numpy()
+        positions_map = train_position_data[['longitude', 'latitude']].to_numpy(dtype=float64)
+        timestamps = train_position_data['timestamp'].to_numpy(dtype=float64)
+
+        vehicles = self._vehicles
+        slots, new = vehicles.assign(ids)
+        moved = new | vehicles.moved(slots, positions_map)
+        changed = moved | vehicles.changed(slots, route_codes, station_codes, directions, current_status)
+        self._vehicles_placed.inc(int(changed.sum()))
+        self._place_vehicles(slots[changed], new[changed], route_codes[changed], station_codes[changed],
+                             directions[changed], current_status[changed], positions_map[changed],
+                             timestamps[changed])
+
+        # reported again from the same place, so not moving since the last report
+        reported_again = ~changed & (timestamps > vehicles.report_timestamps[slots])
+        vehicles.speeds[slots[reported_again]] = 0
+        vehicles.last_moved[slots[moved]] = timestamps[moved]
+        now_stopped = (current_status == 1) & (new | (vehicles.current_status[slots] != 1)
+                                               | (vehicles.station_codes[slots] != station_codes))
+        vehicles.stopped_since[slots[now_stopped]] = timestamps[now_stopped]
+        vehicles.route_codes[slots] = route_codes
+        vehicles.station_codes[slots] = station_codes
+        vehicles.directions[slots] = directions
+        vehicles.current_status[slots] = current_status
+        vehicles.positions_map[slots] = positions_map
+        vehicles.report_timestamps[slots] = timestamps
+
+        # trains on neither a known link nor near their track are counted and dropped instead of failing the update
+        link_rows = vehicles.link_rows[slots]
+        found = link_rows >= 0
+        self.lookup_misses += int((~found).sum())
+        self._lookup_misses.inc(int((~found).sum()))
+        slots, link_rows, current_status = slots[found], link_rows[found], current_status[found]
+
+        # turn each train's speed into screen units per second along its link; stopped trains don't move
+        next_station_codes = self._link_target_station_codes[link_rows]
+        # a train placed by snapping may report a stop whose station is not on the map, e.g. one of the crosswalk's
+        # commuter rail stations; it is described by the station its link leads to instead
+        station_codes = station_codes[found]
+        station_codes = where(station_codes >= 0, station_codes, next_station_codes)
+        next_station_position_screen = self._station_positions_screen[next_station_codes]
+        link_lengths_map = vehicles.link_lengths_map[slots]
+        progress_rates = where((link_lengths_map > 0) & (current_status != 1),
+                               vehicles.speeds[slots] / where(link_lengths_map > 0, link_lengths_map, 1), 0)
+        velocities_screen = vehicles.link_vectors_screen[slots] * progress_rates[:, newaxis]
+        # each train was placed where its own report put it, but the browser extrapolates every train from the time of
+        # the message, so move each one on to that time
+        feed_timestamp = float(self._gtfs.feed_timestamp)
+        positions_screen = _advance(column_stack([vehicles.x[slots], vehicles.y[slots]]), velocities_screen,
+                                    next_station_position_screen, feed_timestamp - vehicles.report_timestamps[slots])
+
+        return TrainPositions(ids=ids[found],
+                              route_codes=route_codes[found],
+                              station_codes=station_codes,
+                              current_status=current_status,
+                              target_station_codes=next_station_codes,
+                              x=positions_screen[:, 0],
+                              y=positions_screen[:, 1],
+                              vx=velocities_screen[:, 0],
+                              vy=velocities_screen[:, 1],
+                              target_x=next_station_position_screen[:, 0],
+                              target_y=next_station_position_screen[:, 1],
+                              timestamp=feed_timestamp)
+
+    def _place_vehicles(self, slots, new, route_codes, station_codes, directions, current_status, positions_map,
+                        timestamps):
+        # look up the link of each train's next stop, and snap each train onto the track of its route and direction
+        vehicles = self._vehicles
+        feed_link_rows = self._find_link_rows(route_codes, station_codes, directions)
+        snapped = self._snapper.snap(positions_map, route_codes, directions)
+
+        # moving trains go where the track says they are, even if the feed's next stop is off; stopped trains stay at
+        # the station they are stopped at
+        use_snap = (snapped.link_rows >= 0) & ((current_status != 1) | (feed_link_rows < 0))
+        link_rows = where(use_snap, snapped.link_rows, feed_link_rows)
+        found = link_rows >= 0
+        vehicles.link_rows[slots[~found]] = -1
+        slots, new, link_rows, current_status = slots[found], new[found], link_rows[found], current_status[found]
+        positions_map, timestamps = positions_map[found], timestamps[found]
+        use_snap, snapped_fractions = use_snap[found], snapped.fractions[found]
 
         # set "next station" equal to destination for moving trains and current station for stopped ones
-        next_station_position_map = self.station_data.loc[
-            train_position_data['next_station_id'], ['stop_lon', 'stop_lat']].values
-        next_station_position_screen = self.station_data.loc[
-            train_position_data['next_station_id'], ['x', 'y']].values
+        next_station_codes = self._link_target_station_codes[link_rows]
+        next_station_position_map = self._station_positions_map[next_station_codes]
+        next_station_position_screen = self._station_positions_screen[next_station_codes]
 
         # set "previous station" equal to origin for moving trains and last stopped station for stopped ones
-        indexer = list(
-            train_position_data[['route_id', 'next_station_id', 'direction_id']].itertuples(index=False, name=None))
-        previous_station_position_map = self._previous_station.loc[
-            indexer, ['lon_source', 'lat_source']].values
-        previous_station_position_screen = self._previous_station.loc[
-            indexer, ['x_source', 'y_source']].values
+        previous_station_position_map = self._previous_station_positions_map[link_rows]
+        previous_station_position_screen = self._previous_station_positions_screen[link_rows]
 
         # get portion of distance traveled between origin and destination stations
         portion_of_distance_traveled = _get_portion_of_distance_traveled(previous_station_position_map,
                                                                          next_station_position_map,
-                                                                         current_position_map,
-                                                                         train_position_data['current_status'].values)
+                                                                         positions_map,
+                                                                         current_status)
+        portion_of_distance_traveled[use_snap] = snapped_fractions[use_snap]
         screen_coordinates_moving_trains = _midpoint(previous_station_position_screen,
                                                      next_station_position_screen,
                                                      portion_of_distance_traveled)
+        link_lengths_map = sqrt(((next_station_position_map - previous_station_position_map) ** 2).sum(axis=1))
+
+        # progress along the current link since the vehicle's last report, over the time between the two reports;
+        # from where it was placed on the same link, or where its last position falls on a link it has since entered
+        seen = ~new & (vehicles.link_rows[slots] >= 0)
+        previous_portions = where(vehicles.link_rows[slots] == link_rows,
+                                  vehicles.fractions[slots],
+                                  _get_portion_of_distance_traveled(previous_station_position_map,
+                                                                    next_station_position_map,
+                                                                    vehicles.positions_map[slots],
+                                                                    zeros(len(slots))))
+        elapsed = timestamps - vehicles.report_timestamps[slots]
+        distances = (portion_of_distance_traveled - previous_portions) * link_lengths_map
+        # without a new report since last time, keep the last estimate
+        speeds = where(elapsed > 0, distances / where(elapsed > 0, elapsed, 1), vehicles.speeds[slots])
+        speeds = clip(where(seen, speeds, 0), 0, MAX_SPEED)
 
-        # Train positions
-        x = screen_coordinates_moving_trains[:, 0]
-        y = screen_coordinates_moving_trains[:, 1]
-
-        # Build hover text
-        return (x,
-                y,
-                train_position_data['route_id'].str.split("-").str[0].values,
-                (("Train: " + train_position_data['id'].reset_index(drop=True))
-                 + "<br>" +
-                 (train_position_data['current_status'].replace({0: "Next Stop: ",
-                                                                            1: "Stopped At: ",
-                                                                            2: "Next Stop: "}).reset_index(drop=True)) +
-                 self.station_data.loc[train_position_data['next_station_id'], 'name'].reset_index(
-                     drop=True)).values)
\ No newline at end of file
+        vehicles.link_rows[slots] = link_rows
+        vehicles.fractions[slots] = portion_of_distance_traveled
+        vehicles.x[slots] = screen_coordinates_moving_trains[:, 0]
+        vehicles.y[slots] = screen_coordinates_moving_trains[:, 1]
+        vehicles.link_vectors_screen[slots] = next_station_position_screen - previous_station_position_screen
+        vehicles.link_lengths_map[slots] = link_lengths_map
+        vehicles.speeds[slots] = speeds
+
+    def update_arrivals(self) -> bool:
+        # index the predictions of the trips that changed in a new TripUpdates message; False without a new message
+        trip_arrivals = self._gtfs.get_trip_arrivals()
+        if trip_arrivals is None:
+            return False
+        changed, ended = trip_arrivals
+        with self._arrivals_index_seconds.time():
+            # look the codes of all trips up at once, then hand each trip its slice of them
+            trips = list(changed.values())
+            route_codes = self._route_ids.get_indexer([trip.route_id for trip in trips])
+            station_codes = self._station_ids.get_indexer([station_id for trip in trips
+                                                           for station_id in trip.station_ids])
+            ends = cumsum([len(trip.station_ids) for trip in trips], dtype=int64)
+            self._arrivals.update({trip_id: (route_code, station_codes[end - len(trip.times):end], trip.times)
+                                   for trip_id, trip, route_code, end in zip(changed, trips, route_codes, ends)},
+                                  ended)
+        return True
+
+    def next_arrivals(self, station_id: str, n: int = ARRIVALS_PER_STATION, after: Optional[float] = None) -> Arrivals:
+        # the next n predicted arrivals at a station, from the time of the last feed message on by default
+        after = self._gtfs.feed_timestamp if after is None else after
+        return self._arrivals.at_station(self._station_ids.get_loc(station_id), after, n)
+
+    def next_arrivals_on_route(self, route_id: str, n: int = 10, after: Optional[float] = None) -> Arrivals:
+        after = self._gtfs.feed_timestamp if after is None else after
+        return self._arrivals.on_route(self._route_ids.get_loc(route_id), after, n)
+
+    @property
+    def vehicles(self) -> VehicleTable:
+        # per-vehicle state kept across feed messages, including speed, dwell and when each vehicle last moved
+        return self._vehicles
+
+    def stalled_trains(self, after: float = 300) -> ndarray:
+        # ids of the trains that have not moved for ``after`` seconds as of the last feed message
+        return self._vehicles.stalled(float(self._gtfs.feed_timestamp), after)
+
+    def marker_legend(self) -> dict:
+        # what the codes of TrainMarkers stand for; it only changes with the static data, so it is sent to the browser
+        # once rather than with every update
+        return {'station_names': self._station_names.tolist(),
+                'station_x': self._station_positions_screen[:, 0].tolist(),
+                'station_y': self._station_positions_screen[:, 1].tolist(),
+                'route_colors': self._route_colors.tolist(),
+                'route_names': self._route_ids.str.title().tolist(),
+                'arrivals_per_station': ARRIVALS_PER_STATION,
+                'status_labels': STATUS_LABELS.tolist(),
+                'modes': [label for _, label, _ in self._gtfs.agency.geographic_modes],
+                'mode_colors': [color for _, _, color in self._gtfs.agency.geographic_modes],
+                # the geographic layer is sent relative to the middle of the stations
+                'geographic_origin': self._station_positions_map.mean(axis=0).tolist()}
+
+    def upcoming_arrivals(self, after: float) -> Tuple[ndarray, ndarray]:
+        # route codes and times of the next ARRIVALS_PER_STATION arrivals at every station, one row per station code
+        return self._arrivals.upcoming(after, ARRIVALS_PER_STATION)
+
+    def describe_trains(self, positions: TrainPositions,
+                        arrivals: Optional[Tuple[ndarray, ndarray]] = None) -> TrainMarkers:
+        # marker codes for the map; no strings are built per update, the browser looks the codes up in marker_legend.
+        # The arrivals are looked up in this system's index, unless they come from a shared snapshot
+        arrival_route_codes, arrival_times = (self.upcoming_arrivals(positions.timestamp) if arrivals is None
+                                              else arrivals)
+        return TrainMarkers(ids=positions.ids,
+                            route_codes=positions.route_codes,
+                            station_codes=positions.station_codes,
+                            current_status=positions.current_status,
+                            target_station_codes=positions.target_station_codes,
+                            x=positions.x,
+                            y=positions.y,
+                            vx=positions.vx,
+                            vy=positions.vy,
+                            timestamp=positions.timestamp,
+                            arrival_route_codes=arrival_route_codes,
+                            arrival_times=arrival_times,
+                            other_vehicles=self.describe_other_vehicles(self._gtfs.other_vehicles))
+
+    def _route_mode(self, route_id: str) -> int:
+        mode = self._route_modes.get(route_id)
+        if mode is None:
+            mode = self._route_modes[route_id] = next(i for i, (prefix, _, _)
+                                                      in enumerate(self._gtfs.agency.geographic_modes)
+                                                      if route_id.startswith(prefix))
+        return mode
+
+    def describe_other_vehicles(self, vehicles: Optional[OtherVehicles]) -> Optional[VehicleMarkers]:
+        # the geographic layer is drawn as reported; only its route ids are coded, once per distinct route
+        if vehicles is None:
+            return None
+        route_codes, route_ids = pd.factorize(vehicles.route_ids)
+        mode_codes = asarray([self._route_mode(route_id) for route_id in route_ids], dtype=int64)
+        return VehicleMarkers(ids=vehicles.ids,
+                              route_ids=asarray(route_ids, dtype=object),
+                              route_codes=route_codes,
+                              mode_codes=mode_codes[route_codes] if len(route_ids) else route_codes,
+                              longitude=vehicles.longitude,
+                              latitude=vehicles.latitude)
+
+    def update_trains(self):
+        arrivals_changed = self.update_arrivals()
+        positions = self.locate_trains()
+        if positions is not self._last_described_positions or arrivals_changed:
+            self._last_described_positions = positions
+            with self._describe_seconds.time():
+                self._last_trains = self.describe_trains(positions)
+        return self._last_trains
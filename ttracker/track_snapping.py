@@ -0,0 +1,206 @@
+from typing import Dict, List, Mapping, NamedTuple, Optional
+
+import pandas as pd
+from numpy import (arange, argsort, asarray, bincount, clip, concatenate, cos, cumsum, diff, einsum, empty, flatnonzero,
+                   float64, floor, full, int32, int64, maximum, meshgrid, minimum, ndarray, ones, prod, radians, repeat,
+                   sqrt, where, zeros)
+
+# length of a degree of latitude, and of a degree of longitude at the equator, in meters
+METERS_PER_DEGREE_LATITUDE = 110_574.0
+METERS_PER_DEGREE_LONGITUDE = 111_320.0
+
+
+class LocalProjection:
+    """Equirectangular projection of lon/lat degrees onto meters around ``origin``.
+
+    Over the few tens of kilometers that a transit system covers, its distortion is far below GPS noise, and unlike a
+    full map projection it is a single multiply-add per coordinate.
+    """
+    scale: ndarray
+    origin: ndarray
+
+    def __init__(self, origin_lon: float, origin_lat: float):
+        self.origin = asarray([origin_lon, origin_lat], dtype=float64)
+        self.scale = asarray([METERS_PER_DEGREE_LONGITUDE * cos(radians(origin_lat)), METERS_PER_DEGREE_LATITUDE])
+
+    def __call__(self, lon_lat: ndarray) -> ndarray:
+        return (asarray(lon_lat, dtype=float64) - self.origin) * self.scale
+
+
+class SnappedPositions(NamedTuple):
+    # row of the link each vehicle was snapped to, -1 if its route and direction have no track
+    link_rows: ndarray
+    # distance traveled along the link, as a fraction of the link's length
+    fractions: ndarray
+    # meters between the reported position and the track
+    distances: ndarray
+
+
+class TrackSnapper:
+    """Snaps vehicle positions onto the track of their route and direction.
+
+    Every link is a polyline, projected to meters. The segments of each (route, direction) are bucketed into a uniform
+    grid of ``max_distance`` sized cells, each cell listing every segment of that route and direction that comes within
+    ``max_distance`` of it, so the candidates of a vehicle are exactly the list of its route, direction and cell. Each
+    refresh snaps all vehicles at once: the candidate lists of all vehicles are gathered together, and the projections
+    onto every candidate segment are computed with NumPy, keeping the nearest.
+    """
+    projection: LocalProjection
+    max_distance: float
+    # arrays that make up a built snapper, as stored in a runtime bundle
+    _ARRAYS = ['_segment_starts', '_segment_vectors', '_segment_links', '_segment_offsets', '_segment_groups',
+               '_link_lengths', '_grid_origin', '_grid_shape', '_cell_segments', '_cell_offsets']
+
+    def __init__(self,
+                 polylines: List[ndarray],
+                 route_codes: ndarray,
+                 directions: ndarray,
+                 projection: LocalProjection,
+                 max_distance: float = 250):
+        self.projection = projection
+        self.max_distance = max_distance
+        segment_starts, segment_ends, segment_links, segment_offsets = [], [], [], []
+        link_lengths = zeros(len(polylines), dtype=float64)
+        for link_row, polyline in enumerate(polylines):
+            points = projection(polyline)
+            segment_lengths = sqrt((diff(points, axis=0) ** 2).sum(axis=1))
+            if len(points) < 2 or segment_lengths.sum() == 0:
+                continue  # self-links at terminals have no track to snap to
+            # shapes repeat points, and a segment of zero length has no direction to project onto
+            kept = segment_lengths > 0
+            segment_starts.append(points[:-1][kept])
+            segment_ends.append(points[1:][kept])
+            segment_links.append(full(int(kept.sum()), link_row, dtype=int64))
+            segment_offsets.append(concatenate([[0], cumsum(segment_lengths)[:-1]])[kept])
+            link_lengths[link_row] = segment_lengths.sum()
+
+        self._segment_starts = concatenate(segment_starts) if segment_starts else empty((0, 2))
+        segment_ends = concatenate(segment_ends) if segment_ends else empty((0, 2))
+        self._segment_vectors = segment_ends - self._segment_starts
+        self._segment_links = concatenate(segment_links) if segment_links else empty(0, dtype=int64)
+        self._segment_offsets = concatenate(segment_offsets) if segment_offsets else empty(0)
+        self._link_lengths = link_lengths
+        # a vehicle may only snap onto segments of its own (route, direction)
+        self._n_groups = (int(asarray(route_codes).max()) + 1) * 2 if len(route_codes) else 0
+        self._segment_groups = (asarray(route_codes, dtype=int64)[self._segment_links] * 2
+                                + asarray(directions, dtype=int64)[self._segment_links])
+        self._build_grid(minimum(self._segment_starts, segment_ends), maximum(self._segment_starts, segment_ends))
+
+    def _build_grid(self, lower_corners: ndarray, upper_corners: ndarray):
+        # register each segment in every cell of its group that its bounding box, grown by max_distance, overlaps
+        lower_corners, upper_corners = lower_corners - self.max_distance, upper_corners + self.max_distance
+        self._grid_origin = lower_corners.min(axis=0) if len(lower_corners) else zeros(2)
+        lower_cells = floor((lower_corners - self._grid_origin) / self.max_distance).astype(int64)
+        upper_cells = floor((upper_corners - self._grid_origin) / self.max_distance).astype(int64)
+        self._grid_shape = upper_cells.max(axis=0) + 1 if len(upper_cells) else ones(2, dtype=int64)
+
+        self._n_cells = int(prod(self._grid_shape))
+        cells, segments = [], []
+        for segment, (lower, upper) in enumerate(zip(lower_cells, upper_cells)):
+            columns, rows = meshgrid(arange(lower[0], upper[0] + 1), arange(lower[1], upper[1] + 1))
+            cells.append(self._segment_groups[segment] * self._n_cells + (columns * self._grid_shape[1] + rows).ravel())
+            segments.append(full(columns.size, segment, dtype=int64))
+        cells = concatenate(cells) if cells else empty(0, dtype=int64)
+        order = argsort(cells, kind='stable')
+        # the segments of cell i of group g are _cell_segments[_cell_offsets[j]:_cell_offsets[j + 1]],
+        # with j = g * n_cells + i
+        self._cell_segments = (concatenate(segments) if segments else empty(0, dtype=int64))[order].astype(int32)
+        self._cell_offsets = concatenate([[0], cumsum(bincount(cells, minlength=self._n_groups * self._n_cells))
+                                          ]).astype(int32)
+
+    @classmethod
+    def from_links(cls,
+                   links_data: pd.DataFrame,
+                   station_positions: pd.DataFrame,
+                   route_codes: ndarray,
+                   track_shapes: Optional[pd.DataFrame] = None,
+                   max_distance: float = 250) -> "TrackSnapper":
+        """Build a snapper for ``links_data``, whose rows are the link rows returned by ``snap``.
+
+        ``station_positions`` holds the ``stop_lon`` and ``stop_lat`` of every station. ``track_shapes`` holds the
+        track between the two stations of each link as ``route_id``, ``source_station_id``, ``target_station_id``,
+        ``sequence``, ``lon`` and ``lat`` rows; links without a shape are drawn as a straight line between their
+        stations.
+        """
+        shapes = {}
+        if track_shapes is not None:
+            for key, points in track_shapes.sort_values('sequence').groupby(['route_id', 'source_station_id',
+                                                                             'target_station_id'], observed=True):
+                shapes[key] = points[['lon', 'lat']].to_numpy(dtype=float64)
+
+        sources = station_positions.loc[links_data['source_station_id'], ['stop_lon', 'stop_lat']].to_numpy(float64)
+        targets = station_positions.loc[links_data['target_station_id'], ['stop_lon', 'stop_lat']].to_numpy(float64)
+        keys = zip(links_data['route_id'], links_data['source_station_id'], links_data['target_station_id'])
+        polylines = [shapes.get(key, asarray([source, target])) for key, source, target in zip(keys, sources, targets)]
+
+        origin = station_positions[['stop_lon', 'stop_lat']].to_numpy(float64).mean(axis=0)
+        return cls(polylines, route_codes, links_data['direction'].to_numpy(), LocalProjection(*origin), max_distance)
+
+    def to_arrays(self) -> Dict[str, ndarray]:
+        arrays = {name.lstrip('_'): getattr(self, name) for name in self._ARRAYS}
+        arrays['projection_origin'] = self.projection.origin
+        arrays['max_distance'] = asarray(self.max_distance, dtype=float64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays: Mapping[str, ndarray]) -> "TrackSnapper":
+        # the inverse of to_arrays; nothing is rebuilt, so the arrays may be read-only views of a mapped file
+        snapper = cls.__new__(cls)
+        for name in cls._ARRAYS:
+            setattr(snapper, name, arrays[name.lstrip('_')])
+        snapper.projection = LocalProjection(*arrays['projection_origin'])
+        snapper.max_distance = float(arrays['max_distance'])
+        snapper._n_cells = int(prod(snapper._grid_shape))
+        snapper._n_groups = (len(snapper._cell_offsets) - 1) // snapper._n_cells
+        return snapper
+
+    def snap(self, positions: ndarray, route_codes: ndarray, directions: ndarray) -> SnappedPositions:
+        # positions are lon/lat; vehicles further than max_distance meters from their track are not snapped
+        n_vehicles = len(positions)
+        link_rows = full(n_vehicles, -1, dtype=int64)
+        fractions = zeros(n_vehicles, dtype=float64)
+        distances = full(n_vehicles, float('inf'))
+        if n_vehicles == 0:
+            return SnappedPositions(link_rows, fractions, distances)
+
+        points = self.projection(positions)
+        route_codes, directions = asarray(route_codes, dtype=int64), asarray(directions, dtype=int64)
+        groups = where((route_codes >= 0) & ((directions == 0) | (directions == 1)), route_codes * 2 + directions, -1)
+
+        # gather the segment list of each vehicle's route, direction and cell, as (vehicle, segment) pairs
+        vehicle_cells = floor((points - self._grid_origin) / self.max_distance).astype(int64)
+        indexed = flatnonzero(((vehicle_cells >= 0) & (vehicle_cells < self._grid_shape)).all(axis=1)
+                              & (groups >= 0) & (groups < self._n_groups))
+        cells = (groups[indexed] * self._n_cells
+                 + vehicle_cells[indexed, 0] * self._grid_shape[1] + vehicle_cells[indexed, 1])
+        counts = self._cell_offsets[cells + 1] - self._cell_offsets[cells]
+        vehicles = repeat(indexed, counts)
+        first_pairs = cumsum(counts) - counts
+        segments = self._cell_segments[repeat(self._cell_offsets[cells] - first_pairs, counts) + arange(counts.sum())]
+
+        # project each vehicle onto each of its candidate segments
+        starts, vectors = self._segment_starts[segments], self._segment_vectors[segments]
+        offsets = points[vehicles] - starts
+        squared_lengths = einsum('ij,ij->i', vectors, vectors)
+        # bundles built before zero-length segments were dropped may still hold some; they project onto their start
+        t = clip(einsum('ij,ij->i', offsets, vectors) / where(squared_lengths > 0, squared_lengths, 1), 0, 1)
+        candidate_distances = sqrt(((offsets - vectors * t[:, None]) ** 2).sum(axis=1))
+
+        # keep the nearest candidate of each vehicle: sorted by vehicle, then distance, it is the first of its vehicle.
+        # Both go into one float key, as distances are capped below one when scaled, which sorts far faster than a
+        # lexsort
+        order = argsort(vehicles + minimum(candidate_distances, 2 * self.max_distance) / (2 * self.max_distance + 1),
+                        kind='stable')
+        vehicles = vehicles[order]
+        first = ones(len(vehicles), dtype=bool)
+        first[1:] = vehicles[1:] != vehicles[:-1]
+        vehicles, nearest = vehicles[first], order[first]
+        keep = candidate_distances[nearest] <= self.max_distance
+        vehicles, nearest = vehicles[keep], nearest[keep]
+        segments = segments[nearest]
+
+        link_rows[vehicles] = self._segment_links[segments]
+        fractions[vehicles] = ((self._segment_offsets[segments] + t[nearest] * sqrt(squared_lengths[nearest]))
+                               / self._link_lengths[link_rows[vehicles]])
+        distances[vehicles] = candidate_distances[nearest]
+        return SnappedPositions(link_rows, fractions, distances)
@@ -0,0 +1,126 @@
+from typing import Dict, List, Tuple
+
+from numpy import asarray, bool_, concatenate, empty, float64, int8, int32, ndarray, zeros
+
+
+class VehicleTable:
+    """State of every vehicle in service, kept from one feed message to the next as one array per field.
+
+    Each vehicle id owns a slot, an index into every array, for as long as it is in the feed; the slots of vehicles
+    that leave service are reused by the next vehicles that enter it, so the arrays only grow with the most vehicles
+    ever in service at once. Besides the last report of each vehicle and where it was placed on the map, the table
+    keeps what can only be derived across reports: the speed along its track, since when it has been stopped at its
+    current stop, and when it last moved.
+    """
+    # the last report of the vehicle, compared with the next one to find the vehicles that changed
+    route_codes: ndarray
+    station_codes: ndarray
+    directions: ndarray
+    current_status: ndarray
+    positions_map: ndarray
+    report_timestamps: ndarray
+    # where the last report placed the vehicle: its link, -1 if it could not be placed, and how far along it
+    link_rows: ndarray
+    fractions: ndarray
+    x: ndarray
+    y: ndarray
+    # screen vector and length in degrees of the link, to turn speeds into velocities without looking the link up
+    link_vectors_screen: ndarray
+    link_lengths_map: ndarray
+    # degrees per second along the track
+    speeds: ndarray
+    # report timestamp since which the vehicle has been stopped at its stop, and at which it last moved
+    stopped_since: ndarray
+    last_moved: ndarray
+    ids: ndarray
+    # dtype and shape of one slot of each array
+    _COLUMNS = {'route_codes': (int32, ()), 'station_codes': (int32, ()), 'directions': (int8, ()),
+                'current_status': (int8, ()), 'positions_map': (float64, (2,)), 'report_timestamps': (float64, ()),
+                'link_rows': (int32, ()), 'fractions': (float64, ()), 'x': (float64, ()), 'y': (float64, ()),
+                'link_vectors_screen': (float64, (2,)), 'link_lengths_map': (float64, ()), 'speeds': (float64, ()),
+                'stopped_since': (float64, ()), 'last_moved': (float64, ())}
+    _slots: Dict[str, int]
+    _free: List[int]
+    _transient: List[int]
+
+    def __init__(self, capacity: int = 256):
+        capacity = max(capacity, 1)
+        self._slots = {}
+        self._free = []
+        self._transient = []
+        self.ids = empty(0, dtype=object)
+        for name, (column_dtype, shape) in self._COLUMNS.items():
+            setattr(self, name, empty((0,) + shape, dtype=column_dtype))
+        self._grow(capacity)
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.ids)
+
+    def _grow(self, capacity: int):
+        added = capacity - self.capacity
+        for name, (column_dtype, shape) in self._COLUMNS.items():
+            setattr(self, name, concatenate([getattr(self, name), zeros((added,) + shape, dtype=column_dtype)]))
+        self.ids = concatenate([self.ids, empty(added, dtype=object)])
+        # handed out lowest first
+        self._free.extend(range(capacity - 1, capacity - added - 1, -1))
+
+    def assign(self, ids: ndarray) -> Tuple[ndarray, ndarray]:
+        """Slots of the vehicles in a new report, and which of them just entered service.
+
+        Vehicles that are not in ``ids`` left service, and their slots are freed. A vehicle listed more than once is
+        given a slot for each listing, which only lasts for this report.
+        """
+        for slot in self._transient:
+            self.ids[slot] = None
+            self._free.append(slot)
+        self._transient = []
+        present = set(ids.tolist())
+        for vehicle_id in [vehicle_id for vehicle_id in self._slots if vehicle_id not in present]:
+            slot = self._slots.pop(vehicle_id)
+            self.ids[slot] = None
+            self._free.append(slot)
+
+        slots = empty(len(ids), dtype=int32)
+        new = zeros(len(ids), dtype=bool_)
+        listed = set()
+        for i, vehicle_id in enumerate(ids.tolist()):
+            slot = self._slots.get(vehicle_id)
+            if slot is None or vehicle_id in listed:
+                if not self._free:
+                    self._grow(2 * self.capacity)
+                slot = self._free.pop()
+                new[i] = True
+                self.ids[slot] = vehicle_id
+                if vehicle_id in listed:
+                    self._transient.append(slot)
+                else:
+                    self._slots[vehicle_id] = slot
+            listed.add(vehicle_id)
+            slots[i] = slot
+        return slots, new
+
+    def moved(self, slots: ndarray, positions_map: ndarray) -> ndarray:
+        return (self.positions_map[slots] != positions_map).any(axis=1)
+
+    def changed(self, slots: ndarray, route_codes: ndarray, station_codes: ndarray, directions: ndarray,
+                current_status: ndarray) -> ndarray:
+        # vehicles whose report differs from their last one in anything but the position that places them on the map
+        return ((self.route_codes[slots] != route_codes) | (self.station_codes[slots] != station_codes)
+                | (self.directions[slots] != directions) | (self.current_status[slots] != current_status))
+
+    def in_service(self) -> ndarray:
+        return asarray(sorted(self._slots.values()), dtype=int32)
+
+    def dwell_seconds(self, slots: ndarray, now: float) -> ndarray:
+        # seconds each vehicle has been stopped at its current stop, 0 for vehicles in motion
+        return ((now - self.stopped_since[slots]) * (self.current_status[slots] == 1)).clip(0)
+
+    def stalled(self, now: float, after: float) -> ndarray:
+        """Ids of the vehicles in service that have not moved for ``after`` seconds at ``now``."""
+        slots = self.in_service()
+        return self.ids[slots[now - self.last_moved[slots] >= after]]
+
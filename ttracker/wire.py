@@ -0,0 +1,102 @@
+import json
+from base64 import b64encode
+from types import MappingProxyType
+from typing import Any, Mapping, NamedTuple
+
+from numpy import asarray, ascontiguousarray, clip, dtype, iinfo, int16, ndarray, rint, uint8, uint16, where
+
+from ttracker.system import TrainMarkers, VehicleMarkers
+
+# int16 steps per screen unit per second: up to 32 screen units per second, in steps of a thousandth
+VELOCITY_SCALE = 1000
+# degrees from the geographic origin that the int16 positions of the geographic layer reach, in steps of ~7 m
+GEOGRAPHIC_EXTENT = 2.0
+# route code of an empty arrival slot, and the furthest ahead an arrival is sent, in seconds
+NO_ARRIVAL = iinfo(uint8).max
+MAX_ARRIVAL_SECONDS = iinfo(uint16).max
+
+
+def typed_array(values: ndarray, array_dtype) -> dict:
+    # Plotly's typed array spec: the base64 of the little-endian values, and the dtype to read them back as
+    array = ascontiguousarray(values, dtype=dtype(array_dtype).newbyteorder('<'))
+    return {'dtype': array.dtype.str[1:], 'bdata': b64encode(array.tobytes()).decode()}
+
+
+def _quantize(values: ndarray, scale: float) -> ndarray:
+    limits = iinfo(int16)
+    return clip(rint(values * scale), limits.min, limits.max).astype(int16)
+
+
+class EncodedTrains(NamedTuple):
+    # read-only payload, and the same payload as JSON without its closing brace
+    payload: Mapping[str, Any]
+    json: str
+    timestamp: float
+
+    def age(self, now: float) -> float:
+        # seconds since the message that every position was advanced to, which the browser extrapolates over as well
+        return max(now - self.timestamp, 0) if self.timestamp > 0 else 0
+
+    def with_age(self, now: float) -> dict:
+        # the age is the only part of the payload that depends on when it is sent
+        return dict(self.payload, age=self.age(now))
+
+    def json_with_age(self, now: float) -> str:
+        return f'{self.json},"age":{self.age(now)!r}}}'
+
+
+class TrainEncoder:
+    """Encodes TrainMarkers into the payload that the browser animates, in a dozen bytes per train plus its id.
+
+    Positions and velocities are quantized to int16, codes are sent as the smallest integer types that hold them, and
+    each field is a base64 typed array. What the codes stand for, and how to scale the integers back, is in ``legend``,
+    which is sent once with the page rather than with every update. The next arrivals at each station, for the hover
+    text of ``station_trace``, are sent as route codes and seconds after the positions were reported. Vehicles of the
+    geographic layer, if there is one, go in ``geo``, with their longitude and latitude quantized around the
+    ``geographic_origin`` of the legend, and their route ids listed once per update.
+    """
+    trace: int
+    station_trace: int
+    legend: dict
+    position_scale: float
+    geographic_origin: ndarray
+
+    def __init__(self, marker_legend: dict, trace: int, station_trace: int):
+        self.trace = trace
+        self.station_trace = station_trace
+        # trains are always between two stations, so a scale that fits every station fits every train
+        extent = max(abs(coordinate) for coordinate in marker_legend['station_x'] + marker_legend['station_y'] + [1])
+        self.position_scale = iinfo(int16).max / extent
+        self.geographic_origin = asarray(marker_legend['geographic_origin'])
+        self.legend = dict(marker_legend, position_scale=self.position_scale, velocity_scale=VELOCITY_SCALE,
+                           station_trace=station_trace, no_arrival=NO_ARRIVAL,
+                           geographic_scale=iinfo(int16).max / GEOGRAPHIC_EXTENT)
+
+    def encode(self, trains: TrainMarkers) -> EncodedTrains:
+        payload = {'trace': self.trace,
+                   'ids': tuple(trains.ids.tolist()),
+                   'x': typed_array(_quantize(trains.x, self.position_scale), int16),
+                   'y': typed_array(_quantize(trains.y, self.position_scale), int16),
+                   'vx': typed_array(_quantize(trains.vx, VELOCITY_SCALE), int16),
+                   'vy': typed_array(_quantize(trains.vy, VELOCITY_SCALE), int16),
+                   'route': typed_array(trains.route_codes, uint8),
+                   'station': typed_array(trains.station_codes, uint16),
+                   'status': typed_array(trains.current_status, uint8),
+                   'target': typed_array(trains.target_station_codes, uint16),
+                   'arrival_route': typed_array(where(trains.arrival_route_codes >= 0, trains.arrival_route_codes,
+                                                      NO_ARRIVAL).ravel(), uint8),
+                   'arrival_in': typed_array(clip(trains.arrival_times - trains.timestamp, 0,
+                                                  MAX_ARRIVAL_SECONDS).ravel(), uint16)}
+        if trains.other_vehicles is not None:
+            payload['geo'] = self._encode_other_vehicles(trains.other_vehicles)
+        return EncodedTrains(MappingProxyType(payload), json.dumps(payload, separators=(',', ':'))[:-1],
+                             trains.timestamp)
+
+    def _encode_other_vehicles(self, vehicles: VehicleMarkers) -> dict:
+        scale = self.legend['geographic_scale']
+        return {'ids': tuple(vehicles.ids.tolist()),
+                'routes': tuple(vehicles.route_ids.tolist()),
+                'x': typed_array(_quantize(vehicles.longitude - self.geographic_origin[0], scale), int16),
+                'y': typed_array(_quantize(vehicles.latitude - self.geographic_origin[1], scale), int16),
+                'route': typed_array(vehicles.route_codes, uint16),
+                'mode': typed_array(vehicles.mode_codes, uint8)}